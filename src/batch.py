@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# batch.py
+
+"""Batch Execution File to Calculate Betweenness Centrality of Many Cities"""
+
+import argparse
+import matplotlib
+matplotlib.use("Agg")
+
+import betweenness_centrality.batch_runner as batch_runner
+import betweenness_centrality.pipeline as pipeline
+
+
+def main():
+    """
+    Main function to read a manifest of jobs and run them concurrently.
+    """
+
+    parser = argparse.ArgumentParser(description="Calculate betweenness centrality for a manifest of jobs.")
+    parser.add_argument("manifest", type=str, help="CSV or JSON file with the columns city, method, type and num_routes")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: number of cpu cores)")
+    parser.add_argument("--output-dir", type=str, default="../output", help="folder to write the results to")
+    parser.add_argument("--cache-dir", type=str, default="../cache",
+                        help="folder to store downloaded graphs and polygons in, 'none' disables the store")
+    parser.add_argument("--result-cache-mb", type=int, default=256,
+                        help="size limit of the result cache in <cache-dir>/results, 0 disables it")
+    parser.add_argument("--raster", type=str, default=pipeline.RASTER_PATH, help="path to the population raster")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    parser.add_argument("--contract", action="store_true",
+                        help="route on the contracted largest strongly connected component of every graph, "
+                             "jobs of the method networkx fail")
+    args = parser.parse_args()
+
+    jobs = batch_runner.read_manifest(args.manifest)
+    batch_runner.run_batch(jobs, args.workers, args.output_dir, None if args.cache_dir == "none" else args.cache_dir,
+                           args.raster, args.seed, contract=args.contract, result_cache_mb=args.result_cache_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# benchmark.py
+
+"""Benchmark Execution File to Measure the Pipeline Stages on Synthetic Data"""
+
+import argparse
+from datetime import datetime
+import matplotlib
+matplotlib.use("Agg")
+
+import betweenness_centrality.benchmark as benchmark
+
+
+def main():
+    """
+    Main function to run the benchmark suite without network access.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic graphs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=benchmark.SIZES, help="approximate numbers of edges")
+    parser.add_argument("--kinds", choices=list(benchmark.GRAPH_KINDS), nargs="+", default=list(benchmark.GRAPH_KINDS),
+                        help="kinds of synthetic graphs")
+    parser.add_argument("--routes", type=int, default=100, help="number of routes per graph")
+    parser.add_argument("--points", type=int, default=1000, help="number of sampled points per graph")
+    parser.add_argument("--exact-max-edges", type=int, default=2_000,
+                        help="largest graph with exact networkx centrality, larger graphs use sampled sources")
+    parser.add_argument("--queries", type=int, default=100,
+                        help="number of point-to-point queries routed with landmarks, Dijkstra routes the first 20")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, which makes timings faster")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON file to write (default: ../output/benchmarks/benchmark_<timestamp>.json)")
+    args = parser.parse_args()
+
+    output_path = args.output or f"../output/benchmarks/benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    benchmark.run_benchmarks(output_path, args.sizes, args.kinds, args.routes, args.points, args.exact_max_edges,
+                             args.seed, trace_memory=not args.no_memory, num_queries=args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# batch_runner.py
+
+"""Functions to run centrality analyses of many cities concurrently"""
+
+import os
+import csv
+import copy
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from betweenness_centrality import profiler
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.result_cache import ResultCache
+import betweenness_centrality.pipeline as pipeline
+
+METHODS = ["geographical", "geographicalPop", "networkx"]
+ROUTE_TYPES = pipeline.ROUTE_TYPES
+
+
+# Function to read a manifest of analysis jobs
+def read_manifest(filepath: str):
+    """
+    Reads jobs from a CSV file with the columns city, method, type and num_routes or from
+    a JSON file containing a list of objects with these keys
+    :param filepath: Path to the manifest
+    :return: List of jobs as dictionaries
+    """
+
+    if filepath.endswith(".json"):
+        with open(filepath) as file:
+            rows = json.load(file)
+    else:
+        with open(filepath, newline="") as file:
+            rows = list(csv.DictReader(file))
+
+    jobs = []
+    for row in rows:
+        job = {"city": str(row["city"]), "method": row["method"], "type": row["type"], "num_routes": int(row["num_routes"])}
+        assert job["method"] in METHODS, f"method must be in {METHODS}, got '{job['method']}'."
+        assert job["type"] in ROUTE_TYPES, f"type must be in {ROUTE_TYPES}, got '{job['type']}'."
+        jobs.append(job)
+
+    return jobs
+
+
+# Function to run all jobs of one city with a single loaded graph
+def run_city_jobs(city: str, jobs: list, options: dict):
+    """
+    Loads the graph of a city once and runs all of its jobs, failures are recorded per job
+    instead of being raised
+    :param city: Name of the city
+    :param jobs: List of jobs of the city (see read_manifest)
+    :param options: Dictionary of output_folder, cache_dir, result_cache_mb, raster_path, seed and contract
+    :return: List of job results with status, timings, output folder and error message
+    """
+
+    results = []
+    start = time.perf_counter()
+    load_run = profiler.start_run(city=city)
+    try:
+        store = GraphStore(options["cache_dir"]) if options.get("cache_dir") else None
+        result_cache_mb = options.get("result_cache_mb", 256)
+        result_cache = None
+        if options.get("cache_dir") and result_cache_mb > 0:
+            result_cache = ResultCache(os.path.join(options["cache_dir"], "results"), result_cache_mb * 2**20)
+        study_area = CityAnalyzer(city, store=store, contract=options.get("contract", False))
+    except Exception as e:
+        load_seconds = time.perf_counter() - start
+        for job in jobs:
+            results.append({**job, "status": "failed", "load_seconds": load_seconds, "seconds": 0.0,
+                            "output": None, "error": f"Loading the graph failed: {str(e)}"})
+        return results
+    load_seconds = time.perf_counter() - start
+
+    for job in jobs:
+        job_start = time.perf_counter()
+
+        # Every report contains the download and graph build stages of the shared graph
+        run = profiler.start_run(**job, load_seconds=load_seconds)
+        run.stages.update(copy.deepcopy(load_run.stages))
+        try:
+            centrality_gdf, header = pipeline.compute_centrality(study_area, job["method"], job["type"], job["num_routes"],
+                                                                 options.get("raster_path", pipeline.RASTER_PATH),
+                                                                 seed=options.get("seed"), result_cache=result_cache)
+            name = pipeline.get_output_name(city, job["method"], job["type"], job["num_routes"])
+            output = pipeline.write_outputs(centrality_gdf, header, options["output_folder"], name, show=False)
+            results.append({**job, "status": "done", "load_seconds": load_seconds,
+                            "seconds": time.perf_counter() - job_start, "output": output, "error": None})
+
+        except Exception as e:
+            traceback.print_exc()
+            results.append({**job, "status": "failed", "load_seconds": load_seconds,
+                            "seconds": time.perf_counter() - job_start, "output": None, "error": str(e)})
+
+    return results
+
+
+# Function to run a batch of jobs on a worker pool
+def run_batch(
+    jobs: list,
+    num_workers: int = None,
+    output_folder: str = "../output",
+    cache_dir: str = "../cache",
+    raster_path: str = pipeline.RASTER_PATH,
+    seed: int = None,
+    contract: bool = False,
+    result_cache_mb: int = 256
+):
+    """
+    Groups the jobs by city and runs every city on a process pool, so that each graph is
+    loaded once no matter how many jobs use it. A summary with status and timing of every
+    job is written to output_folder/batch_summary.json
+    :param jobs: List of jobs (see read_manifest)
+    :param num_workers: Number of processes (default: number of cpu cores)
+    :param output_folder: Folder containing the output folders of all jobs
+    :param cache_dir: Folder of the local graph store, None disables it
+    :param raster_path: Path to the population raster
+    :param seed: Seed for reproducible runs (optional)
+    :param contract: Route on the contracted graphs (default: False, see CityAnalyzer.contract_graph)
+    :param result_cache_mb: Size limit of the result cache in cache_dir/results in MiB, 0 disables it (default: 256)
+    :return: List of job results
+    """
+
+    print(f"Starting batch of {len(jobs)} jobs..")
+
+    options = {"output_folder": output_folder, "cache_dir": cache_dir, "raster_path": raster_path, "seed": seed,
+               "contract": contract, "result_cache_mb": result_cache_mb}
+    cities = {}
+    for job in jobs:
+        cities.setdefault(job["city"], []).append(job)
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(run_city_jobs, city, city_jobs, options): city for city, city_jobs in cities.items()}
+        for future in as_completed(futures):
+            try:
+                city_results = future.result()
+            except Exception as e:
+                # A crashed worker only fails the jobs of its city
+                city_results = [{**job, "status": "failed", "load_seconds": None, "seconds": None, "output": None,
+                                 "error": f"Worker failed: {str(e)}"} for job in cities[futures[future]]]
+            results.extend(city_results)
+            print(f"Loading.. done: {len(results)} from {len(jobs)} jobs. City '{futures[future]}' finished.")
+
+    summary = {"seconds": time.perf_counter() - start,
+               "done": sum(result["status"] == "done" for result in results),
+               "failed": sum(result["status"] == "failed" for result in results),
+               "jobs": results}
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, "batch_summary.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+
+    print(f"Done. {summary['done']} jobs finished, {summary['failed']} jobs failed.")
+
+    return results
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# benchmark.py
+
+"""Functions to benchmark the pipeline stages on synthetic data"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import osmnx as ox
+from betweenness_centrality import routing, synthetic
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.landmarks import LandmarkRouter
+from betweenness_centrality.raster_analyzer import RasterAnalyzer
+import betweenness_centrality.file_handler as file_handler
+
+GRAPH_KINDS = {"grid": synthetic.grid_graph, "random": synthetic.random_geometric_graph}
+SIZES = [1_000, 10_000, 100_000, 500_000]
+
+
+# Function to measure time and memory of one call
+def measure(func, *args, trace_memory: bool = True, **kwargs):
+    """
+    Calls a function and measures its wall time and the peak of memory allocated during
+    the call with tracemalloc, which includes numpy arrays but slows down Python code
+    :param func: Function to call
+    :param args: Positional arguments of the function
+    :param trace_memory: Measure the peak memory (default: True)
+    :param kwargs: Keyword arguments of the function
+    :return: Tuple of the result and a dictionary of 'seconds' and 'peak_bytes'
+    """
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak_bytes = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    return result, {"seconds": seconds, "peak_bytes": peak_bytes}
+
+
+# Function to measure the query throughput of Dijkstra and landmark routing
+def benchmark_queries(city_graph, num_queries: int = 100, num_dijkstra_queries: int = 20, seed: int = 0):
+    """
+    Routes random node pairs with ox.shortest_path and with the landmark router and measures
+    queries per second and settled nodes. Dijkstra is slow on large graphs, so it only routes
+    the first num_dijkstra_queries pairs, which are also compared with the routes of the router
+    :param city_graph: Graph network
+    :param num_queries: Number of node pairs routed with the landmark router (default: 100)
+    :param num_dijkstra_queries: Number of node pairs routed with Dijkstra (default: 20)
+    :param seed: Seed of the node pairs and the landmarks (default: 0)
+    :return: Dictionary of the measurements of preprocessing and both searches
+    """
+
+    rng = np.random.default_rng(seed)
+    router, build = measure(LandmarkRouter.from_graph, city_graph, "length", rng=seed, trace_memory=False)
+    positions = rng.integers(len(router.node_ids), size=(num_queries, 2))
+    positions = positions[positions[:, 0] != positions[:, 1]]
+    pairs = router.node_ids[positions].tolist()
+    num_dijkstra_queries = min(num_dijkstra_queries, len(pairs))
+
+    start = time.perf_counter()
+    dijkstra_routes = [ox.shortest_path(city_graph, origin, destination, weight="length")
+                       for origin, destination in pairs[:num_dijkstra_queries]]
+    dijkstra_seconds = time.perf_counter() - start
+    dijkstra_settled = [len(routing.multi_target_dijkstra(city_graph, origin, {destination}))
+                        for origin, destination in pairs[:num_dijkstra_queries]]
+
+    start = time.perf_counter()
+    searches = [router.search(source, target) for source, target in positions.tolist()]
+    alt_seconds = time.perf_counter() - start
+    alt_routes = [None if path is None else router.node_ids[path].tolist() for path, _ in searches]
+
+    return {"build_landmarks": {**build, "num_landmarks": len(router.landmarks)},
+            "dijkstra_queries": {"seconds": dijkstra_seconds, "queries": num_dijkstra_queries,
+                                 "queries_per_second": num_dijkstra_queries / dijkstra_seconds if dijkstra_seconds else None,
+                                 "mean_settled": float(np.mean(dijkstra_settled)) if dijkstra_settled else None},
+            "alt_queries": {"seconds": alt_seconds, "queries": len(searches),
+                            "queries_per_second": len(searches) / alt_seconds if alt_seconds else None,
+                            "mean_settled": float(np.mean([settled for _, settled in searches])) if searches else None,
+                            "same_routes": sum(a == b for a, b in zip(dijkstra_routes, alt_routes))}}
+
+
+# Function to benchmark all stages on one synthetic graph
+def benchmark_graph(
+    kind: str,
+    num_edges: int,
+    folder: str,
+    num_routes: int = 100,
+    num_points: int = 1000,
+    exact_max_edges: int = 2_000,
+    sample_sources: int = 32,
+    seed: int = 0,
+    trace_memory: bool = True,
+    num_queries: int = 100
+):
+    """
+    Builds a synthetic graph, polygon and population raster and measures every pipeline stage on it.
+    Exact networkx centrality is only run up to exact_max_edges, larger graphs use sampled sources
+    :param kind: Kind of the graph ('grid' or 'random')
+    :param num_edges: Approximate number of edges
+    :param folder: Folder for the raster and the written files
+    :param num_routes: Number of routes (default: 100)
+    :param num_points: Number of sampled points (default: 1000)
+    :param exact_max_edges: Largest graph with exact networkx centrality (default: 2000)
+    :param sample_sources: Number of sampled sources on larger graphs (default: 32)
+    :param seed: Seed of graph, raster, points and routes (default: 0)
+    :param trace_memory: Measure the peak memory of every stage (default: True)
+    :param num_queries: Number of point-to-point queries of the routing comparison (default: 100, see benchmark_queries)
+    :return: Dictionary of graph properties and the measurements of every stage
+    """
+
+    print(f"Starting benchmark of {kind} graph with {num_edges} edges..")
+
+    stages = {}
+    city_graph, stages["build_graph"] = measure(GRAPH_KINDS[kind], num_edges, seed=seed, trace_memory=trace_memory)
+    city_poly = synthetic.boundary_polygon(city_graph)
+    raster_path = synthetic.population_raster(os.path.join(folder, f"{kind}_{num_edges}.tif"), city_poly, seed=seed)
+    study_area = CityAnalyzer(f"{kind}_{num_edges}", city_graph=city_graph)
+
+    # Sampling, routing and aggregation
+    city_points, stages["get_points"] = measure(study_area.get_points, city_poly, num_points, rng=seed,
+                                                trace_memory=trace_memory)
+    city_routes, stages["get_routes"] = measure(study_area.get_routes, city_points, num_routes, rng=seed,
+                                                trace_memory=trace_memory)
+    centrality_gdf, stages["get_geocentrality"] = measure(study_area.get_geocentrality, city_routes,
+                                                          trace_memory=trace_memory)
+
+    # Networkx centrality, exact on small graphs only
+    k = None if city_graph.number_of_edges() <= exact_max_edges else sample_sources
+    _, stages["get_netcentrality"] = measure(study_area.get_netcentrality, "length", k=k, rng=seed,
+                                             backend="arrays", trace_memory=trace_memory)
+    stages["get_netcentrality"]["sample_sources"] = k
+
+    # Point-to-point queries with and without landmarks
+    stages.update(benchmark_queries(city_graph, num_queries, seed=seed))
+
+    # Population raster
+    raster = RasterAnalyzer(raster_path)
+    raster.open()
+    point_values, stages["get_point_values"] = measure(raster.get_point_values, city_points, trace_memory=trace_memory)
+    _, stages["get_weighted_points"] = measure(raster.get_weighted_points, point_values, num_points,
+                                               trace_memory=trace_memory)
+    raster.dataset.close()
+
+    # Writers
+    _, stages["gdf_to_gpkg"] = measure(file_handler.gdf_to_gpkg, centrality_gdf,
+                                       os.path.join(folder, f"{kind}_{num_edges}.gpkg"), trace_memory=trace_memory)
+    _, stages["plot_centrality"] = measure(file_handler.plot_centrality, centrality_gdf, kind,
+                                           os.path.join(folder, f"{kind}_{num_edges}.png"), show=False,
+                                           trace_memory=trace_memory)
+    _, stages["render_centrality"] = measure(file_handler.render_centrality, centrality_gdf, kind,
+                                             os.path.join(folder, f"{kind}_{num_edges}_render.png"),
+                                             trace_memory=trace_memory)
+
+    print(f"Done. Benchmark of {kind} graph with {num_edges} edges finished.")
+
+    return {"kind": kind, "target_edges": num_edges, "num_nodes": city_graph.number_of_nodes(),
+            "num_edges": city_graph.number_of_edges(), "num_routes": num_routes, "num_points": num_points,
+            "stages": stages}
+
+
+# Function to run the benchmark suite and store the results
+def run_benchmarks(
+    output_path: str,
+    sizes: list = SIZES,
+    kinds: list = list(GRAPH_KINDS),
+    num_routes: int = 100,
+    num_points: int = 1000,
+    exact_max_edges: int = 2_000,
+    seed: int = 0,
+    trace_memory: bool = True,
+    num_queries: int = 100
+):
+    """
+    Benchmarks every combination of graph kind and size and stores the results with the
+    environment as JSON, so that files of different runs can be compared to find regressions
+    :param output_path: Path of the JSON file
+    :param sizes: Approximate numbers of edges (default: 1k to 500k)
+    :param kinds: Kinds of graphs (default: 'grid' and 'random')
+    :param num_routes: Number of routes per graph (default: 100)
+    :param num_points: Number of sampled points per graph (default: 1000)
+    :param exact_max_edges: Largest graph with exact networkx centrality (default: 2000)
+    :param seed: Seed of all synthetic data (default: 0)
+    :param trace_memory: Measure the peak memory of every stage (default: True)
+    :param num_queries: Number of point-to-point queries per graph (default: 100)
+    :return: Dictionary of the stored results
+    """
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for kind in kinds:
+            for num_edges in sizes:
+                results.append(benchmark_graph(kind, num_edges, folder, num_routes, num_points, exact_max_edges,
+                                               seed=seed, trace_memory=trace_memory, num_queries=num_queries))
+
+    report = {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+              "cpu_count": os.cpu_count(), "seed": seed, "trace_memory": trace_memory, "results": results}
+
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(f"Done. Benchmark results stored in '{output_path}'.")
+
+    return report
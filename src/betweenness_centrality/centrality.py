@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# centrality.py
+
+"""Functions for edge betweenness centrality estimation"""
+
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import networkx as nx
+from networkx.algorithms.centrality.betweenness import _single_source_dijkstra_path_basic
+from betweenness_centrality import graph_arrays
+from betweenness_centrality.graph_arrays import GraphArrays
+
+
+# Function to map node pairs onto the graph edges sharing their betweenness
+def edge_pair_positions(graph: nx.MultiDiGraph, weight: str = "length"):
+    """
+    Maps every connected node pair to the positions of its cheapest parallel edges in
+    graph.edges(keys=True), networkx shares the betweenness of a node pair equally among them
+    :param graph: Graph network
+    :param weight: Edge attribute used as weight
+    :return: Dictionary of (u, v) tuples to lists of edge positions
+    """
+
+    positions = {}
+    weights = {}
+    for position, (u, v, key, edge_weight) in enumerate(graph.edges(keys=True, data=weight, default=1)):
+        if (u, v) not in positions or edge_weight < weights[(u, v)]:
+            positions[(u, v)] = [position]
+            weights[(u, v)] = edge_weight
+        elif edge_weight == weights[(u, v)]:
+            positions[(u, v)].append(position)
+
+    return positions
+
+
+# Function to compute the dependencies of all edges on one source node
+def source_dependencies(graph: nx.MultiDiGraph, source, pair_positions: dict, weight: str = "length"):
+    """
+    Runs one Brandes step: a Dijkstra search from the source followed by the accumulation
+    of the pair dependencies of every edge on the source
+    :param graph: Graph network
+    :param source: Node id of the source
+    :param pair_positions: Mapping of node pairs to edge positions (see edge_pair_positions)
+    :param weight: Edge attribute used as weight
+    :return: Array with the dependency of every edge in graph.edges(keys=True) order
+    """
+
+    dependencies = np.zeros(graph.number_of_edges())
+    stack, predecessors, sigma, _ = _single_source_dijkstra_path_basic(graph, source, weight)
+
+    delta = dict.fromkeys(stack, 0.0)
+    while stack:
+        w = stack.pop()
+        coeff = (1 + delta[w]) / sigma[w]
+        for v in predecessors[w]:
+            c = sigma[v] * coeff
+            positions = pair_positions[(v, w)]
+            dependencies[positions] += c / len(positions)
+            delta[v] += c
+
+    return dependencies
+
+
+class ArrayBrandes:
+    """Brandes edge betweenness on CSR arrays"""
+
+    def __init__(self, arrays: GraphArrays, weight: str = "length"):
+        """
+        Prepares the arrays of a graph for Brandes steps, the weights of the arrays should be
+        float64 to reproduce the ties of networkx
+        :param arrays: GraphArrays of the graph
+        :param weight: Edge attribute used as weight
+        """
+
+        self.num_nodes = arrays.num_nodes
+        self.num_edges = arrays.num_edges
+        routing_arrays = arrays.routing_arrays(weight)
+
+        # Python lists are faster to index element by element than numpy arrays
+        self._indptr = routing_arrays["indptr"].tolist()
+        self._indices = routing_arrays["indices"].tolist()
+        self._weights = routing_arrays["weights"].astype(np.float64).tolist()
+        self._slot_sources = np.repeat(np.arange(arrays.num_nodes), np.diff(routing_arrays["indptr"])).tolist()
+
+        # Share the betweenness of a node pair equally among its cheapest parallel edges like networkx
+        sources = np.repeat(np.arange(arrays.num_nodes, dtype=np.int64), np.diff(arrays.indptr))
+        pair_keys = sources * arrays.num_nodes + arrays.indices
+        pair_slots = np.searchsorted(routing_arrays["pair_keys"], pair_keys)
+        cheapest = arrays.weights[weight] == routing_arrays["weights"][pair_slots]
+        num_cheapest = np.bincount(pair_slots[cheapest], minlength=len(self._indices))
+
+        self.edge_pair_slots = np.zeros(arrays.num_edges, dtype=np.int64)
+        self.edge_shares = np.zeros(arrays.num_edges)
+        self.edge_pair_slots[arrays.edge_ids] = pair_slots
+        self.edge_shares[arrays.edge_ids] = np.where(cheapest, 1 / np.maximum(num_cheapest[pair_slots], 1), 0)
+        self.route_edge_positions = routing_arrays["edge_positions"]
+
+
+    # Write method to accumulate the dependencies of several sources
+    def pair_dependencies(self, sources: list):
+        """
+        Runs one Brandes step per source with a binary heap over node positions and sums the
+        dependencies of every node pair
+        :param sources: Node positions of the sources
+        :return: Array of dependencies per slot of the routing arrays
+        """
+        return self.routed_pair_dependencies(sources, [])[0]
+
+
+    # Write method to accumulate dependencies and count routes on the same shortest path trees
+    def routed_pair_dependencies(self, sources: list, route_targets: list):
+        """
+        Runs one Brandes step per source like pair_dependencies and additionally follows one
+        shortest path from the source to every route target of the source through the same
+        search, so routes cost no extra Dijkstra
+        :param sources: Node positions of the sources
+        :param route_targets: List of route sets, each a dictionary of source positions to lists
+            of target positions (targets may repeat)
+        :return: Tuple of the dependencies per slot of the routing arrays, the route traversals
+            per set and slot of the routing arrays and the number of unreachable targets per set
+        """
+
+        indptr, indices, weights, slot_sources = self._indptr, self._indices, self._weights, self._slot_sources
+        dependencies = [0.0] * len(indices)
+        route_counts = np.zeros((len(route_targets), len(indices)), dtype=np.int64)
+        unrouted = np.zeros(len(route_targets), dtype=np.int64)
+
+        # The search state is allocated once and only the settled nodes are reset after every source,
+        # it is kept in lists like the graph arrays because the heap loop reads single elements.
+        # Predecessors are lists of slots linked through next_slots, the first slot set the distance
+        inf = float("inf")
+        distances = [inf] * self.num_nodes
+        settled = [False] * self.num_nodes
+        sigma = [0.0] * self.num_nodes
+        delta = [0.0] * self.num_nodes
+        first_slots = [-1] * self.num_nodes
+        last_slots = [-1] * self.num_nodes
+        next_slots = [-1] * len(indices)
+
+        for source in sources:
+            distances[source] = 0.0
+            sigma[source] = 1.0
+            stack = []
+            heap = [(0.0, source)]
+
+            while heap:
+                distance, v = heapq.heappop(heap)
+                if settled[v]:
+                    continue
+                settled[v] = True
+                stack.append(v)
+                sigma_v = sigma[v]
+
+                for slot in range(indptr[v], indptr[v + 1]):
+                    w = indices[slot]
+                    if settled[w]:
+                        continue
+                    vw_distance = distance + weights[slot]
+                    w_distance = distances[w]
+                    if vw_distance < w_distance:
+                        distances[w] = vw_distance
+                        sigma[w] = sigma_v
+                        first_slots[w] = last_slots[w] = slot
+                        next_slots[slot] = -1
+                        heapq.heappush(heap, (vw_distance, w))
+                    elif vw_distance == w_distance:
+                        sigma[w] += sigma_v
+                        next_slots[last_slots[w]] = slot
+                        last_slots[w] = slot
+                        next_slots[slot] = -1
+
+            # Follow the first predecessor back from every route target
+            for route_set, targets in enumerate(route_targets):
+                for node in targets.get(source, []):
+                    if not settled[node]:
+                        unrouted[route_set] += 1
+                        continue
+                    while node != source:
+                        slot = first_slots[node]
+                        route_counts[route_set, slot] += 1
+                        node = slot_sources[slot]
+
+            # Predecessors are settled before their successors, so every node is reset once it is accumulated
+            while stack:
+                w = stack.pop()
+                coeff = (1 + delta[w]) / sigma[w]
+                slot = first_slots[w]
+                while slot >= 0:
+                    v = slot_sources[slot]
+                    c = sigma[v] * coeff
+                    dependencies[slot] += c
+                    delta[v] += c
+                    slot = next_slots[slot]
+
+                distances[w], settled[w], sigma[w], delta[w], first_slots[w] = inf, False, 0.0, 0.0, -1
+
+        return np.array(dependencies), route_counts, unrouted
+
+
+    # Write method to map route traversals onto the graph edges
+    def routes_to_edges(self, route_counts: np.ndarray):
+        """
+        Assigns the route traversals of node pairs to the cheapest parallel edge, like routes
+        converted with osmnx
+        :param route_counts: Array of traversals per slot of the routing arrays
+        :return: Array of traversals in graph.edges(keys=True) order
+        """
+
+        edge_counts = np.zeros(self.num_edges, dtype=route_counts.dtype)
+        edge_counts[self.route_edge_positions] = route_counts
+
+        return edge_counts
+
+
+    # Write method to map node pair values onto the graph edges
+    def to_edges(self, pair_values: np.ndarray):
+        """
+        Shares the values of node pairs among their cheapest parallel edges
+        :param pair_values: Array of values per slot of the routing arrays
+        :return: Array of values in graph.edges(keys=True) order
+        """
+        return pair_values[self.edge_pair_slots] * self.edge_shares
+
+
+    # Write method to compute the dependencies of all edges on one source node
+    def source_dependencies(self, source: int):
+        """
+        Runs one Brandes step from the source
+        :param source: Node position of the source
+        :return: Array with the dependency of every edge in graph.edges(keys=True) order
+        """
+        return self.to_edges(self.pair_dependencies([source]))
+
+
+_worker_blocks = []
+_worker_engine = None
+
+
+def _init_worker(spec: dict, weight: str):
+    """
+    Attaches a worker process to shared graph arrays and prepares the Brandes engine
+    :param spec: Description of the shared arrays (see graph_arrays.share_arrays)
+    :param weight: Edge attribute used as weight
+    """
+
+    global _worker_blocks, _worker_engine
+    _worker_blocks, arrays = graph_arrays.attach_arrays(spec)
+    _worker_engine = ArrayBrandes(GraphArrays.from_dict(arrays), weight)
+
+
+def _routed_pair_dependencies(task: tuple):
+    """
+    Accumulates the dependencies and routes of a chunk of sources inside a worker process
+    :param task: Tuple of node positions of the sources and route targets (see ArrayBrandes.routed_pair_dependencies)
+    :return: Tuple of dependencies, route traversals and unreachable targets
+    """
+    return _worker_engine.routed_pair_dependencies(*task)
+
+
+# Function to compute exact edge betweenness centrality on graph arrays
+def array_edge_betweenness(
+    graph: nx.MultiDiGraph, 
+    weight: str = "length", 
+    num_workers: int = 1, 
+    chunks_per_worker: int = 8
+):
+    """
+    Computes the normalized edge betweenness centrality of networkx with Brandes steps on
+    float64 CSR arrays, the sources are split into chunks that are run on a process pool
+    reading the arrays from shared memory and the partial sums are added in chunk order
+    :param graph: Graph network
+    :param weight: Edge attribute used as weight
+    :param num_workers: Number of processes (default: 1)
+    :param chunks_per_worker: Number of source chunks per worker for load balancing (default: 8)
+    :return: Array of centrality values in graph.edges(keys=True) order
+    """
+    return routed_edge_betweenness(graph, [], weight, num_workers, chunks_per_worker)[0]
+
+
+# Function to compute exact edge betweenness centrality and route counts in one pass
+def routed_edge_betweenness(
+    graph: nx.MultiDiGraph, 
+    route_targets: list, 
+    weight: str = "length", 
+    num_workers: int = 1, 
+    chunks_per_worker: int = 8
+):
+    """
+    Computes the exact edge betweenness centrality like array_edge_betweenness and counts the
+    edge traversals of given routes on the shortest path trees of the same pass
+    :param graph: Graph network
+    :param route_targets: List of route sets, each a dictionary of origin node positions to lists
+        of destination node positions, positions follow the order of graph.nodes
+    :param weight: Edge attribute used as weight
+    :param num_workers: Number of processes (default: 1)
+    :param chunks_per_worker: Number of source chunks per worker for load balancing (default: 8)
+    :return: Tuple of centrality values and route traversals per set, both in graph.edges(keys=True)
+        order, and the number of unreachable destinations per set
+    """
+
+    arrays = GraphArrays.from_graph(graph, weights=(weight,), weight_dtype=np.float64)
+    engine = ArrayBrandes(arrays, weight)
+    num_nodes = arrays.num_nodes
+
+    if num_workers > 1:
+        chunks = [chunk.tolist() for chunk in np.array_split(np.arange(num_nodes), num_workers * chunks_per_worker) if len(chunk)]
+        tasks = [(chunk, [{source: targets[source] for source in chunk if source in targets} for targets in route_targets])
+                 for chunk in chunks]
+        blocks, spec = graph_arrays.share_arrays(arrays.to_dict())
+        try:
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(spec, weight)) as executor:
+                results = list(executor.map(_routed_pair_dependencies, tasks))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        pair_values = sum(result[0] for result in results)
+        route_counts = sum(result[1] for result in results)
+        unrouted = sum(result[2] for result in results)
+    else:
+        pair_values, route_counts, unrouted = engine.routed_pair_dependencies(range(num_nodes), route_targets)
+
+    scale = 1 / (num_nodes * (num_nodes - 1)) if num_nodes > 1 else 1
+    edge_route_counts = [engine.routes_to_edges(counts) for counts in route_counts]
+
+    return engine.to_edges(pair_values) * scale, edge_route_counts, unrouted
+
+
+# Function to estimate edge betweenness centrality from a sample of source nodes
+def sampled_edge_betweenness(
+    graph: nx.MultiDiGraph,
+    weight: str = "length",
+    k: int = None,
+    rel_error: float = None,
+    source_weights: np.ndarray = None,
+    rng: np.random.Generator = None,
+    batch_size: int = 32,
+    uniform_share: float = 0.1,
+    backend: str = "networkx"
+):
+    """
+    Estimates the normalized edge betweenness centrality of networkx by running Brandes steps
+    from randomly drawn sources. Sources are drawn with replacement, either uniformly or
+    proportional to source_weights mixed with a uniform share so that every node can be drawn,
+    and every dependency is divided by the probability of its source, which keeps the estimate
+    unbiased. Sources are drawn in batches until k sources were used or the relative standard
+    error of the estimate (norm of the per edge standard errors divided by the norm of the
+    estimate) falls below rel_error
+    :param graph: Graph network
+    :param weight: Edge attribute used as weight
+    :param k: Number of sources, upper limit if rel_error is given (default: number of nodes)
+    :param rel_error: Target relative standard error for adaptive stopping (optional)
+    :param source_weights: Weights of the nodes in graph order with a positive sum, e.g. population (optional)
+    :param rng: Seed or numpy random generator for reproducible runs (optional)
+    :param batch_size: Number of sources drawn between two error checks (default: 32)
+    :param uniform_share: Share of the uniform distribution in weighted sampling (default: 0.1)
+    :param backend: Brandes implementation, 'networkx' or 'arrays' (default: 'networkx')
+    :return: Tuple of centrality estimates and standard errors, both in graph.edges(keys=True)
+        order, and the number of sources used
+    """
+
+    assert k is not None or rel_error is not None, "k or rel_error must be given."
+
+    rng = np.random.default_rng(rng)
+    nodes = list(graph.nodes)
+    num_nodes = len(nodes)
+    max_sources = k if k is not None else num_nodes
+
+    # Probability of every node to be drawn as source
+    probabilities = np.full(num_nodes, 1 / num_nodes)
+    if source_weights is not None:
+        source_weights = np.maximum(np.asarray(source_weights, dtype=float), 0)
+        if not source_weights.sum() > 0:
+            raise ValueError("The source weights must have a positive finite sum, e.g. population within the city.")
+        probabilities = (1 - uniform_share) * source_weights / source_weights.sum() + uniform_share * probabilities
+
+    if backend == "arrays":
+        engine = ArrayBrandes(GraphArrays.from_graph(graph, weights=(weight,), weight_dtype=np.float64), weight)
+        dependencies = engine.source_dependencies
+    else:
+        pair_positions = edge_pair_positions(graph, weight)
+        dependencies = lambda source: source_dependencies(graph, nodes[source], pair_positions, weight)
+
+    value_sum = np.zeros(graph.number_of_edges())
+    square_sum = np.zeros(graph.number_of_edges())
+    scale = 1 / (num_nodes * (num_nodes - 1))
+
+    num_sources = 0
+    while num_sources < max_sources:
+        for source in rng.choice(num_nodes, size=min(batch_size, max_sources - num_sources), p=probabilities):
+            values = dependencies(source) / probabilities[source]
+            value_sum += values
+            square_sum += values ** 2
+            num_sources += 1
+
+        centrality, error = _estimate(value_sum, square_sum, num_sources, scale)
+        if rel_error is not None and num_sources >= 2 * batch_size:
+            if np.linalg.norm(error) <= rel_error * np.linalg.norm(centrality):
+                break
+
+    return centrality, error, num_sources
+
+
+def _estimate(value_sum: np.ndarray, square_sum: np.ndarray, num_samples: int, scale: float):
+    """
+    Computes the mean and its standard error from running sums
+    :param value_sum: Sum of the samples
+    :param square_sum: Sum of the squared samples
+    :param num_samples: Number of samples
+    :param scale: Factor applied to mean and standard error
+    :return: Tuple of mean and standard error
+    """
+
+    mean = value_sum / num_samples
+    if num_samples < 2:
+        return mean * scale, np.full_like(mean, np.inf)
+
+    variance = np.maximum(square_sum - num_samples * mean ** 2, 0) / (num_samples - 1)
+
+    return mean * scale, np.sqrt(variance / num_samples) * scale
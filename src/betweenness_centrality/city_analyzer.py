@@ -6,16 +6,42 @@
 
 import os
 import argparse
+import threading
 import osmnx as ox
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
 import warnings
-from shapely.geometry import Point
+import shapely
+from scipy.spatial import cKDTree
 import matplotlib.pyplot as plt
+from betweenness_centrality import centrality, graph_store, profiler, routing
+from betweenness_centrality.contraction import ContractedGraph
+from betweenness_centrality.graph_arrays import GraphArrays
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.landmarks import LandmarkRouter
 ox.config(use_cache=True, log_console=True)
 
+# Define travel speeds
+HWY_SPEEDS = {"motorway": 100,
+              "motorway_link": 60,
+              "motorroad": 90,
+              "trunk": 85,
+              "trunk_link": 60,
+              "primary": 65,
+              "primary_link": 50,
+              "secondary": 60,
+              "secondary_link": 50,
+              "tertiary": 50,
+              "tertiary_link": 40,
+              "unclassified": 30,
+              "residential": 30,
+              "living_street": 10,
+              "service": 20,
+              "road": 20,
+              "track": 15}
+
 
 class CityAnalyzer:
     '''User defined City Class'''
@@ -23,22 +49,126 @@ class CityAnalyzer:
     def __init__(
         self, 
         city_name: str ='Heidelberg, Germany', 
-        city_graph: nx.MultiDiGraph = None
+        city_graph: nx.MultiDiGraph = None,
+        store: GraphStore = None,
+        osm_file: str = None,
+        contract: bool = False,
+        routing_engine: str = 'dijkstra'
     ):
         '''
         Defines a city based on user input
         :param city_name: Name of the city
         :param city_graph: Graph network of the city (optional)
+        :param store: Local store to load graph and polygon from and save them to (optional)
+        :param osm_file: Local .osm or .pbf extract to build the graph from instead of downloading it (optional)
+        :param contract: Route on the contracted largest strongly connected component (default: False, see contract_graph)
+        :param routing_engine: Search of pairwise routes, 'dijkstra' (ox.shortest_path) or 'alt' (A* with
+            landmark lower bounds, see get_router) (default: 'dijkstra')
         '''
         assert isinstance(city_name, str), 'number_steps must be of type str.'
+        assert routing_engine in ['dijkstra', 'alt'], "routing_engine must be 'dijkstra' or 'alt'."
 
         self.city_name = city_name
+        self.store = store
+        self.osm_file = osm_file
+        self.routing_engine = routing_engine
+
+        # Held while indexes are built or the graph is changed, so that threads can share the analyzer
+        self._lock = threading.RLock()
+        self.poly_key, self.store_key = None, None
+        if store is not None:
+            # Graphs of an extract are keyed by the extract and whether a stored polygon clips them
+            self.poly_key = store.get_key(city_name, 'drive', HWY_SPEEDS)
+            self.store_key = self.poly_key
+            if osm_file is not None:
+                clipped = store.load_poly(self.poly_key) is not None
+                self.store_key = store.get_key(city_name, 'drive', HWY_SPEEDS, osm_file, clipped)
         self.city_graph = city_graph
 
         # If a graph is not provided, retrieve it using osmnx
         if self.city_graph is None:
             self.city_graph = self.get_graph()
 
+        if contract:
+            self.contract_graph()
+
+
+    @property
+    def city_graph(self):
+        '''
+        Graph network of the city
+        :return: Graph network of the city
+        '''
+        return self._city_graph
+
+
+    @city_graph.setter
+    def city_graph(self, city_graph: nx.MultiDiGraph):
+        '''
+        Sets the graph network of the city and resets all indexes derived from it
+        :param city_graph: Graph network of the city
+        '''
+        self._city_graph = city_graph
+        self._reset_indexes()
+        self.contraction = None
+
+
+    def _reset_indexes(self):
+        '''
+        Resets all indexes derived from the graph network, they are built again when they are used
+        '''
+        self._node_index = None
+        self._edge_index = None
+        self._edges_gdf = None
+        self._edge_lookup = {}
+        self._graph_arrays = None
+        self._routers = {}
+
+
+    # Write method to announce changes of the graph made in place
+    def refresh_graph(self):
+        '''
+        Raises the version of the graph network and resets all indexes derived from it, must be
+        called after edges or weights of the graph were changed in place (see set_edge_weights)
+        '''
+        with self._lock:
+            self.city_graph.graph['version'] = self.city_graph.graph.get('version', 0) + 1
+            self._reset_indexes()
+
+
+    # Write method to change edge weights
+    def set_edge_weights(self, weights: dict, method: str = 'travel_time'):
+        '''
+        Changes weights of edges in place, e.g. slower travel times, and resets all indexes
+        derived from the graph so that routes and cached results use the new weights
+        :param weights: Dictionary of (u, v, key) tuples to their new weight
+        :param method: Edge attribute to change ('length' or 'travel_time')
+        '''
+
+        with self._lock:
+            for (u, v, key), weight in weights.items():
+                self.city_graph.edges[u, v, key][method] = weight
+
+            self.refresh_graph()
+
+
+    # Write method to build all indexes at once
+    def build_indexes(self, methods: tuple = ('length', 'travel_time')):
+        '''
+        Builds the indexes that are otherwise built on first use, e.g. before the analyzer is
+        shared by several threads, so that later jobs only read them
+        :param methods: Route types whose routing arrays and edge lookups are built (default: both)
+        '''
+
+        with self._lock:
+            arrays = self.graph_arrays
+            for method in methods:
+                arrays.routing_arrays(method)
+                self._get_edge_lookup(method)
+            self.get_node_index()
+            self.get_edge_index()
+            self.get_edges_gdf()
+
 
     # Write method to get information about the city
     def get_name(self):
@@ -51,16 +181,24 @@ class CityAnalyzer:
     # Write method to download city polygon from OSM
     def get_poly(self):
         '''
-        Retrieves the administrative city boundaries from OSM using osmnx package,
-        returns meaningfull error massages if an error occures
+        Retrieves the administrative city boundaries from OSM using osmnx package or the
+        local store if given, returns meaningfull error massages if an error occures
         :return: Polygon of the city as geodataframe
         '''
 
+        # Load polygon from the local store if available
+        if self.store is not None:
+            poly = self.store.load_poly(self.poly_key)
+            if poly is not None:
+                print("Done. City polygon loaded from local store.")
+                return poly
+
         print("Starting download request of city polygon..")
 
         try:
             # Get polygon of the city using OSMnx
-            poly = ox.geocode_to_gdf(self.city_name)
+            with profiler.stage('download'):
+                poly = ox.geocode_to_gdf(self.city_name)
 
             # Shorten column names to less than 10 characters
             poly.columns = poly.columns.map(lambda x: x[:10])
@@ -71,6 +209,9 @@ class CityAnalyzer:
         except Exception as e:
             print(f"Error retrieving city boundaries for '{self.city_name}': {str(e)}.")
         
+        if self.store is not None:
+            self.store.save_poly(self.poly_key, poly)
+
         print("Done. City polygon successfully downloaded.")
         return poly
 
@@ -79,32 +220,61 @@ class CityAnalyzer:
     def get_points(
         self, 
         city_poly: gpd.GeoDataFrame, 
-        num_points: int = 1000
+        num_points: int = 1000,
+        rng: np.random.Generator = None,
+        max_batch_size: int = 1_000_000
     ):
         '''
         Generates a certain amount of random points within the city boundaries,
-        default value is 1000
+        default value is 1000. Candidates are drawn in batches from the bounding box
+        and tested with a vectorized point in polygon predicate, the size of each
+        batch is derived from the acceptance rate observed so far
         :param city_poly: Polygon of the city as geodataframe
-        :param num_points: Number of points to sample within the boundaries (default=10000)
+        :param num_points: Number of points to sample within the boundaries (default=1000)
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :param max_batch_size: Upper limit of candidates drawn per batch (default=1000000)
         :return: Geodataframe containing the sampled points
         '''
         
         print("Start sampling random points within the city boundaries..")
 
-        # Create a Shapely geometry object for the city boundaries
-        city_geom = city_poly['geometry'].iloc[0]
+        with profiler.stage('sampling', items=num_points):
+            rng = np.random.default_rng(rng)
+            num_points = int(num_points)
+
+            # Create a prepared Shapely geometry object for the city boundaries
+            city_geom = city_poly['geometry'].iloc[0]
+            shapely.prepare(city_geom)
+            minx, miny, maxx, maxy = city_geom.bounds
+
+            # Use the area ratio of polygon and bounding box as first guess of the acceptance rate
+            bbox_area = (maxx - minx) * (maxy - miny)
+            acceptance_rate = city_geom.area / bbox_area if bbox_area > 0 else 1.0
 
-        # Generate random points within the non-rectangular bounds of the city
-        points_within_city = []
-        while len(points_within_city) < int(num_points):
-            lon = np.random.uniform(city_poly.bounds.minx.values[0], city_poly.bounds.maxx.values[0])
-            lat = np.random.uniform(city_poly.bounds.miny.values[0], city_poly.bounds.maxy.values[0])
-            point = Point(lon, lat)
-            if point.within(city_geom):
-                points_within_city.append(point)
+            # Generate random points within the non-rectangular bounds of the city
+            lons, lats = [], []
+            num_drawn = 0
+            num_accepted = 0
+            while num_accepted < num_points:
+                if num_accepted > 0:
+                    acceptance_rate = num_accepted / num_drawn
+                batch_size = int((num_points - num_accepted) / max(acceptance_rate, 1e-6) * 1.1) + 64
+                batch_size = min(batch_size, max_batch_size)
 
-        # Create a GeoDataFrame with random points
-        gdf = gpd.GeoDataFrame(geometry=points_within_city)
+                lon = rng.uniform(minx, maxx, batch_size)
+                lat = rng.uniform(miny, maxy, batch_size)
+                inside = shapely.contains_xy(city_geom, lon, lat)
+
+                lons.append(lon[inside])
+                lats.append(lat[inside])
+                num_drawn += batch_size
+                num_accepted += int(inside.sum())
+
+            lon = np.concatenate(lons)[:num_points]
+            lat = np.concatenate(lats)[:num_points]
+
+            # Create a GeoDataFrame with random points
+            gdf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs=city_poly.crs)
 
         print("Done. Sampled random points within the city boundaries.")
         return gdf
@@ -113,39 +283,163 @@ class CityAnalyzer:
     # Write method to get graph network of the city
     def get_graph(self):
         '''
-        Retrieves OSM graph network for the city using osmnx package
+        Retrieves OSM graph network for the city using osmnx package, from the local store
+        or a local OSM extract if they were given
         :return: Graph network of the city containing travel times
         '''
 
-        # Get graph from place using osmnx
-        city_graph = ox.graph_from_place(self.city_name, network_type='drive')
+        # Load graph from the local store if available
+        if self.store is not None:
+            with profiler.stage('graph_build'):
+                city_graph = self.store.load_graph(self.store_key)
+            if city_graph is not None:
+                print("Done. Graph loaded from local store.")
+                return city_graph
+
+        if self.osm_file is not None:
+            # Build graph from the local extract, truncated to a stored polygon if there is one
+            poly = self.store.load_poly(self.poly_key) if self.store is not None else None
+            with profiler.stage('graph_build'):
+                city_graph = graph_store.graph_from_osm_file(self.osm_file, poly, network_type='drive')
+        else:
+            # Get graph from place using osmnx
+            with profiler.stage('download'):
+                city_graph = ox.graph_from_place(self.city_name, network_type='drive')
+
+        with profiler.stage('graph_build', items=city_graph.number_of_edges()):
+            # Create graph with speeds
+            graph_with_speeds = ox.add_edge_speeds(city_graph, HWY_SPEEDS)
+
+            # Create graph with travel times
+            graph_with_travel_times = ox.add_edge_travel_times(graph_with_speeds)
+
+        if self.store is not None:
+            self.store.save_graph(self.store_key, graph_with_travel_times)
 
-        # Define travel speeds
-        hwy_speeds = {"motorway": 100,
-              "motorway_link": 60,
-              "motorroad": 90,
-              "trunk": 85,
-              "trunk_link": 60,
-              "primary": 65,
-              "primary_link": 50,
-              "secondary": 60,
-              "secondary_link": 50,
-              "tertiary": 50,
-              "tertiary_link": 40,
-              "unclassified": 30,
-              "residential": 30,
-              "living_street": 10,
-              "service": 20,
-              "road": 20,
-              "track": 15}
-        
-        # Create graph with speeds
-        graph_with_speeds = ox.add_edge_speeds(city_graph, hwy_speeds)
+        return graph_with_travel_times
 
-        # Create graph with travel times
-        graph_with_travel_times = ox.add_edge_travel_times(graph_with_speeds)
 
-        return graph_with_travel_times
+    # Write method to contract the graph network before routing
+    def contract_graph(self):
+        '''
+        Replaces the graph by its largest strongly connected component with chains of degree-2
+        nodes contracted into super-edges (see contraction.ContractedGraph), so that every pair of
+        points has a route and searches visit fewer nodes. Centrality results of routes are projected
+        back onto the original edges and geometries, networkx centrality is not supported afterwards
+        :return: ContractedGraph with the mapping to the original edges
+        '''
+
+        print("Starting to contract the graph network..")
+
+        with profiler.stage('graph_build', items=self.city_graph.number_of_edges()):
+            contraction = ContractedGraph.from_graph(self.city_graph)
+        self.city_graph = contraction.graph
+        self.contraction = contraction
+
+        print(f"Done. Graph contracted from {contraction.original_graph.number_of_edges()} "
+              f"to {contraction.graph.number_of_edges()} edges.")
+
+        return contraction
+
+
+    # Write method to get the graph the results are stored on
+    def get_output_graph(self):
+        '''
+        Returns the graph whose edges and geometries are stored in the results, the original
+        graph if the graph was contracted
+        :return: Graph network
+        '''
+        return self.contraction.original_graph if self.contraction is not None else self.city_graph
+
+
+    # Write method to get the edges the results are joined with
+    def get_edges_gdf(self):
+        '''
+        Converts the edges of the output graph into a geodataframe once and reuses it for all
+        later results
+        :return: Geodataframe of the edges indexed by u, v and key (see ox.graph_to_gdfs)
+        '''
+
+        with self._lock:
+            if self._edges_gdf is None:
+                self._edges_gdf = ox.graph_to_gdfs(self.get_output_graph(), nodes=False)
+
+        return self._edges_gdf
+
+
+    # Write method to estimate the memory used by the graph and its indexes
+    def get_footprint(self, node_bytes: int = 512, edge_bytes: int = 2048):
+        '''
+        Estimates the memory held by the graph networks and all indexes derived from them, the
+        networkx graphs are estimated from their size, the arrays are counted exactly
+        :param node_bytes: Estimated bytes per graph node with its attributes (default: 512)
+        :param edge_bytes: Estimated bytes per graph edge with its attributes and geometry (default: 2048)
+        :return: Estimated number of bytes
+        '''
+
+        graphs = [self.city_graph] + ([self.contraction.original_graph] if self.contraction is not None else [])
+        footprint = sum(graph.number_of_nodes() * node_bytes + graph.number_of_edges() * edge_bytes for graph in graphs)
+
+        if self._graph_arrays is not None:
+            footprint += self._graph_arrays.nbytes
+        for router in self._routers.values():
+            footprint += router.forward.nbytes + router.backward.nbytes + sum(array.nbytes for array in router.arrays.values())
+        if self._node_index is not None:
+            footprint += self._node_index[0].data.nbytes * 2 + self._node_index[1].nbytes
+        if self._edges_gdf is not None:
+            footprint += int(self._edges_gdf.memory_usage(index=True).sum())
+
+        return footprint
+
+
+    # Write method to build a spatial index over the graph nodes
+    def get_node_index(self):
+        '''
+        Builds a KD-tree over the graph nodes once and reuses it for all later queries,
+        unprojected coordinates are mapped onto the unit sphere so that the euclidean
+        nearest neighbour equals the great circle nearest neighbour
+        :return: Tuple of KD-tree and array of node ids in tree order
+        '''
+
+        with self._lock:
+            if self._node_index is None:
+                node_ids = np.array(list(self.city_graph.nodes))
+                x = np.array([data['x'] for _, data in self.city_graph.nodes(data=True)], dtype=float)
+                y = np.array([data['y'] for _, data in self.city_graph.nodes(data=True)], dtype=float)
+                self._node_index = (cKDTree(self._to_index_coords(x, y)), node_ids)
+
+        return self._node_index
+
+
+    def _to_index_coords(self, x: np.ndarray, y: np.ndarray):
+        '''
+        Converts coordinates into the coordinate space of the node index
+        :param x: X coordinates (longitude for unprojected graphs)
+        :param y: Y coordinates (latitude for unprojected graphs)
+        :return: Array of coordinates used by the KD-tree
+        '''
+
+        crs = self.city_graph.graph.get('crs')
+        if crs is not None and ox.projection.is_projected(crs):
+            return np.column_stack([x, y])
+
+        lon, lat = np.radians(x), np.radians(y)
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+    # Write method to snap points to their nearest graph nodes
+    def snap_points(self, city_points: gpd.GeoDataFrame):
+        '''
+        Snaps all points to their nearest graph node in one vectorized query
+        :param city_points: Points within the city as geodataframe
+        :return: Array of nearest node ids, one per point
+        '''
+
+        with profiler.stage('snapping', items=len(city_points)):
+            tree, node_ids = self.get_node_index()
+            _, positions = tree.query(self._to_index_coords(city_points.geometry.x.values, city_points.geometry.y.values))
+
+        return node_ids[positions]
 
 
     # Write method that computes random routes within the city
@@ -153,109 +447,482 @@ class CityAnalyzer:
         self, 
         city_points: gpd.GeoDataFrame, 
         num_routes: int = 100, 
-        method: str = 'length'
+        method: str = 'length',
+        rng: np.random.Generator = None,
+        strategy: str = 'pairwise'
     ):
         '''
-        Computes random routes within the city based on input city point coordinates
+        Computes random routes within the city based on input city point coordinates,
+        all points are snapped to graph nodes once before the routes are drawn
         :param city_points: Points within the city as geodataframe
         :param num_routes: Number of routes to compute (default: 1000)
         :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :param strategy: Routing strategy, 'pairwise' runs one shortest path search per route,
+            'grouped' runs one search per distinct origin on the same routes as get_route_counts
+            (default: 'pairwise')
         :return: City routes as geodataframe
         '''
 
+        assert strategy in ['pairwise', 'grouped'], "strategy must be 'pairwise' or 'grouped'."
+
         print("Starting to generate random routed out of given points..")
 
+        rng = np.random.default_rng(rng)
+
+        # Get nearest nodes of all points at once
+        point_nodes = self.snap_points(city_points)
+
         routes_gdf = gpd.GeoDataFrame()
-        count = 0
+        progress = profiler.Progress(num_routes, "requested routes generated")
+
+        with profiler.stage('routing', items=num_routes):
+            if strategy == 'grouped':
+                # Route on the CSR arrays like get_route_counts and take the traversed edges
+                # from the edges geodataframe of the routed graph
+                arrays = self.graph_arrays
+                _, edge_positions = routing.draw_csr_routes(arrays.routing_arrays(method), arrays.node_positions(point_nodes),
+                                                            num_routes, rng)
+                edges_gdf = self.get_edges_gdf() if self.contraction is None else ox.graph_to_gdfs(self.city_graph, nodes=False)
+                routes_gdf = edges_gdf.iloc[edge_positions]
+                progress.update(num_routes)
+            else:
+                for random_route in self._iter_routes(point_nodes, num_routes, method, rng):
+                    # Convert route to geodataframe and concat it to overall routes geodataframe
+                    route_gdf = ox.utils_graph.route_to_gdf(self.city_graph, random_route, weight=method)
+                    routes_gdf = pd.concat([routes_gdf, route_gdf])
+                    progress.update()
+
+        print("Done. All routes generated.")
+
+        return routes_gdf
+
+
+    def _iter_routes(self, point_nodes: np.ndarray, num_routes: int, method: str, rng: np.random.Generator):
+        '''
+        Yields the requested number of random routes between the snapped points, one shortest
+        path search per route
+        :param point_nodes: Array of node ids of the snapped points
+        :param num_routes: Number of routes to compute
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Numpy random generator
+        :return: Generator of lists of node ids
+        '''
 
-        total_edges = 0
         for i in range(0, num_routes):
-            # Selct two points of the city points
-            sample_points = city_points.sample(2)
+            # Draw a random route between two of the snapped points
+            yield self._draw_route(point_nodes, method, rng)
 
-            # Get nearest nodes 
-            origin_node = ox.nearest_nodes(self.city_graph, sample_points['geometry'].iloc[0].x, sample_points['geometry'].iloc[0].y)
-            destination_node = ox.nearest_nodes(self.city_graph, sample_points['geometry'].iloc[1].x, sample_points['geometry'].iloc[1].y)
+
+    def _draw_route(self, point_nodes: np.ndarray, method: str, rng: np.random.Generator):
+        '''
+        Draws two snapped points and routes between them, draws again if both points
+        share the same node or no route was found
+        :param point_nodes: Array of node ids of the snapped points
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Numpy random generator
+        :return: List of node ids of the route
+        '''
+
+        while True:
+            # Select two points of the city points
+            origin_node, destination_node = point_nodes[rng.choice(len(point_nodes), 2, replace=False)]
+            if origin_node == destination_node:
+                continue
 
             # Get shortes route between nodes
-            random_route = ox.shortest_path(self.city_graph, origin_node, destination_node, weight=method)
-
-            # Repeat if origin and destination node are equal or no route was found
-            while origin_node == destination_node or not random_route:
-                sample_points = city_points.sample(2)
-                origin_node = ox.nearest_nodes(self.city_graph, sample_points['geometry'].iloc[0].x, sample_points['geometry'].iloc[0].y)
-                destination_node = ox.nearest_nodes(self.city_graph, sample_points['geometry'].iloc[1].x,
-                                                sample_points['geometry'].iloc[1].y)
+            if self.routing_engine == 'alt':
+                random_route = self.get_router(method).shortest_path(origin_node, destination_node)
+            else:
                 random_route = ox.shortest_path(self.city_graph, origin_node, destination_node, weight=method)
+            if random_route:
+                return random_route
 
-            total_edges_in_route = len(random_route) - 1  
-            total_edges += total_edges_in_route
 
-            # Convert route to geodataframe and concat it to overall routes geodataframe
-            route_gdf = ox.utils_graph.route_to_gdf(self.city_graph, random_route, weight=method)
-            routes_gdf = pd.concat([routes_gdf, route_gdf])
-            count += 1
-            print("--------------------------------------------")
-            print("Loading.. done: " + str(count) + " from "+ str(num_routes) + " requested routes generated. Please wait..")
-            print("--------------------------------------------")
-        
-        print("Done. All routes generated.")
+    # Write method to get the preprocessed router of a weight
+    def get_router(self, method: str = 'length', num_landmarks: int = 16):
+        '''
+        Returns the A* router with landmark lower bounds of the graph (see landmarks.LandmarkRouter),
+        it is built once per graph and weight and stored next to the graph in the local store.
+        Routes have the same length as ox.shortest_path and the same nodes if the shortest route is unique
+        :param method: Edge attribute used as weight ('length' or 'travel_time')
+        :param num_landmarks: Number of landmarks of a newly built router (default: 16)
+        :return: LandmarkRouter
+        '''
 
-        return routes_gdf
+        with self._lock:
+            if method not in self._routers:
+                router = None
+                if self.store is not None:
+                    fingerprint = LandmarkRouter.get_graph_arrays(self.city_graph, method).fingerprint()
+                    router = self.store.load_router(self.store_key, method, fingerprint)
+
+                if router is None:
+                    print(f"Starting to preprocess landmarks for route type {method}..")
+                    with profiler.stage('graph_build', items=num_landmarks):
+                        router = LandmarkRouter.from_graph(self.city_graph, method, num_landmarks, rng=0)
+                    if self.store is not None:
+                        self.store.save_router(self.store_key, router)
+                    print("Done. Landmarks preprocessed.")
+
+                self._routers[method] = router
+
+        return self._routers[method]
+
+
+    # Write method to index the edges of the graph
+    def get_edge_index(self):
+        '''
+        Enumerates the edges of the graph in the order of ox.graph_to_gdfs
+        :return: Pandas MultiIndex of (u, v, key) tuples
+        '''
+
+        with self._lock:
+            if self._edge_index is None:
+                self._edge_index = pd.MultiIndex.from_tuples(list(self.city_graph.edges(keys=True)), names=['u', 'v', 'key'])
+
+        return self._edge_index
+
+
+    @property
+    def graph_arrays(self):
+        '''
+        Compact CSR arrays of the graph, rebuilt together with all other indexes whenever the
+        graph was replaced, nodes or edges were added or removed or a change was announced
+        with refresh_graph
+        :return: GraphArrays of the graph
+        '''
+
+        with self._lock:
+            if self._graph_arrays is not None and not self._graph_arrays.matches(self.city_graph):
+                self._reset_indexes()
+            if self._graph_arrays is None:
+                self._graph_arrays = GraphArrays.from_graph(self.city_graph)
+
+        return self._graph_arrays
+
+
+    def _get_edge_lookup(self, method: str = 'length'):
+        '''
+        Maps each node pair to the position of its cheapest parallel edge in the edge
+        index, which is the edge osmnx uses when converting routes to geodataframes
+        :param method: Edge attribute used as weight ('length' or 'travel_time')
+        :return: Dictionary of (u, v) tuples to edge positions
+        '''
+
+        with self._lock:
+            if method not in self._edge_lookup:
+                lookup = {}
+                weights = {}
+                for position, (u, v, key, weight) in enumerate(self.city_graph.edges(keys=True, data=method)):
+                    if (u, v) not in lookup or weight < weights[(u, v)]:
+                        lookup[(u, v)] = position
+                        weights[(u, v)] = weight
+                self._edge_lookup[method] = lookup
+
+        return self._edge_lookup[method]
+
+
+    # Write method that counts edge traversals of random routes without building geometries
+    def get_route_counts(
+        self, 
+        city_points: gpd.GeoDataFrame, 
+        num_routes: int = 100, 
+        method: str = 'length',
+        rng: np.random.Generator = None,
+        strategy: str = 'pairwise',
+        num_workers: int = 1
+    ):
+        '''
+        Computes random routes like get_routes, but only adds their edge traversals to a
+        counter indexed like get_edge_index, so memory does not grow with the number of routes
+        :param city_points: Points within the city as geodataframe
+        :param num_routes: Number of routes to compute (default: 100)
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :param strategy: Routing strategy ('pairwise' or 'grouped', see get_routes), grouped
+            routes are searched on the compact graph arrays
+        :param num_workers: Number of processes, values above 1 route batches of OD pairs with
+            independent random streams on a process pool sharing compact graph arrays (default: 1)
+        :return: Array with the number of traversals per edge
+        '''
+
+        print("Starting to count edge traversals of random routes..")
+
+        rng = np.random.default_rng(rng)
+        point_nodes = self.snap_points(city_points)
+        edge_counts = self._count_routes(point_nodes, num_routes, method, rng, strategy, num_workers)
+
+        print("Done. All routes counted.")
+
+        return edge_counts
+
+
+    def _count_routes(
+        self, 
+        point_nodes: np.ndarray, 
+        num_routes: int, 
+        method: str, 
+        rng: np.random.Generator, 
+        strategy: str = 'pairwise', 
+        num_workers: int = 1
+    ):
+        '''
+        Counts the edge traversals of random routes between snapped points
+        :param point_nodes: Array of node ids of the snapped points
+        :param num_routes: Number of routes to compute
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Numpy random generator
+        :param strategy: Routing strategy ('pairwise' or 'grouped')
+        :param num_workers: Number of processes
+        :return: Array with the number of traversals per edge
+        '''
+
+        with profiler.stage('routing', items=num_routes):
+            if num_workers > 1 or strategy == 'grouped':
+                arrays = self.graph_arrays
+                point_positions = arrays.node_positions(point_nodes)
+                routing_arrays = arrays.routing_arrays(method)
+
+                if num_workers > 1:
+                    return routing.parallel_route_counts(routing_arrays, point_positions, num_routes, arrays.num_edges,
+                                                         np.random.SeedSequence(rng.integers(2**63)), num_workers)
+
+                return routing.count_csr_routes(routing_arrays, point_positions, num_routes, arrays.num_edges, rng)
+
+            edge_lookup = self._get_edge_lookup(method)
+            edge_counts = np.zeros(len(self.get_edge_index()), dtype=np.int64)
+
+            for random_route in self._iter_routes(point_nodes, num_routes, method, rng):
+                edge_counts[[edge_lookup[edge] for edge in zip(random_route[:-1], random_route[1:])]] += 1
+
+            return edge_counts
+
+
+    # Write method that adds routes in batches until the centrality converges
+    def get_streaming_counts(
+        self, 
+        city_points: gpd.GeoDataFrame, 
+        max_routes: int = 10000, 
+        method: str = 'length',
+        tolerance: float = 0.01,
+        batch_size: int = 500,
+        metric: str = 'l1',
+        top_k: int = 100,
+        patience: int = 2,
+        rng: np.random.Generator = None,
+        strategy: str = 'grouped',
+        num_workers: int = 1
+    ):
+        '''
+        Adds random routes in batches and updates the edge counts after every batch, stops as
+        soon as the change of the centrality between two batches stayed below the tolerance for
+        patience batches in a row or the route budget is used up. The change is measured as
+        'l1': L1 distance between the centrality shares of all edges before and after the batch,
+        'topk': share of the top_k edges by centrality that left the top_k with the batch
+        :param city_points: Points within the city as geodataframe
+        :param max_routes: Route budget (default: 10000)
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param tolerance: Change below which the centrality counts as converged (default: 0.01)
+        :param batch_size: Number of routes per batch (default: 500)
+        :param metric: Convergence metric, 'l1' or 'topk' (default: 'l1')
+        :param top_k: Number of edges compared by the 'topk' metric (default: 100)
+        :param patience: Number of batches in a row that have to stay below the tolerance (default: 2)
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :param strategy: Routing strategy ('pairwise' or 'grouped', see get_routes)
+        :param num_workers: Number of processes per batch (see get_route_counts)
+        :return: Tuple of the edge counts, the number of routes used and the list of changes per batch
+        '''
+
+        assert metric in ['l1', 'topk'], "metric must be 'l1' or 'topk'."
+
+        print("Starting to count edge traversals of random routes until the centrality converges..")
+
+        rng = np.random.default_rng(rng)
+        point_nodes = self.snap_points(city_points)
+        edge_counts = np.zeros(len(self.get_edge_index()), dtype=np.int64)
+
+        num_routes = 0
+        changes = []
+        while num_routes < max_routes:
+            previous_counts = edge_counts.copy()
+            batch = min(batch_size, max_routes - num_routes)
+            edge_counts += self._count_routes(point_nodes, batch, method, rng, strategy, num_workers)
+            num_routes += batch
+
+            if previous_counts.sum() == 0:
+                continue
+
+            if metric == 'l1':
+                change = np.abs(edge_counts / edge_counts.sum() - previous_counts / previous_counts.sum()).sum()
+            else:
+                k = min(top_k, len(edge_counts))
+                previous_top = set(np.argpartition(-previous_counts, k - 1)[:k].tolist())
+                current_top = set(np.argpartition(-edge_counts, k - 1)[:k].tolist())
+                change = 1 - len(previous_top & current_top) / k
+            changes.append(change)
+
+            print(f"Loading.. {num_routes} routes counted, change of centrality: {change:.5f}")
+
+            if len(changes) >= patience and max(changes[-patience:]) <= tolerance:
+                break
+
+        print(f"Done. {num_routes} routes were needed.")
+
+        return edge_counts, num_routes, changes
+
+
+    # Write function that computes geographical centrality from edge counts
+    def get_count_centrality(self, edge_counts: np.ndarray):
+        '''
+        Calculates betweenness centrality from edge traversal counts, the geometry of
+        every traversed edge is attached once from the graph
+        :param edge_counts: Array with the number of traversals per edge (see get_route_counts)
+        :return: Geodataframe containing u, v, key, osmid, geometry and centrality of the streets
+        '''
+
+        print("Starting to compute betweenness centrality from edge counts..")
+
+        with profiler.stage('aggregation', items=int(edge_counts.sum())):
+            # Counts of super-edges belong to every edge of their chain
+            if self.contraction is not None:
+                edge_counts = self.contraction.project(edge_counts)
+
+            # Converting the graph to a geopandas.GeoDataFrame
+            edges_gdf = self.get_edges_gdf()
+
+            # Keep traversed edges and share the traversals among them
+            traversed = edge_counts > 0
+            count_gdf = edges_gdf.loc[traversed, ['osmid', 'geometry']].copy()
+            count_gdf['centrality'] = edge_counts[traversed] / edge_counts.sum()
+
+        print("Processing done.. betweenness centrality computed from edge counts.")
+
+        return count_gdf.reset_index()
 
     
     # Write function that computes geographical centrality
-    def get_geocentrality(self, city_routes: gpd.GeoDataFrame):
+    def get_geocentrality(self, city_routes: gpd.GeoDataFrame, dissolve_by: str = None):
         '''
-        Calculates betweeness centrality based on given routes using a geographical approach
-        :param city_routes: Geodataframe containing different computed routes of a city
-        :return: Geodataframe containing osmid, geometry and centrality of the streets
+        Calculates betweeness centrality based on given routes using a geographical approach, the
+        route segments are counted per (u, v, key) edge and the geometry of every traversed edge
+        is attached once (see get_count_centrality)
+        :param city_routes: Geodataframe containing different computed routes of a city indexed by u, v and key
+        :param dissolve_by: Merge the edges of every street by 'osmid' or 'name' (optional, see dissolve_streets)
+        :return: Geodataframe containing u, v, key, osmid, geometry and centrality of the streets
         '''
+        assert dissolve_by in [None, 'osmid', 'name'], "dissolve_by must be None, 'osmid' or 'name'."
 
         print("Starting to compute betweenness centrality based on geographical approach.. Please wait..")
 
-        # Delete all columns except 'geometry' and 'osmid'
-        geocentrality_gdf = city_routes[['geometry', 'osmid']].copy()
+        with profiler.stage('aggregation', items=len(city_routes)):
+            # Count the route segments per edge of the graph
+            edge_index = self.get_edge_index()
+            positions = edge_index.get_indexer(city_routes.index)
+            assert (positions >= 0).all(), "All route segments must be edges of the graph."
+            edge_counts = np.bincount(positions, minlength=len(edge_index))
 
-        # Clean 'osmid' column
-        geocentrality_gdf['osmid'] = geocentrality_gdf['osmid'].apply(lambda x: x[0] if isinstance(x, list) else x)
+        geocentrality_gdf = self.get_count_centrality(edge_counts)
 
-        # Convert 'osmid' to integer
-        geocentrality_gdf['osmid'] = geocentrality_gdf['osmid'].astype(int)
+        if dissolve_by is not None:
+            geocentrality_gdf = self.dissolve_streets(geocentrality_gdf, dissolve_by)
 
-        # Count 'osmid' as value for betweenness centrality
-        count_osmid = geocentrality_gdf['osmid'].value_counts()
+        print("Processing done.. geographical betweenness centrality computed.")
 
-        # Create new column 'centrality'
-        geocentrality_gdf['centrality'] = geocentrality_gdf['osmid'].map(count_osmid) / len(city_routes)
+        return geocentrality_gdf
 
-        try:
-            print("Start dissolving Process...")
 
-            # Dissolve geometries based on centrality values
-            dissolved_geocentrality_gdf = geocentrality_gdf.dissolve(by='centrality', aggfunc='first')
-            dissolved_geocentrality_gdf = dissolved_geocentrality_gdf.reset_index()
+    # Write method to merge the edges of every street
+    def dissolve_streets(self, centrality_gdf: gpd.GeoDataFrame, by: str = 'osmid'):
+        '''
+        Merges the edges of every street into one feature and sums their centrality, so the
+        centrality of a street is the share of all traversals on its edges. Edges with several
+        osmids or names belong to the first one, edges without a name keep their own feature
+        :param centrality_gdf: Geodataframe containing u, v, key, geometry and centrality of the edges
+        :param by: Street key, 'osmid' or 'name' (default: 'osmid')
+        :return: Geodataframe containing the street key, geometry and centrality of the streets
+        '''
+        assert by in ['osmid', 'name'], "by must be 'osmid' or 'name'."
 
-            print("Dissolve process finished.")
-            print("Processing done.. networkx betweenness centrality computed.")
+        print(f"Starting to dissolve the edges of every street by {by}..")
 
-            return dissolved_geocentrality_gdf
-        
-        except Exception as e:
-            print(f"Error during dissolve process: {str(e)}")
-    
+        with profiler.stage('dissolve', items=len(centrality_gdf)):
+            street_gdf = centrality_gdf[['u', 'v', 'key', 'geometry', 'centrality']].copy()
+            edges_gdf = self.get_edges_gdf()
+            if by in edges_gdf.columns:
+                street_gdf[by] = edges_gdf[by].reindex(pd.MultiIndex.from_frame(street_gdf[['u', 'v', 'key']])).values
+            else:
+                street_gdf[by] = None
+            street_gdf[by] = street_gdf[by].apply(lambda x: x[0] if isinstance(x, list) else x)
+
+            keyed = street_gdf[by].notna()
+            dissolved_gdf = street_gdf[keyed].dissolve(by=by, aggfunc={'centrality': 'sum'}).reset_index()
+            street_gdf = pd.concat([dissolved_gdf, street_gdf.loc[~keyed, [by, 'geometry', 'centrality']]],
+                                   ignore_index=True)
 
+        print(f"Done. {len(centrality_gdf)} edges dissolved into {len(street_gdf)} streets.")
+
+        return street_gdf
+
+    
     # Write function that calcultes betweenness centrality based on NetworkX
-    def get_netcentrality(self, method: str = 'length'):
+    def get_netcentrality(
+        self, 
+        method: str = 'length',
+        k: int = None,
+        rel_error: float = None,
+        source_weights: np.ndarray = None,
+        rng: np.random.Generator = None,
+        backend: str = 'networkx',
+        num_workers: int = 1
+    ):
         '''
-        Calculates betweenes centrality based on NetworkX
+        Calculates betweenes centrality based on NetworkX, if k or rel_error is given the
+        centrality is estimated from a sample of source nodes (see centrality.sampled_edge_betweenness)
+        and the standard error of the estimate is added as column 'centrality_error'.
+        The 'arrays' backend computes the same values with Brandes steps on CSR arrays
+        (see centrality.array_edge_betweenness). Contracted graphs are refused, the betweenness
+        of the contracted graph leaves out pairs with interior chain nodes and all nodes outside
+        the largest strongly connected component and is normalized with the wrong number of nodes
+        :param method: Edge attribute used as weight ('length' or 'travel_time')
+        :param k: Number of sampled sources, upper limit if rel_error is given (optional)
+        :param rel_error: Target relative standard error for adaptive stopping (optional)
+        :param source_weights: Weights of the nodes in graph order for weighted sampling, e.g. population (optional)
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :param backend: Brandes implementation, 'networkx' or 'arrays' (default: 'networkx')
+        :param num_workers: Number of processes for exact centrality with the 'arrays' backend (default: 1)
         return: Geodataframe containing osmid, geometry and centrality of the streets 
         '''
 
+        assert backend in ['networkx', 'arrays'], "backend must be 'networkx' or 'arrays'."
+
+        if self.contraction is not None:
+            raise ValueError("networkx betweenness centrality is not supported on contracted graphs, "
+                             "load the city without contract")
+
+        if k is not None or rel_error is not None:
+            print("Starting to estimate networkx betweenness centrality from sampled sources.. Please wait..")
+
+            with profiler.stage('routing') as record:
+                estimate, error, num_sources = centrality.sampled_edge_betweenness(
+                    self.city_graph, method, k=k, rel_error=rel_error, source_weights=source_weights, rng=rng, backend=backend)
+                record['items'] += num_sources
+            netcentrality_df = pd.DataFrame({'centrality': estimate, 'centrality_error': error}, index=self.get_edge_index())
+
+            print(f"Estimated from {num_sources} sampled sources.")
+            return self._join_edges(netcentrality_df)
+
         print("Starting to compute networkx betweenness centrality.. Please wait..")
 
-        # Calculate betweenness centrality using NetworkX
-        betweenness_centrality = nx.edge_betweenness_centrality(self.city_graph, weight=method)
+        with profiler.stage('routing', items=self.city_graph.number_of_nodes()):
+            if backend == 'arrays':
+                values = centrality.array_edge_betweenness(self.city_graph, method, num_workers=num_workers)
+            else:
+                # Calculate betweenness centrality using NetworkX
+                betweenness_centrality = nx.edge_betweenness_centrality(self.city_graph, weight=method)
+
+        if backend == 'arrays':
+            return self._join_edges(pd.DataFrame({'centrality': values}, index=self.get_edge_index()))
 
         # Convert the values in betweenness_centrality into a pandas.Dataframe
         netcentrality_df = pd.DataFrame(index=betweenness_centrality.keys(), data=betweenness_centrality.values())
@@ -265,16 +932,27 @@ class CityAnalyzer:
         netcentrality_df.columns = ['u', 'v', 'key', 'centrality']
         netcentrality_df = netcentrality_df.set_index(['u', 'v', 'key'])
 
-        # Converting the graph to a geopandas.GeoDataFrame
-        nodes_df, edges_df = ox.graph_to_gdfs(self.city_graph)
+        return self._join_edges(netcentrality_df)
+
+
+    def _join_edges(self, netcentrality_df: pd.DataFrame):
+        '''
+        Joins centrality values indexed by (u, v, key) with osmid and geometry of the edges
+        :param netcentrality_df: Dataframe of centrality values indexed by u, v and key
+        :return: Geodataframe containing osmid, geometry and centrality of the streets
+        '''
+
+        with profiler.stage('aggregation', items=len(netcentrality_df)):
+            if self.contraction is not None:
+                netcentrality_df = self.contraction.project_frame(netcentrality_df)
 
-        # Join the centrality_df with the edges_df
-        netcentrality_gdf = netcentrality_df.join(edges_df[['osmid', 'geometry']])
-        netcentrality_gdf = gpd.GeoDataFrame(netcentrality_gdf, crs=4326)
+            # Converting the graph to a geopandas.GeoDataFrame
+            edges_df = self.get_edges_gdf()
 
-        # Convert column lists into strings for saving 
-        netcentrality_gdf['osmid'] = netcentrality_gdf['osmid'].astype(str)
+            # Join the centrality_df with the edges_df
+            netcentrality_gdf = netcentrality_df.join(edges_df[['osmid', 'geometry']])
+            netcentrality_gdf = gpd.GeoDataFrame(netcentrality_gdf, crs=4326)
 
         print("Processing done.. networkx betweenness centrality computed.")
 
-        return netcentrality_gdf
\ No newline at end of file
+        return netcentrality_gdf
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# contraction.py
+
+"""Pruning and contraction of graph networks before routing"""
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+from shapely.geometry import LineString
+
+
+class ContractedGraph:
+    """Contracted Graph Network with a Mapping to the Original Edges"""
+
+    def __init__(self, graph: nx.MultiDiGraph, original_graph: nx.MultiDiGraph, edge_map: np.ndarray):
+        """
+        Defines a contracted graph and the edge of the contracted graph every original edge belongs to
+        :param graph: Contracted graph network
+        :param original_graph: Graph network the contracted graph was built from
+        :param edge_map: Position of the contracted edge in graph.edges(keys=True) for every edge
+            of original_graph.edges(keys=True), -1 for edges outside the largest strongly connected component
+        """
+
+        self.graph = graph
+        self.original_graph = original_graph
+        self.edge_map = edge_map
+
+
+    @classmethod
+    def from_graph(cls, graph: nx.MultiDiGraph, weights: tuple = ("length", "travel_time")):
+        """
+        Keeps the largest strongly connected component, so that every pair of nodes has a route,
+        and contracts chains of degree-2 nodes into super-edges. A node is contracted if it has
+        exactly two neighbours and either one incoming and one outgoing edge (one-way street) or
+        both directions to both neighbours (two-way street) without parallel edges. Super-edges
+        sum the weights and lengths, merge the geometries and keep the other attributes of their
+        first edge, shortest paths between the remaining nodes do not change
+        :param graph: Graph network
+        :param weights: Edge attributes that are summed along a chain (default: length and travel_time)
+        :return: ContractedGraph
+        """
+
+        # Adjacency of the largest strongly connected component as plain dictionaries
+        component = max(nx.strongly_connected_components(graph), key=len)
+        successors, predecessors = {node: {} for node in component}, {node: {} for node in component}
+        original_positions = {}
+        for position, (u, v, key, data) in enumerate(graph.edges(keys=True, data=True)):
+            original_positions[(u, v, key)] = position
+            if u in component and v in component:
+                successors[u].setdefault(v, {})[key] = data
+                predecessors[v].setdefault(u, {})[key] = data
+        interior = {node for node in component if _is_interior(node, successors[node], predecessors[node])}
+
+        contracted = nx.MultiDiGraph(**graph.graph)
+        contracted.add_nodes_from((node, graph.nodes[node]) for node in graph if node in component and node not in interior)
+
+        # Walk from every remaining node along its chains, nodes of chains closed in
+        # themselves are kept as start of the chain
+        chains = {}
+        pair_keys = {}
+        visited = set()
+        starts = list(contracted.nodes)
+        while True:
+            for start in starts:
+                for first, keys in successors[start].items():
+                    for key in keys:
+                        chain = [(start, first, key)]
+                        while chain[-1][1] in interior:
+                            previous, node, _ = chain[-1]
+                            visited.add(node)
+                            target = next(v for v in successors[node] if v != previous or len(successors[node]) == 1)
+                            chain.append((node, target, next(iter(successors[node][target]))))
+                        end = chain[-1][1]
+                        pair_keys[(start, end)] = pair_keys.get((start, end), -1) + 1
+                        chains[(start, end, pair_keys[(start, end)])] = chain
+
+            leftover = interior - visited
+            if not leftover:
+                break
+            starts = [leftover.pop()]
+            interior.discard(starts[0])
+            contracted.add_node(starts[0], **graph.nodes[starts[0]])
+
+        contracted.add_edges_from((u, v, key, _merge_edges(graph, successors, chain, weights))
+                                  for (u, v, key), chain in chains.items())
+
+        # Map every original edge to the position of its super-edge
+        mapped, positions = [], []
+        for position, edge in enumerate(contracted.edges(keys=True)):
+            mapped.extend(original_positions[original_edge] for original_edge in chains[edge])
+            positions.extend([position] * len(chains[edge]))
+        edge_map = np.full(len(original_positions), -1, dtype=np.int64)
+        edge_map[mapped] = positions
+
+        return cls(contracted, graph, edge_map)
+
+
+    # Write method to project edge values onto the original edges
+    def project(self, values: np.ndarray, fill_value=0):
+        """
+        Assigns the value of every super-edge to all original edges of its chain
+        :param values: Array of values in the edge order of the contracted graph
+        :param fill_value: Value of original edges outside the largest strongly connected component (default: 0)
+        :return: Array of values in the edge order of the original graph
+        """
+
+        values = np.asarray(values)
+        projected = np.full(len(self.edge_map), fill_value, dtype=np.result_type(values, np.asarray(fill_value)))
+        mapped = self.edge_map >= 0
+        projected[mapped] = values[self.edge_map[mapped]]
+
+        return projected
+
+
+    # Write method to project a dataframe onto the original edges
+    def project_frame(self, values_df: pd.DataFrame):
+        """
+        Projects all columns of a dataframe indexed by the (u, v, key) edges of the contracted
+        graph onto the original edges, edges outside the largest strongly connected component are dropped
+        :param values_df: Dataframe indexed by u, v and key of the contracted graph
+        :return: Dataframe indexed by u, v and key of the original graph
+        """
+
+        contracted_index = pd.MultiIndex.from_tuples(list(self.graph.edges(keys=True)), names=["u", "v", "key"])
+        original_index = pd.MultiIndex.from_tuples(list(self.original_graph.edges(keys=True)), names=["u", "v", "key"])
+        values_df = values_df.reindex(contracted_index)
+        mapped = self.edge_map >= 0
+
+        return pd.DataFrame({column: values_df[column].to_numpy()[self.edge_map[mapped]] for column in values_df.columns},
+                            index=original_index[mapped])
+
+
+# Function to check whether a node lies within a chain
+def _is_interior(node, successors: dict, predecessors: dict):
+    """
+    Checks whether a node only connects two neighbours like a street without junction
+    :param node: Node id
+    :param successors: Dictionary of successor nodes to dictionaries of edge keys
+    :param predecessors: Dictionary of predecessor nodes to dictionaries of edge keys
+    :return: True if the node can be contracted
+    """
+
+    if node in predecessors or any(len(keys) > 1 for keys in successors.values()) or \
+            any(len(keys) > 1 for keys in predecessors.values()):
+        return False
+
+    # One-way street or two-way street between the same two neighbours
+    one_way = len(predecessors) == 1 and len(successors) == 1 and predecessors.keys() != successors.keys()
+    two_way = len(predecessors) == 2 and predecessors.keys() == successors.keys()
+
+    return one_way or two_way
+
+
+# Function to merge the edges of a chain into one super-edge
+def _merge_edges(graph: nx.MultiDiGraph, successors: dict, chain: list, weights: tuple):
+    """
+    Merges the attributes of a chain of edges, weights are summed, osmids are collected and
+    geometries are joined, all other attributes are taken from the first edge
+    :param graph: Graph network
+    :param successors: Dictionary of nodes to successor nodes to edge keys to edge attributes
+    :param chain: List of (u, v, key) edges
+    :param weights: Edge attributes that are summed
+    :return: Dictionary of edge attributes
+    """
+
+    edges = [successors[u][v][key] for u, v, key in chain]
+    if len(edges) == 1:
+        return dict(edges[0])
+
+    attributes = dict(edges[0])
+    for weight in weights:
+        if all(weight in data for data in edges):
+            attributes[weight] = sum(data[weight] for data in edges)
+
+    osmids = []
+    for data in edges:
+        for osmid in (data["osmid"] if isinstance(data.get("osmid"), list) else [data.get("osmid")]):
+            if osmid is not None and osmid not in osmids:
+                osmids.append(osmid)
+    if osmids:
+        attributes["osmid"] = osmids if len(osmids) > 1 else osmids[0]
+
+    coordinates = []
+    for (u, v, _), data in zip(chain, edges):
+        if "geometry" in data:
+            line = list(data["geometry"].coords)
+        else:
+            line = [(graph.nodes[u]["x"], graph.nodes[u]["y"]), (graph.nodes[v]["x"], graph.nodes[v]["y"])]
+        coordinates.extend(line if not coordinates else line[1:])
+    attributes["geometry"] = LineString(coordinates)
+
+    return attributes
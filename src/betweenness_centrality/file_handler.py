@@ -4,10 +4,25 @@
 
 """Functions for Geodataframe handling"""
 
+import argparse
+import json
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+import shapely
 import matplotlib.pyplot as plt
+from matplotlib import colormaps
+from matplotlib.cm import ScalarMappable
+from matplotlib.patches import PathPatch
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from pyproj import Transformer
 import os
-import sys
+from betweenness_centrality import profiler
+
+CHUNK_SIZE = 50_000
 
 
 # Function to create new output folder
@@ -19,92 +34,537 @@ def create_output_folder(folder_name: str):
     
     # Create a new folder if it doesn't exist
     if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
+        os.makedirs(folder_name, exist_ok=True)
         print(f"Folder '{folder_name}' created successfully.")
     else:
         print(f"Folder '{folder_name}' already exists.")
 
 
 # Function to check input arguments
-def check_input_arguments():
+def check_input_arguments(argv: list = None):
     """
     Checks if provided command-line arguments are valid
+    :param argv: List of arguments (default: sys.argv[1:])
+    :return: Namespace of the parsed arguments
     """
 
-    # Ensure that the correct number of command-line arguments are provided
-    if len(sys.argv) != 5:
-        print("Usage: python script.py arg1 arg2 arg3 arg4")
-        print("Please provide four arguments.")
-        sys.exit(1)  # Exit with a non-zero status code to indicate an error
-
-    # Extract command-line arguments
-    arg1 = sys.argv[1]
-    arg2 = sys.argv[2]
-    arg3 = sys.argv[3]
-    arg4 = sys.argv[4]
-
-    def is_integer(value):
-        try:
-            int(value)
-            return True
-        except ValueError:
-            return False
+    parser = argparse.ArgumentParser(description="Calculate betweenness centrality of OSM road networks.")
+    parser.add_argument("city", type=str, help="query to geocode the place you want to analyse")
+    parser.add_argument("method", choices=["geographical", "geographicalPop", "networkx", "all"],
+                        help="method to calculate betweenness centrality, 'all' computes every method for "
+                             "both route types in one run")
+    parser.add_argument("type", choices=["length", "travel_time"], help="route type to generate routes")
+    parser.add_argument("num_routes", type=int, help="number of routes to generate")
 
-    if not isinstance(arg1, str):
-        print("Error. arg1 must be of type string.")
-        sys.exit(1)
+    # Options of the geographical methods
+    parser.add_argument("--dissolve", choices=["osmid", "name"], default=None,
+                        help="merge the edges of every street of the geographical methods by osmid or name")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="geographical: add routes in batches until the centrality changes less than this "
+                             "between batches, num_routes is the route budget")
 
-    elif not (isinstance(arg2, str) and arg2 in ["geographical", "geographicalPop", "networkx"]):
-        print("Error. arg2 must be of type string and in [geographical, geographicalPop, networkx]")
-        sys.exit(1)
+    # Options of the networkx method
+    parser.add_argument("--sample-sources", type=int, default=None, metavar="K",
+                        help="networkx: estimate centrality from K sampled source nodes")
+    parser.add_argument("--rel-error", type=float, default=None,
+                        help="networkx: sample sources until this relative standard error is reached")
+    parser.add_argument("--source-weights", choices=["uniform", "population"], default="uniform",
+                        help="networkx: draw sampled sources uniformly or weighted by population")
+    parser.add_argument("--backend", choices=["networkx", "arrays"], default="networkx",
+                        help="networkx: compute centrality with networkx or the array based Brandes engine")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes to use")
+    parser.add_argument("--cache-dir", type=str, default="../cache",
+                        help="folder to store downloaded graphs and polygons in, 'none' disables the store")
+    parser.add_argument("--result-cache-mb", type=int, default=256,
+                        help="size limit of the cached edge counts in the cache folder, 0 disables the result cache")
+    parser.add_argument("--contract", action="store_true",
+                        help="route on the largest strongly connected component with chains of degree-2 nodes "
+                             "contracted, results are stored on the original edges, not supported by networkx")
+    parser.add_argument("--routing-engine", choices=["dijkstra", "alt"], default="dijkstra",
+                        help="geographical: search pairwise routes with Dijkstra or with A* and landmarks, "
+                             "which are preprocessed once per graph and route type and stored in the cache folder")
+    parser.add_argument("--tile-size", type=float, default=None, metavar="KM",
+                        help="geographical: split the region into tiles of this size in km which are loaded and "
+                             "routed one at a time, stopped runs with a seed continue with the missing tiles")
+    parser.add_argument("--tile-buffer", type=float, default=500,
+                        help="overlap of the tile graphs with their neighbours in meters (default: 500)")
+    parser.add_argument("--osm-file", type=str, default=None,
+                        help="local .osm or .pbf extract to build the graph from instead of downloading it")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    parser.add_argument("--output-format", choices=["gpkg", "parquet", "fgb"], default="gpkg",
+                        help="format of the centrality file: GeoPackage, GeoParquet or FlatGeobuf")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="number of rows written at once (default: 50000)")
+    parser.add_argument("--tiles", type=int, nargs="+", default=None, metavar="ZOOM",
+                        help="render map tiles of the centrality at these zoom levels")
+    parser.add_argument("--show", action="store_true", help="show the interactive plot after saving it")
+    parser.add_argument("--profile-stage", choices=profiler.STAGES, default=None,
+                        help="run this stage under cProfile and store the statistics in the output folder")
 
-    elif not (isinstance(arg3, str) and arg3 in ["length", "travel_time"]):
-        print("Error. arg3 must be of type string and in [length, travel_time]")
-        sys.exit(1)
-
-    elif not is_integer(arg4):
-        print("Error. arg4 must be a number.")
-        sys.exit(1)
-
-    else:
-        print("System Arguments correct. Start processing..")
+    args = parser.parse_args(argv)
+    if args.tile_size is not None and args.method not in ["geographical", "geographicalPop"]:
+        parser.error("--tile-size supports the methods geographical and geographicalPop only")
+    if args.dissolve is not None and (args.tile_size is not None or args.method not in ["geographical", "geographicalPop"]):
+        parser.error("--dissolve supports the methods geographical and geographicalPop without --tile-size only")
+    if args.contract and args.method in ["networkx", "all"]:
+        parser.error("--contract is not supported by the methods networkx and all")
+    print("System Arguments correct. Start processing..")
 
-    return arg1, arg2, arg3, int(arg4)
+    return args
 
 
 # Function to plot centrality geodataframe
-def plot_centrality(centrality_gdf: gpd.GeoDataFrame, title: str, filepath: str):
+def plot_centrality(
+    centrality_gdf: gpd.GeoDataFrame, 
+    title: str, 
+    filepath: str, 
+    show: bool = True, 
+    column: str = "centrality"
+):
     """
     Plots geodataframe, visualizes betweenness centrality and saves imag as PNG
     :param centrality_gdf: Geodataframe containing centrality values
     :param method: Method used for analysis
     :param filepath: Path to store the file
+    :param show: Show the plot after saving it (default: True)
+    :param column: Column containing the centrality values (default: 'centrality')
     """
 
-    # Create plot
-    centrality_gdf.plot(column="centrality", legend=True, cmap="magma_r", figsize=(15, 10))
-    plt.title(title)
+    with profiler.stage("write", items=len(centrality_gdf)):
+        # Create plot
+        centrality_gdf.plot(column=column, legend=True, cmap="magma_r", figsize=(15, 10))
+        plt.title(title)
 
-    # Safe plot as PNG
-    png_filename_result = filepath
-    plt.savefig(png_filename_result, format="png")
+        # Safe plot as PNG
+        png_filename_result = filepath
+        plt.savefig(png_filename_result, format="png")
     
     # Show plot
-    plt.show()
+    if show:
+        plt.show()
+    plt.close()
+
+
+# Function to convert edge geometries into line coordinates
+def _get_lines(centrality_gdf: gpd.GeoDataFrame, column: str = "centrality", crs=None):
+    """
+    Converts all line geometries into one coordinate array in a vectorized call, multi part
+    geometries are split into their parts
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param column: Column containing the centrality values (default: 'centrality')
+    :param crs: CRS to transform the coordinates into (optional)
+    :return: Tuple of the coordinates, the line of every coordinate and the value of every line
+    """
+
+    parts, part_index = shapely.get_parts(np.asarray(centrality_gdf.geometry.values), return_index=True)
+    coordinates, line_index = shapely.get_coordinates(parts, return_index=True)
+    if crs is not None and centrality_gdf.crs is not None:
+        transformer = Transformer.from_crs(centrality_gdf.crs, crs, always_xy=True)
+        coordinates = np.column_stack(transformer.transform(coordinates[:, 0], coordinates[:, 1]))
+
+    return coordinates, line_index, centrality_gdf[column].to_numpy(dtype=float)[part_index]
+
+
+# Function to style lines by centrality
+def _get_line_patches(
+    coordinates: np.ndarray, 
+    line_index: np.ndarray, 
+    values: np.ndarray, 
+    norm: Normalize, 
+    cmap: str, 
+    line_widths: tuple, 
+    num_levels: int = 64
+):
+    """
+    Groups the lines into levels of the normalized values and builds one compound path per
+    level, so matplotlib draws num_levels paths instead of one path per edge. Colour and line
+    width grow with the level and higher levels are drawn last
+    :param coordinates: Array of shape (n, 2) with the coordinates of all lines
+    :param line_index: Line of every coordinate, coordinates of one line are consecutive
+    :param values: Value of every line
+    :param norm: Normalization of the values
+    :param cmap: Name of the matplotlib colormap
+    :param line_widths: Tuple of the smallest and the largest line width in points
+    :param num_levels: Number of colour and width levels (default: 64)
+    :return: List of PathPatch objects
+    """
+
+    levels = np.minimum((np.clip(np.ma.filled(norm(values), 0), 0, 1) * num_levels).astype(int), num_levels - 1)
+    codes = np.full(len(coordinates), Path.LINETO, dtype=Path.code_type)
+    codes[np.flatnonzero(np.diff(line_index, prepend=-1))] = Path.MOVETO
+
+    # A stable sort keeps the coordinates of every line together and in order
+    order = np.argsort(levels[line_index], kind="stable")
+    bounds = np.searchsorted(levels[line_index][order], np.arange(num_levels + 1))
+    colors = colormaps[cmap]((np.arange(num_levels) + 0.5) / num_levels)
+
+    patches = []
+    for level in range(num_levels):
+        positions = order[bounds[level]:bounds[level + 1]]
+        if len(positions):
+            width = line_widths[0] + (line_widths[1] - line_widths[0]) * level / max(1, num_levels - 1)
+            patches.append(PathPatch(Path(coordinates[positions], codes[positions]), fill=False,
+                                     edgecolor=colors[level], linewidth=width, capstyle="round",
+                                     joinstyle="round", zorder=2 + level / num_levels))
+
+    return patches
+
+
+# Function to render centrality maps without a display
+def render_centrality(
+    centrality_gdf: gpd.GeoDataFrame, 
+    title: str, 
+    filepath: str, 
+    column: str = "centrality", 
+    cmap: str = "magma_r", 
+    line_widths: tuple = (0.3, 3.0), 
+    figsize: tuple = (15, 10), 
+    dpi: int = 100
+):
+    """
+    Renders the centrality as PNG without pyplot: the edges are drawn as a few compound paths
+    on an Agg canvas, colour and line width grow with the centrality. Nothing is shown, so it
+    runs on servers without display
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param title: Title of the map
+    :param filepath: Path to store the file
+    :param column: Column containing the centrality values (default: 'centrality')
+    :param cmap: Name of the matplotlib colormap (default: 'magma_r')
+    :param line_widths: Smallest and largest line width in points (default: (0.3, 3.0))
+    :param figsize: Size of the image in inches (default: (15, 10))
+    :param dpi: Resolution of the image (default: 100)
+    """
+
+    with profiler.stage("write", items=len(centrality_gdf)):
+        coordinates, line_index, values = _get_lines(centrality_gdf, column)
+        norm = Normalize(np.nanmin(values), np.nanmax(values)) if len(values) else Normalize(0, 1)
+
+        figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        for patch in _get_line_patches(coordinates, line_index, values, norm, cmap, line_widths):
+            axes.add_artist(patch)
+        if len(coordinates):
+            (minx, miny), (maxx, maxy) = coordinates.min(axis=0), coordinates.max(axis=0)
+            margin_x, margin_y = 0.02 * (maxx - minx) or 1, 0.02 * (maxy - miny) or 1
+            axes.set_xlim(minx - margin_x, maxx + margin_x)
+            axes.set_ylim(miny - margin_y, maxy + margin_y)
+        axes.set_aspect("equal" if centrality_gdf.crs is None or centrality_gdf.crs.is_projected
+                        else 1 / np.cos(np.radians(np.mean(centrality_gdf.total_bounds[1::2]))))
+        axes.set_title(title)
+        figure.colorbar(ScalarMappable(norm=norm, cmap=cmap), ax=axes, label=column)
+
+        figure.savefig(filepath, format="png")
+
+
+# Function to render map tiles of the centrality
+def render_tiles(
+    centrality_gdf: gpd.GeoDataFrame, 
+    folder: str, 
+    zoom_levels: list, 
+    column: str = "centrality", 
+    cmap: str = "magma_r", 
+    line_widths: tuple = (0.3, 3.0), 
+    tile_size: int = 256
+):
+    """
+    Renders transparent PNG tiles of the centrality in the XYZ scheme of web maps
+    (folder/zoom/x/y.png, web mercator), so large regions can be browsed without one huge
+    image. Coordinates are projected once, the lines are binned into the tiles their bounding
+    boxes cover per zoom level and only tiles with lines are drawn
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param folder: Folder to store the tiles in
+    :param zoom_levels: List of zoom levels
+    :param column: Column containing the centrality values (default: 'centrality')
+    :param cmap: Name of the matplotlib colormap (default: 'magma_r')
+    :param line_widths: Smallest and largest line width in points (default: (0.3, 3.0))
+    :param tile_size: Size of the tiles in pixels (default: 256)
+    :return: Number of rendered tiles
+    """
+
+    half_world = 20037508.342789244
+    num_tiles = 0
+    with profiler.stage("write") as record:
+        coordinates, line_index, values = _get_lines(centrality_gdf, column, crs=3857)
+        if len(coordinates) == 0:
+            return num_tiles
+        norm = Normalize(np.nanmin(values), np.nanmax(values))
+
+        # Bounding box and coordinate range of every line
+        starts = np.flatnonzero(np.diff(line_index, prepend=-1))
+        lengths = np.diff(np.append(starts, len(line_index)))
+        minima = np.minimum.reduceat(coordinates, starts)
+        maxima = np.maximum.reduceat(coordinates, starts)
+
+        figure = Figure(figsize=(1, 1), dpi=tile_size)
+        FigureCanvasAgg(figure)
+        axes = figure.add_axes([0, 0, 1, 1])
+        axes.set_axis_off()
+        patches = []
+
+        for zoom in zoom_levels:
+            tile_extent = 2 * half_world / 2 ** zoom
+
+            # Every line is binned into the tiles of its bounding box once, so only tiles with lines are visited
+            x_first = np.floor((minima[:, 0] + half_world) / tile_extent).astype(np.int64)
+            y_first = np.floor((half_world - maxima[:, 1]) / tile_extent).astype(np.int64)
+            num_y = np.floor((half_world - minima[:, 1]) / tile_extent).astype(np.int64) - y_first + 1
+            num_cells = (np.floor((maxima[:, 0] + half_world) / tile_extent).astype(np.int64) - x_first + 1) * num_y
+
+            tile_lines = np.repeat(np.arange(len(starts)), num_cells)
+            cells = np.arange(len(tile_lines)) - np.repeat(np.cumsum(num_cells) - num_cells, num_cells)
+            tile_x = x_first[tile_lines] + cells // num_y[tile_lines]
+            tile_y = y_first[tile_lines] + cells % num_y[tile_lines]
+
+            order = np.lexsort((tile_lines, tile_y, tile_x))
+            tile_lines, tile_x, tile_y = tile_lines[order], tile_x[order], tile_y[order]
+            tile_starts = np.flatnonzero(np.diff(tile_x, prepend=-1) | np.diff(tile_y, prepend=-1))
+            tile_ends = np.append(tile_starts[1:], len(tile_lines))
+
+            for tile_start, tile_end in zip(tile_starts, tile_ends):
+                x, y = int(tile_x[tile_start]), int(tile_y[tile_start])
+                left, top = -half_world + x * tile_extent, half_world - y * tile_extent
+
+                # Coordinates of the lines of the tile
+                selected = tile_lines[tile_start:tile_end]
+                selected_lengths = lengths[selected]
+                points = np.arange(selected_lengths.sum()) + np.repeat(
+                    starts[selected] - np.cumsum(selected_lengths) + selected_lengths, selected_lengths)
+
+                # Fewer levels are enough for small tiles and keep the drawing overhead low
+                for patch in patches:
+                    patch.remove()
+                patches = _get_line_patches(coordinates[points], line_index[points], values, norm, cmap,
+                                            line_widths, num_levels=16)
+                for patch in patches:
+                    axes.add_artist(patch)
+                axes.set_xlim(left, left + tile_extent)
+                axes.set_ylim(top - tile_extent, top)
+
+                os.makedirs(os.path.join(folder, str(zoom), str(x)), exist_ok=True)
+                figure.savefig(os.path.join(folder, str(zoom), str(x), f"{y}.png"), transparent=True)
+                num_tiles += 1
+
+        record["items"] += num_tiles
+
+    return num_tiles
+
+
+# Function to find columns holding lists, e.g. osmid of merged edges
+def _get_list_columns(centrality_gdf: gpd.GeoDataFrame):
+    """
+    Finds the object columns that contain at least one list
+    :param centrality_gdf: Geodataframe
+    :return: List of column names
+    """
+    return [column for column in centrality_gdf.columns
+            if centrality_gdf[column].dtype == object and column != centrality_gdf.geometry.name
+            and centrality_gdf[column].map(lambda value: isinstance(value, list)).any()]
+
+
+def _writes_index(centrality_gdf: gpd.GeoDataFrame):
+    """
+    Checks if the index is written as columns, which is the case for named or non-integer indexes
+    :param centrality_gdf: Geodataframe
+    :return: True if the index is written
+    """
+    return list(centrality_gdf.index.names) != [None] or not pd.api.types.is_integer_dtype(centrality_gdf.index.dtype)
+
+
+# Function to split a geodataframe into chunks for writing
+def _iter_chunks(centrality_gdf: gpd.GeoDataFrame, chunk_size: int, list_columns: list, lists_as_str: bool):
+    """
+    Yields consecutive row chunks, only the chunk being written is copied. A named index is
+    turned into columns like GeoDataFrame.to_file does
+    :param centrality_gdf: Geodataframe
+    :param chunk_size: Number of rows per chunk
+    :param list_columns: Columns holding lists (see _get_list_columns)
+    :param lists_as_str: Convert lists into strings for formats without list types, otherwise
+        single values are wrapped into lists so that the column has one type
+    :return: Generator of geodataframes
+    """
+
+    write_index = _writes_index(centrality_gdf)
+    for start in range(0, len(centrality_gdf), chunk_size):
+        chunk = centrality_gdf.iloc[start:start + chunk_size]
+        chunk = chunk.reset_index() if write_index else chunk.reset_index(drop=True)
+        if lists_as_str:
+            chunk = chunk.assign(**{column: chunk[column].astype(str) for column in list_columns})
+        else:
+            chunk = chunk.assign(**{column: chunk[column].map(lambda value: value if isinstance(value, list) else [value])
+                                    for column in list_columns})
+        yield chunk
+
+
+# Function to write a geodataframe record by record with fiona
+def _write_records(centrality_gdf: gpd.GeoDataFrame, filepath: str, driver: str, chunk_size: int = None, **options):
+    """
+    Streams the rows of a geodataframe into an OGR data source in chunks, lists are stored as strings
+    :param centrality_gdf: Geodataframe
+    :param filepath: Path to store the file
+    :param driver: OGR driver name
+    :param chunk_size: Number of rows converted at once (default: CHUNK_SIZE)
+    :param options: Layer creation options of the driver
+    """
+
+    try:
+        import fiona
+        from geopandas.io.file import infer_schema
+    except ImportError:
+        raise ImportError(f"Writing {driver} files in chunks requires the fiona package.")
+
+    if len(centrality_gdf) == 0:
+        centrality_gdf.to_file(filepath, driver=driver)
+        return
+
+    chunks = _iter_chunks(centrality_gdf, chunk_size or CHUNK_SIZE, _get_list_columns(centrality_gdf), lists_as_str=True)
+    first_chunk = next(chunks)
+    crs = centrality_gdf.crs.to_wkt() if centrality_gdf.crs is not None else None
+
+    # Property types follow the dtypes shared by all chunks, geometry types are taken from all rows
+    schema = {**infer_schema(first_chunk), "geometry": infer_schema(centrality_gdf)["geometry"]}
+
+    with fiona.open(filepath, "w", driver=driver, schema=schema, crs=crs, **options) as layer:
+        layer.writerecords(first_chunk.iterfeatures(drop_id=True))
+        for chunk in chunks:
+            layer.writerecords(chunk.iterfeatures(drop_id=True))
+
+
+def _get_arrow_schema(centrality_gdf: gpd.GeoDataFrame, list_columns: list):
+    """
+    Derives the arrow schema of all row groups from the whole geodataframe, numeric columns
+    follow their dtype and object columns the values of all rows, so that columns which are
+    empty or hold other values in the first chunk get the same type in every chunk
+    :param centrality_gdf: Geodataframe
+    :param list_columns: Columns holding lists (see _get_list_columns)
+    :return: Arrow schema with the geometry column as WKB
+    """
+
+    import pyarrow as pa
+
+    geometry_name = centrality_gdf.geometry.name
+    frame = pd.DataFrame(centrality_gdf.iloc[:0].drop(columns=geometry_name))
+    frame = frame.reset_index() if _writes_index(centrality_gdf) else frame.reset_index(drop=True)
+    frame[geometry_name] = pd.Series([], dtype=object)
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+
+    for column in frame.columns:
+        if column == geometry_name:
+            column_type = pa.binary()
+        elif frame[column].dtype != object:
+            continue
+        else:
+            values = pd.Series(centrality_gdf[column] if column in centrality_gdf.columns
+                               else centrality_gdf.index.get_level_values(column))
+            if column in list_columns:
+                values = values.explode()
+            values = values.dropna()
+            column_type = pa.infer_type(values.to_numpy(dtype=object)) if len(values) else pa.null()
+            if column in list_columns:
+                column_type = pa.list_(column_type)
+        schema = schema.set(schema.get_field_index(column), pa.field(column, column_type))
+
+    return schema
 
 
 # Function to save geodataframe as geopackage 
-def gdf_to_gpkg(centrality_gdf: gpd.GeoDataFrame, filepath: str):
+def gdf_to_gpkg(centrality_gdf: gpd.GeoDataFrame, filepath: str, chunk_size: int = None):
     """
-    Stores geodataframe as geopackage
+    Stores geodataframe as geopackage, rows are written in chunks and list columns as strings
     :param centrality_gdf: Geodataframe containing centrality values
     :param filepath: Path to store the file
+    :param chunk_size: Number of rows converted at once (default: CHUNK_SIZE)
     """
 
-    # Define filepath
-    geopackage_filename_result = filepath
+    with profiler.stage("write", items=len(centrality_gdf)):
+        # Store Geodataframe as GeoPackage
+        _write_records(centrality_gdf, filepath, "GPKG", chunk_size)
+
+
+# Function to save geodataframe as flatgeobuf
+def gdf_to_fgb(centrality_gdf: gpd.GeoDataFrame, filepath: str, chunk_size: int = None, spatial_index: bool = True):
+    """
+    Stores geodataframe as FlatGeobuf, rows are written in chunks and list columns as strings
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param filepath: Path to store the file
+    :param chunk_size: Number of rows converted at once (default: CHUNK_SIZE)
+    :param spatial_index: Add a packed Hilbert R-tree for fast bounding box queries (default: True)
+    """
+
+    with profiler.stage("write", items=len(centrality_gdf)):
+        _write_records(centrality_gdf, filepath, "FlatGeobuf", chunk_size, SPATIAL_INDEX="YES" if spatial_index else "NO")
+
+
+# Function to save geodataframe as geoparquet
+def gdf_to_parquet(
+    centrality_gdf: gpd.GeoDataFrame, 
+    filepath: str, 
+    chunk_size: int = None, 
+    compression: str = "zstd"
+):
+    """
+    Stores geodataframe as GeoParquet 1.0 with WKB geometries, every chunk becomes one row group
+    and list columns such as osmid are kept as native list columns
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param filepath: Path to store the file
+    :param chunk_size: Number of rows per row group (default: CHUNK_SIZE)
+    :param compression: Parquet compression codec (default: 'zstd')
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing GeoParquet files requires the pyarrow package.")
+
+    with profiler.stage("write", items=len(centrality_gdf)):
+        geometry_name = centrality_gdf.geometry.name
+        geo_metadata = {"version": "1.0.0", "primary_column": geometry_name,
+                        "columns": {geometry_name: {
+                            "encoding": "WKB",
+                            "geometry_types": sorted(set(centrality_gdf.geom_type.dropna())),
+                            "crs": centrality_gdf.crs.to_json_dict() if centrality_gdf.crs is not None else None,
+                            "bbox": [float(bound) for bound in centrality_gdf.total_bounds]}}}
+
+        list_columns = _get_list_columns(centrality_gdf)
+        schema = _get_arrow_schema(centrality_gdf, list_columns)
+        schema = schema.with_metadata({**(schema.metadata or {}), b"geo": json.dumps(geo_metadata).encode("utf-8")})
+
+        writer = None
+        try:
+            for chunk in _iter_chunks(centrality_gdf, chunk_size or CHUNK_SIZE, list_columns, lists_as_str=False):
+                frame = pd.DataFrame(chunk.drop(columns=geometry_name))
+                frame[geometry_name] = shapely.to_wkb(np.asarray(chunk.geometry.values))
+
+                if writer is None:
+                    writer = pq.ParquetWriter(filepath, schema, compression=compression)
+                table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            centrality_gdf.to_parquet(filepath, compression=compression)
+
+
+WRITERS = {"gpkg": ("gpkg", gdf_to_gpkg), "parquet": ("parquet", gdf_to_parquet), "fgb": ("fgb", gdf_to_fgb)}
+
+
+# Function to save geodataframe in one of the output formats
+def write_gdf(centrality_gdf: gpd.GeoDataFrame, filepath: str, output_format: str = "gpkg", chunk_size: int = None):
+    """
+    Stores geodataframe with the writer of the output format
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param filepath: Path to store the file without extension
+    :param output_format: Output format ('gpkg', 'parquet' or 'fgb', see WRITERS)
+    :param chunk_size: Number of rows converted at once (default: CHUNK_SIZE)
+    :return: Path of the stored file
+    """
 
-    # Store Geodataframe as GeoPackage
-    centrality_gdf.to_file(geopackage_filename_result, driver="GPKG")
+    assert output_format in WRITERS, f"output_format must be in {list(WRITERS)}."
 
+    extension, writer = WRITERS[output_format]
+    writer(centrality_gdf, f"{filepath}.{extension}", chunk_size=chunk_size)
 
+    return f"{filepath}.{extension}"
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# graph_arrays.py
+
+"""Compact array representation of graph networks"""
+
+import hashlib
+from multiprocessing import shared_memory
+import numpy as np
+import networkx as nx
+
+
+class GraphArrays:
+    """Compact CSR representation of a graph network"""
+
+    def __init__(
+        self, 
+        node_ids: np.ndarray, 
+        indptr: np.ndarray, 
+        indices: np.ndarray, 
+        edge_ids: np.ndarray, 
+        keys: np.ndarray, 
+        weights: dict
+    ):
+        """
+        Defines compressed sparse row (CSR) arrays of a graph, edges are sorted by source
+        and target node position
+        :param node_ids: Node ids of the graph, the position of a node is its index here
+        :param indptr: CSR offsets, the edges of node i are the slots indptr[i]:indptr[i + 1]
+        :param indices: Target node position of every edge slot (int32)
+        :param edge_ids: Position of every edge slot in graph.edges(keys=True) (int32)
+        :param keys: Edge key of every edge slot (int32)
+        :param weights: Dictionary of edge attribute names to weights of every edge slot (float32)
+        """
+
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_ids = edge_ids
+        self.keys = keys
+        self.weights = weights
+        self.version = None
+        self._routing_arrays = {}
+
+
+    @classmethod
+    def from_graph(
+        cls, 
+        graph: nx.MultiDiGraph, 
+        weights: tuple = ("length", "travel_time"), 
+        weight_dtype: type = np.float32
+    ):
+        """
+        Converts a graph into CSR arrays
+        :param graph: Graph network
+        :param weights: Edge attributes to store as weights, missing values default to 1
+        :param weight_dtype: Data type of the weights (default: float32)
+        :return: GraphArrays of the graph
+        """
+
+        node_ids = np.array(list(graph.nodes))
+        node_positions = {node: position for position, node in enumerate(node_ids)}
+        num_edges = graph.number_of_edges()
+
+        sources = np.fromiter((node_positions[u] for u, _ in graph.edges()), dtype=np.int64, count=num_edges)
+        targets = np.fromiter((node_positions[v] for _, v in graph.edges()), dtype=np.int64, count=num_edges)
+        keys = np.fromiter((key for _, _, key in graph.edges(keys=True)), dtype=np.int32, count=num_edges)
+
+        # Sort edges by source and target node
+        order = np.lexsort((targets, sources))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(node_ids)))]).astype(np.int64)
+
+        edge_weights = {}
+        for weight in weights:
+            values = np.fromiter((w for _, _, w in graph.edges(data=weight, default=1)), dtype=np.float64, count=num_edges)
+            edge_weights[weight] = values[order].astype(weight_dtype)
+
+        arrays = cls(node_ids, indptr, targets[order].astype(np.int32), order.astype(np.int32), keys[order], edge_weights)
+        arrays.version = graph_version(graph)
+
+        return arrays
+
+
+    @property
+    def num_nodes(self):
+        """
+        Returns the number of nodes
+        :return: Number of nodes
+        """
+        return len(self.node_ids)
+
+
+    @property
+    def num_edges(self):
+        """
+        Returns the number of edges
+        :return: Number of edges
+        """
+        return len(self.indices)
+
+
+    @property
+    def nbytes(self):
+        """
+        Returns the memory used by the arrays
+        :return: Number of bytes
+        """
+        return sum(array.nbytes for array in self.to_dict().values())
+
+
+    # Write method to derive a fingerprint of the graph
+    def fingerprint(self):
+        """
+        Derives a hash of nodes, edge order and weights, which changes whenever the graph or
+        its speeds change, so that results computed on another graph are never reused
+        :return: Hex digest of the arrays
+        """
+
+        digest = hashlib.sha1()
+        for name, array in sorted(self.to_dict().items()):
+            digest.update(name.encode("utf-8"))
+            digest.update(np.ascontiguousarray(array).tobytes())
+
+        return digest.hexdigest()[:16]
+
+
+    # Write method to check if the arrays still describe a graph
+    def matches(self, graph: nx.MultiDiGraph):
+        """
+        Checks whether the arrays were built from the current version of a graph (see graph_version)
+        :param graph: Graph network
+        :return: True if the version of the graph did not change
+        """
+        return self.version is not None and self.version == graph_version(graph)
+
+
+    # Write method to convert node ids into node positions
+    def node_positions(self, node_ids: np.ndarray):
+        """
+        Converts node ids into positions of the CSR arrays
+        :param node_ids: Array of node ids
+        :return: Array of node positions
+        """
+
+        sorter = np.argsort(self.node_ids)
+        return sorter[np.searchsorted(self.node_ids, node_ids, sorter=sorter)]
+
+
+    # Write method to map edge slots back to graph edges
+    def edge_tuples(self, slots: np.ndarray = None):
+        """
+        Maps CSR edge slots back to (u, v, key) tuples of the graph
+        :param slots: Array of edge slots (default: all slots)
+        :return: List of (u, v, key) tuples
+        """
+
+        if slots is None:
+            slots = np.arange(self.num_edges)
+        sources = np.searchsorted(self.indptr, slots, side="right") - 1
+
+        return list(zip(self.node_ids[sources].tolist(), self.node_ids[self.indices[slots]].tolist(), self.keys[slots].tolist()))
+
+
+    # Write method to get the arrays used for shortest path searches
+    def routing_arrays(self, weight: str = "length"):
+        """
+        Returns CSR arrays for shortest path searches which only keep the cheapest of parallel
+        edges, as it is the only one shortest paths can use
+        :param weight: Edge attribute used as weight
+        :return: Dictionary of CSR arrays ('indptr', 'indices', 'weights', 'pair_keys' with
+            source * num_nodes + target of every slot and 'edge_positions' pointing into the
+            edge order of graph.edges(keys=True))
+        """
+
+        if weight not in self._routing_arrays:
+            self._routing_arrays[weight] = self.build_routing_arrays(self.weights[weight])
+
+        return self._routing_arrays[weight]
+
+
+    # Write method to build routing arrays from changed weights
+    def build_routing_arrays(self, weights: np.ndarray):
+        """
+        Builds the arrays of routing_arrays from weights per edge slot without caching them,
+        slots with an infinite weight are left out, e.g. closed streets
+        :param weights: Weight of every edge slot
+        :return: Dictionary of CSR arrays (see routing_arrays)
+        """
+
+        sources = np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(self.indptr))
+        pair_keys = sources * self.num_nodes + self.indices
+
+        # Edges are sorted by node pair, so sort by weight within each pair and keep the first
+        order = np.lexsort((weights, pair_keys))
+        order = order[np.isfinite(weights[order])]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_keys[order][1:] != pair_keys[order][:-1]
+        order = order[first]
+
+        return {
+            "indptr": np.concatenate([[0], np.cumsum(np.bincount(sources[order], minlength=self.num_nodes))]).astype(np.int64),
+            "indices": self.indices[order],
+            "weights": weights[order],
+            "pair_keys": pair_keys[order],
+            "edge_positions": self.edge_ids[order],
+        }
+
+
+    # Write method to convert the arrays into a dictionary
+    def to_dict(self):
+        """
+        Converts the arrays into a flat dictionary, e.g. to place them in shared memory
+        :return: Dictionary of numpy arrays
+        """
+
+        arrays = {"node_ids": self.node_ids, "indptr": self.indptr, "indices": self.indices,
+                  "edge_ids": self.edge_ids, "keys": self.keys}
+        arrays.update({f"weight_{name}": values for name, values in self.weights.items()})
+
+        return arrays
+
+
+    @classmethod
+    def from_dict(cls, arrays: dict):
+        """
+        Creates GraphArrays from a dictionary as returned by to_dict
+        :param arrays: Dictionary of numpy arrays
+        :return: GraphArrays
+        """
+
+        weights = {name[len("weight_"):]: values for name, values in arrays.items() if name.startswith("weight_")}
+        return cls(arrays["node_ids"], arrays["indptr"], arrays["indices"], arrays["edge_ids"], arrays["keys"], weights)
+
+
+# Function to get the version of a graph
+def graph_version(graph: nx.MultiDiGraph):
+    """
+    Returns the version of a graph, which changes with its node and edge count and with every
+    change announced by raising graph.graph['version'] (see CityAnalyzer.refresh_graph). Weights
+    are not compared, hashing all edges would cost as much as building the arrays again
+    :param graph: Graph network
+    :return: Tuple of the announced version, number of nodes and number of edges
+    """
+    return graph.graph.get("version", 0), graph.number_of_nodes(), graph.number_of_edges()
+
+
+# Function to copy arrays into shared memory
+def share_arrays(arrays: dict):
+    """
+    Copies arrays into shared memory blocks so that worker processes can read them without copies
+    :param arrays: Dictionary of numpy arrays
+    :return: Tuple of the list of shared memory blocks (to be closed and unlinked by the caller)
+        and a picklable description of the arrays (see attach_arrays)
+    """
+
+    blocks = []
+    spec = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+
+    return blocks, spec
+
+
+# Function to attach arrays from shared memory
+def attach_arrays(spec: dict):
+    """
+    Attaches to arrays previously copied into shared memory, the arrays are read only
+    :param spec: Description of the arrays as returned by share_arrays
+    :return: Tuple of the list of shared memory blocks (to be kept alive and closed by the
+        caller) and a dictionary of numpy arrays
+    """
+
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays[name] = array
+
+    return blocks, arrays
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# graph_store.py
+
+"""Local storage of processed graph networks and city polygons"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import osmnx as ox
+import networkx as nx
+import geopandas as gpd
+
+
+class GraphStore:
+    """On-disk Store of Speed Annotated Graphs and City Polygons"""
+
+    def __init__(self, cache_dir: str = "../cache"):
+        """
+        Defines a store in a local folder, the files are unpickled when they are loaded, so the
+        folder must only be writable by trusted users
+        :param cache_dir: Folder to store the files in
+        """
+        assert isinstance(cache_dir, str), "cache_dir must be of type str."
+
+        self.cache_dir = cache_dir
+
+
+    # Write method to derive the key of a city
+    def get_key(
+        self,
+        city_name: str,
+        network_type: str = "drive",
+        hwy_speeds: dict = None,
+        osm_file: str = None,
+        clipped: bool = False
+    ):
+        """
+        Derives the key of an entry from place name, network type and speed table,
+        so that changing the speeds does not reuse outdated travel times. Graphs of a local
+        extract are also keyed by its path and modification time and by whether they were
+        clipped to a polygon, so they never share an entry with downloaded graphs
+        :param city_name: Name of the city
+        :param network_type: OSMnx network type
+        :param hwy_speeds: Travel speeds per highway type
+        :param osm_file: Local extract the graph is built from (optional)
+        :param clipped: The graph of the extract is clipped to a polygon (default: False)
+        :return: Key of the entry
+        """
+
+        parts = [city_name, network_type, sorted((hwy_speeds or {}).items())]
+        if osm_file is not None:
+            parts.append([os.path.abspath(osm_file), os.path.getmtime(osm_file), clipped])
+        payload = json.dumps(parts)
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+        name = re.sub(r"[^A-Za-z0-9]+", "_", city_name).strip("_")
+
+        return f"{name}_{network_type}_{digest}"
+
+
+    def _get_path(self, key: str, kind: str):
+        """
+        Returns the path of a stored file
+        :param key: Key of the entry
+        :param kind: Kind of the stored object ('graph', 'poly' or 'router_<weight>_<fingerprint>')
+        :return: Path of the file
+        """
+        return os.path.join(self.cache_dir, f"{key}.{kind}.pickle")
+
+
+    def _load(self, key: str, kind: str):
+        """
+        Loads a stored object
+        :param key: Key of the entry
+        :param kind: Kind of the stored object ('graph', 'poly' or 'router_<weight>_<fingerprint>')
+        :return: Stored object or None if it does not exist
+        """
+
+        path = self._get_path(key, kind)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+    def _save(self, key: str, kind: str, obj):
+        """
+        Stores an object, the file is written under a temporary name first so that
+        concurrent readers never see a partial file
+        :param key: Key of the entry
+        :param kind: Kind of the stored object ('graph', 'poly' or 'router_<weight>_<fingerprint>')
+        :param obj: Object to store
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_path(key, kind)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(temp_path, "wb") as file:
+            pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+
+    # Write method to load a graph
+    def load_graph(self, key: str):
+        """
+        Loads a stored graph
+        :param key: Key of the entry
+        :return: Graph network or None if it is not stored
+        """
+        return self._load(key, "graph")
+
+
+    # Write method to store a graph
+    def save_graph(self, key: str, city_graph: nx.MultiDiGraph):
+        """
+        Stores a graph
+        :param key: Key of the entry
+        :param city_graph: Graph network
+        """
+        self._save(key, "graph", city_graph)
+
+
+    # Write method to load a city polygon
+    def load_poly(self, key: str):
+        """
+        Loads a stored city polygon
+        :param key: Key of the entry
+        :return: Polygon of the city as geodataframe or None if it is not stored
+        """
+        return self._load(key, "poly")
+
+
+    # Write method to store a city polygon
+    def save_poly(self, key: str, poly: gpd.GeoDataFrame):
+        """
+        Stores a city polygon
+        :param key: Key of the entry
+        :param poly: Polygon of the city as geodataframe
+        """
+        self._save(key, "poly", poly)
+
+
+    # Write method to load a preprocessed router
+    def load_router(self, key: str, weight: str, fingerprint: str):
+        """
+        Loads a stored router of a graph and weight
+        :param key: Key of the entry
+        :param weight: Edge attribute used as weight
+        :param fingerprint: Fingerprint of the graph arrays the router was built from
+        :return: LandmarkRouter or None if it is not stored
+        """
+        return self._load(key, f"router_{weight}_{fingerprint}")
+
+
+    # Write method to store a preprocessed router
+    def save_router(self, key: str, router):
+        """
+        Stores a router next to its graph, routers of other graph versions are kept apart by their fingerprint
+        :param key: Key of the entry
+        :param router: LandmarkRouter
+        """
+        self._save(key, f"router_{router.weight}_{router.fingerprint}", router)
+
+
+# Function to build a graph from a local OSM extract
+def graph_from_osm_file(filepath: str, poly: gpd.GeoDataFrame = None, network_type: str = "drive"):
+    """
+    Builds a graph network from a local .osm (optionally .bz2 compressed) or .pbf extract
+    without network access, .pbf files require the pyrosm package. Ways of .osm files are
+    filtered like osmnx filters downloads of the network type
+    :param filepath: Path to the OSM extract
+    :param poly: Polygon to truncate the graph to (optional)
+    :param network_type: OSMnx network type (default: 'drive')
+    :return: Graph network
+    """
+
+    print(f"Starting to build graph from local extract '{filepath}'..")
+
+    if filepath.endswith(".pbf"):
+        try:
+            import pyrosm
+        except ImportError:
+            raise ImportError("Reading .pbf extracts requires the pyrosm package.")
+
+        pyrosm_types = {"drive": "driving", "walk": "walking", "bike": "cycling", "all": "all"}
+        bounding_box = None if poly is None else poly.geometry.iloc[0]
+        osm = pyrosm.OSM(filepath, bounding_box=bounding_box)
+        nodes, edges = osm.get_network(network_type=pyrosm_types.get(network_type, "driving"), nodes=True)
+        city_graph = osm.to_graph(nodes, edges, graph_type="networkx", osmnx_compatible=True)
+
+    else:
+        # Keep the tags of the filter until the ways are filtered
+        rules = get_way_rules(network_type)
+        useful_tags = ox.settings.useful_tags_way
+        ox.settings.useful_tags_way = list(dict.fromkeys(useful_tags + [tag for tag, _, _ in rules]))
+        try:
+            city_graph = ox.graph_from_xml(filepath, simplify=False, retain_all=True)
+        finally:
+            ox.settings.useful_tags_way = useful_tags
+
+        city_graph = filter_ways(city_graph, rules, useful_tags)
+        city_graph = ox.simplify_graph(city_graph)
+        if poly is not None:
+            city_graph = ox.truncate.truncate_graph_polygon(city_graph, poly.geometry.iloc[0])
+        city_graph = ox.truncate.largest_component(city_graph)
+
+    print("Done. Graph built from local extract.")
+    return city_graph
+
+
+# Function to read the way filter of a network type
+def get_way_rules(network_type: str = "drive"):
+    """
+    Converts the overpass filter osmnx downloads a network type with into rules
+    :param network_type: OSMnx network type (default: 'drive')
+    :return: List of (tag, operator, pattern) tuples, an empty operator requires the tag
+    """
+    return re.findall(r'\["([^"]+)"(?:(!?~)"([^"]*)")?\]', ox._overpass._get_osm_filter(network_type))
+
+
+# Function to remove the ways that do not match a filter
+def filter_ways(city_graph: nx.MultiDiGraph, rules: list, useful_tags: list):
+    """
+    Removes the edges that do not match all rules like overpass does, where a negated pattern
+    also matches a missing tag, and the nodes left without edges
+    :param city_graph: Unsimplified graph network
+    :param rules: List of (tag, operator, pattern) tuples (see get_way_rules)
+    :param useful_tags: Edge attributes kept, tags only needed by the rules are removed
+    :return: Filtered graph network
+    """
+
+    removed = []
+    for u, v, key, data in city_graph.edges(keys=True, data=True):
+        for tag, operator, pattern in rules:
+            value = data.get(tag)
+            matched = value is not None and (not operator or re.search(pattern, str(value)) is not None)
+            if matched == (operator == "!~"):
+                removed.append((u, v, key))
+                break
+
+    city_graph = city_graph.copy()
+    city_graph.remove_edges_from(removed)
+    city_graph.remove_nodes_from([node for node, degree in dict(city_graph.degree()).items() if degree == 0])
+
+    for _, _, data in city_graph.edges(data=True):
+        for tag in [tag for tag, _, _ in rules if tag not in useful_tags]:
+            data.pop(tag, None)
+
+    return city_graph
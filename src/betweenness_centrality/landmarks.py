@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# landmarks.py
+
+"""Point-to-point routing with A* and landmark lower bounds (ALT)"""
+
+import heapq
+import numpy as np
+import networkx as nx
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from betweenness_centrality.graph_arrays import GraphArrays
+
+
+class LandmarkRouter:
+    """Preprocessed A* Search with Landmark Lower Bounds on CSR Arrays"""
+
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        arrays: dict,
+        landmarks: np.ndarray,
+        forward: np.ndarray,
+        backward: np.ndarray,
+        weight: str,
+        fingerprint: str
+    ):
+        """
+        Defines a router from preprocessed landmark distances, see from_graph
+        :param node_ids: Node ids of the graph, the position of a node is its index here
+        :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+        :param landmarks: Node positions of the landmarks
+        :param forward: Array of shape (landmarks, nodes) with the distances from every landmark
+        :param backward: Array of shape (landmarks, nodes) with the distances to every landmark
+        :param weight: Edge attribute used as weight
+        :param fingerprint: Fingerprint of the graph arrays (see GraphArrays.fingerprint)
+        """
+
+        self.node_ids = node_ids
+        self.arrays = arrays
+        self.landmarks = landmarks
+        self.forward = forward
+        self.backward = backward
+        self.weight = weight
+        self.fingerprint = fingerprint
+        self._lists = None
+        self._positions = None
+
+
+    @classmethod
+    def from_graph(
+        cls,
+        graph: nx.MultiDiGraph,
+        weight: str = "length",
+        num_landmarks: int = 16,
+        rng: np.random.Generator = None
+    ):
+        """
+        Selects landmarks far apart from each other and stores the distances from and to all of
+        them. Each landmark is the node whose distance to the closest landmark selected so far is
+        largest, the first one is the node farthest from a random node
+        :param graph: Graph network
+        :param weight: Edge attribute used as weight (default: 'length')
+        :param num_landmarks: Number of landmarks (default: 16)
+        :param rng: Seed or numpy random generator for the first node (optional)
+        :return: LandmarkRouter of the graph
+        """
+
+        graph_arrays = cls.get_graph_arrays(graph, weight)
+        arrays = graph_arrays.routing_arrays(weight)
+        num_nodes = graph_arrays.num_nodes
+        num_landmarks = min(num_landmarks, num_nodes)
+
+        csgraph = csr_matrix((arrays["weights"], arrays["indices"], arrays["indptr"]), shape=(num_nodes, num_nodes))
+        transposed = csgraph.transpose().tocsr()
+
+        # Start far away from a random node, unreachable nodes never become landmarks
+        start = dijkstra(csgraph, indices=np.random.default_rng(rng).integers(num_nodes))
+        candidate = int(np.argmax(np.where(np.isfinite(start), start, -1)))
+
+        landmarks, forward, backward = [], [], []
+        closest = np.full(num_nodes, np.inf)
+        for _ in range(num_landmarks):
+            landmarks.append(candidate)
+            forward.append(dijkstra(csgraph, indices=candidate))
+            backward.append(dijkstra(transposed, indices=candidate))
+
+            round_trip = forward[-1] + backward[-1]
+            closest = np.minimum(closest, np.where(np.isfinite(round_trip), round_trip, -1))
+            closest[landmarks] = -1
+            candidate = int(np.argmax(closest))
+
+        return cls(graph_arrays.node_ids, arrays, np.array(landmarks), np.array(forward), np.array(backward),
+                   weight, graph_arrays.fingerprint())
+
+
+    @staticmethod
+    def get_graph_arrays(graph: nx.MultiDiGraph, weight: str = "length"):
+        """
+        Converts a graph into the double precision arrays the router searches on, their
+        fingerprint identifies stored routers of the same graph
+        :param graph: Graph network
+        :param weight: Edge attribute used as weight
+        :return: GraphArrays with the weight only
+        """
+        return GraphArrays.from_graph(graph, weights=(weight,), weight_dtype=np.float64)
+
+
+    def __getstate__(self):
+        """
+        Stores the arrays only, python lists are rebuilt after loading
+        :return: Dictionary of the state
+        """
+        return {**self.__dict__, "_lists": None, "_positions": None}
+
+
+    # Write method to bound the distance of all nodes to a target
+    def get_potentials(self, source: int, target: int, num_active: int = 4):
+        """
+        Computes lower bounds of the distance of every node to the target from the triangle
+        inequality d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L). Only the
+        num_active landmarks with the best bound for the source are used, the bounds are scaled
+        down slightly so that rounding never overestimates a distance
+        :param source: Node position of the source
+        :param target: Node position of the target
+        :param num_active: Number of landmarks used (default: 4)
+        :return: Array of lower bounds per node position
+        """
+
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(self.forward[:, target] - self.forward[:, source],
+                                self.backward[:, source] - self.backward[:, target])
+            active = np.argsort(-np.nan_to_num(bounds, nan=-np.inf))[:num_active]
+
+            potentials = np.maximum(self.forward[active, target][:, None] - self.forward[active],
+                                    self.backward[active] - self.backward[active, target][:, None])
+            potentials = np.nan_to_num(potentials, nan=-np.inf, posinf=np.inf).max(axis=0)
+
+        return np.maximum(potentials, 0) * (1 - 1e-9)
+
+
+    # Write method to search the shortest path between two node positions
+    def search(self, source: int, target: int):
+        """
+        Runs A* from source to target with the landmark lower bounds as potentials, parallel
+        edges are weighted by their cheapest edge like in networkx
+        :param source: Node position of the source
+        :param target: Node position of the target
+        :return: Tuple of the list of node positions (None if there is no route) and the number of settled nodes
+        """
+
+        if self._lists is None:
+            self._lists = (self.arrays["indptr"].tolist(), self.arrays["indices"].tolist(), self.arrays["weights"].tolist())
+        indptr, indices, weights = self._lists
+
+        potentials = self.get_potentials(source, target)
+        if not np.isfinite(potentials[source]):
+            return None, 0
+
+        distances = {source: 0.0}
+        predecessors = {source: None}
+        settled = set()
+        heap = [(potentials[source], source)]
+
+        while heap:
+            _, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == target:
+                break
+
+            distance = distances[node]
+            for slot in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[slot]
+                neighbour_distance = distance + weights[slot]
+                if neighbour not in settled and neighbour_distance < distances.get(neighbour, np.inf):
+                    distances[neighbour] = neighbour_distance
+                    predecessors[neighbour] = node
+                    heapq.heappush(heap, (neighbour_distance + potentials[neighbour], neighbour))
+
+        if target not in settled:
+            return None, len(settled)
+
+        path = [target]
+        while predecessors[path[-1]] is not None:
+            path.append(predecessors[path[-1]])
+        path.reverse()
+
+        return path, len(settled)
+
+
+    # Write method to route between two nodes
+    def shortest_path(self, origin_node, destination_node):
+        """
+        Returns the shortest route between two node ids like ox.shortest_path
+        :param origin_node: Node id of the origin
+        :param destination_node: Node id of the destination
+        :return: List of node ids of the route, None if there is no route
+        """
+
+        if self._positions is None:
+            self._positions = {node: position for position, node in enumerate(self.node_ids.tolist())}
+
+        path, _ = self.search(self._positions[origin_node], self._positions[destination_node])
+
+        return None if path is None else self.node_ids[path].tolist()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pipeline.py
+
+"""Functions to run a complete centrality analysis of a city"""
+
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+import osmnx as ox
+import networkx as nx
+from betweenness_centrality import centrality, profiler, routing
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.regional import TiledRegion, TileGraphLoader
+from betweenness_centrality.raster_analyzer import RasterAnalyzer
+from betweenness_centrality.result_cache import ResultCache, to_snapshot, from_snapshot
+import betweenness_centrality.file_handler as file_handler
+
+RASTER_PATH = "../data/GHS_POP_WGS84.tif"
+ROUTE_TYPES = ["length", "travel_time"]
+BLOCK_ROUTES = 100
+
+
+# Function to derive the name of the output files of an analysis
+def get_output_name(city: str, method: str, route_type: str, num_routes: int):
+    """
+    Derives the name of output folder and files of an analysis
+    :param city: Name of the city
+    :param method: Method to calculate betweenness centrality
+    :param route_type: Route type ('length' or 'travel_time')
+    :param num_routes: Number of routes
+    :return: Name of the output folder and files
+    """
+    return f"{city}_{method}_{route_type}_{num_routes}"
+
+
+# Function to calculate the centrality of a city with one of the methods
+def compute_centrality(
+    study_area: CityAnalyzer,
+    method: str,
+    route_type: str,
+    num_routes: int,
+    raster_path: str = RASTER_PATH,
+    seed: int = None,
+    tolerance: float = None,
+    num_workers: int = 1,
+    sample_sources: int = None,
+    rel_error: float = None,
+    source_weights: str = "uniform",
+    backend: str = "networkx",
+    result_cache: ResultCache = None,
+    dissolve_by: str = None
+):
+    """
+    Calculates betweenness centrality of a city with the geographical, geographicalPop or networkx method
+    :param study_area: CityAnalyzer of the city
+    :param method: Method to calculate betweenness centrality ('geographical', 'geographicalPop' or 'networkx')
+    :param route_type: Route type ('length' or 'travel_time')
+    :param num_routes: Number of routes, route budget if tolerance is given
+    :param raster_path: Path to the population raster
+    :param seed: Seed for reproducible runs (optional)
+    :param tolerance: Convergence tolerance of the geographical methods (optional, see CityAnalyzer.get_streaming_counts)
+    :param num_workers: Number of processes (default: 1)
+    :param sample_sources: Number of sampled sources of the networkx method (optional)
+    :param rel_error: Target relative standard error of the networkx method (optional)
+    :param source_weights: Sampling of sources of the networkx method ('uniform' or 'population')
+    :param backend: Brandes implementation of the networkx method ('networkx' or 'arrays')
+    :param result_cache: Store of edge counts of the geographical methods, only routes beyond
+        the cached ones are computed, runs without seed do not use it (optional, see get_cached_counts)
+    :param dissolve_by: Merge the edges of every street of the geographical methods by 'osmid' or 'name'
+        (optional, see CityAnalyzer.dissolve_streets)
+    :return: Tuple of the centrality geodataframe and the plot title
+    """
+
+    num_points = num_routes * 2
+
+    # Method networkx
+    if method == "networkx":
+        header = f"NetworkX, route type: {route_type}"
+
+        # Weight sampled sources by the population around each node
+        node_weights = None
+        if source_weights == "population":
+            raster = RasterAnalyzer(raster_path)
+            raster.open()
+            nodes = ox.graph_to_gdfs(study_area.city_graph, edges=False)
+            node_weights = raster.get_point_values(nodes, drop_zero=False)["raster_value"].values
+
+        centrality_gdf = study_area.get_netcentrality(route_type, k=sample_sources, rel_error=rel_error,
+                                                      source_weights=node_weights, rng=seed,
+                                                      backend=backend, num_workers=num_workers)
+        return centrality_gdf, header
+
+    # Method geographical
+    if method == "geographical":
+        header = f"Geographical, route type: {route_type}"
+        area_poly = study_area.get_poly()
+        sample_points = partial(study_area.get_points, area_poly)
+        strategy = "pairwise"
+
+    # Method geographicalPop
+    elif method == "geographicalPop":
+        header = f"GeographicalPop, route type: {route_type}"
+        raster = RasterAnalyzer(raster_path)
+        raster.open()
+        area_poly = study_area.get_poly()
+        sample_points = partial(raster.get_population_points, area_poly)
+        strategy = "grouped"
+
+    else:
+        raise ValueError(f"Wrong method selected: '{method}'.")
+
+    # Extend cached counts by the missing routes, runs with a tolerance decide their route count themselves
+    # and runs without seed draw new routes every time
+    if result_cache is not None and tolerance is None and seed is not None:
+        edge_counts = get_cached_counts(study_area, method, route_type, num_routes, sample_points, strategy,
+                                        result_cache, seed=seed, num_workers=num_workers)
+        centrality_gdf = study_area.get_count_centrality(edge_counts)
+
+    # Add routes until the centrality converges or route all requested routes at once
+    elif tolerance is not None:
+        area_points = sample_points(num_points, rng=seed)
+        edge_counts, _, _ = study_area.get_streaming_counts(area_points, num_routes, route_type, tolerance,
+                                                             rng=seed, num_workers=num_workers)
+        centrality_gdf = study_area.get_count_centrality(edge_counts)
+    else:
+        area_points = sample_points(num_points, rng=seed)
+        area_routes = study_area.get_routes(area_points, num_routes, route_type, rng=seed, strategy=strategy)
+        centrality_gdf = study_area.get_geocentrality(area_routes)
+
+    if dissolve_by is not None:
+        centrality_gdf = study_area.dissolve_streets(centrality_gdf, dissolve_by)
+
+    return centrality_gdf, header
+
+
+# Function to calculate the centrality of a region tile by tile
+def compute_tiled_centrality(
+    region_name: str,
+    method: str,
+    route_type: str,
+    num_routes: int,
+    tile_size: float,
+    buffer: float = 500.0,
+    raster_path: str = RASTER_PATH,
+    seed: int = None,
+    num_workers: int = 1,
+    store: GraphStore = None,
+    osm_file: str = None,
+    work_dir: str = "../cache/regions"
+):
+    """
+    Calculates the geographical or geographicalPop centrality of a region that is too large
+    for one graph, the graphs of the tiles are loaded one at a time per process and a stopped
+    run continues with the missing tiles (see regional.TiledRegion.count_routes)
+    :param region_name: Name of the region
+    :param method: Method to calculate betweenness centrality ('geographical' or 'geographicalPop')
+    :param route_type: Route type ('length' or 'travel_time')
+    :param num_routes: Number of routes
+    :param tile_size: Edge length of the tiles in meters
+    :param buffer: Overlap of the tile graphs with their neighbours in meters (default: 500)
+    :param raster_path: Path to the population raster
+    :param seed: Seed for reproducible and resumable runs (optional)
+    :param num_workers: Number of processes (default: 1)
+    :param store: Local store of the polygon and the tile graphs (optional)
+    :param osm_file: Local .osm or .pbf extract to build the tile graphs from (optional)
+    :param work_dir: Folder the intermediate results of the runs are stored in
+    :return: Tuple of the centrality geodataframe and the plot title
+    """
+
+    # The analyzer of the whole region only provides polygon and points, its graph is never loaded
+    study_area = CityAnalyzer(region_name, city_graph=nx.MultiDiGraph(crs="epsg:4326"), store=store)
+    area_poly = study_area.get_poly()
+
+    if method == "geographical":
+        header = f"Geographical, route type: {route_type}"
+        sample_points = partial(study_area.get_points, area_poly)
+    elif method == "geographicalPop":
+        header = f"GeographicalPop, route type: {route_type}"
+        raster = RasterAnalyzer(raster_path)
+        raster.open()
+        sample_points = partial(raster.get_population_points, area_poly)
+    else:
+        raise ValueError(f"Tiled analysis supports the geographical methods only, got '{method}'.")
+
+    graph_loader = TileGraphLoader(osm_file, store.cache_dir if store is not None else None)
+    region = TiledRegion(region_name, area_poly, work_dir, tile_size, buffer, graph_loader)
+    run_dir = region.count_routes(sample_points, num_routes, route_type, seed=seed, num_workers=num_workers,
+                                  label=method)
+
+    return region.get_count_centrality(run_dir), header
+
+
+# Function to count edge traversals with a cache of earlier runs
+def get_cached_counts(
+    study_area: CityAnalyzer,
+    method: str,
+    route_type: str,
+    num_routes: int,
+    sample_points,
+    strategy: str,
+    result_cache: ResultCache,
+    seed: int = None,
+    num_workers: int = 1,
+    block_routes: int = BLOCK_ROUTES
+):
+    """
+    Counts the edge traversals of num_routes random routes and reuses earlier runs of the same
+    graph, method, route type and seed. The routes are drawn in blocks of block_routes routes,
+    every block with its own points and a random stream derived from the seed and the block
+    number, so the counts of a run do not depend on the runs cached before it. The counts after
+    the last whole block of a run are cached as snapshot and a later run continues from the
+    largest snapshot below it, so 500, 2000 and 10000 routes cost 10000 routes in total
+    :param study_area: CityAnalyzer of the city
+    :param method: Method to calculate betweenness centrality ('geographical' or 'geographicalPop')
+    :param route_type: Route type ('length' or 'travel_time')
+    :param num_routes: Number of routes
+    :param sample_points: Function drawing points from the number of points and rng, e.g. CityAnalyzer.get_points
+        with the polygon bound
+    :param strategy: Routing strategy ('pairwise' or 'grouped', see CityAnalyzer.get_routes)
+    :param result_cache: Store of the edge counts
+    :param seed: Seed of the run, runs without seed cannot be reused
+    :param num_workers: Number of processes (default: 1)
+    :param block_routes: Number of routes per block (default: 100)
+    :return: Array with the number of traversals per edge
+    """
+
+    if seed is None:
+        raise ValueError("Cached counts need a seed, runs without seed draw new routes every time.")
+
+    arrays = study_area.graph_arrays
+    key = result_cache.get_key(study_area.get_name(), arrays.fingerprint(), method, route_type, seed, block_routes)
+    entry = result_cache.load(key)
+    if entry is None:
+        entry = {"entropy": np.random.SeedSequence(seed).entropy,
+                 "snapshots": {0: to_snapshot(np.zeros(arrays.num_edges, dtype=np.int64))}}
+
+    # Only whole blocks are cached, the routes of a last partial block are computed every time
+    num_blocks = num_routes // block_routes
+    base = max(cached for cached in entry["snapshots"] if cached <= num_blocks * block_routes)
+    edge_counts = from_snapshot(entry["snapshots"][base], arrays.num_edges)
+
+    if base == num_routes:
+        print(f"Done. {num_routes} routes served from the result cache.")
+        return edge_counts
+
+    print(f"Starting to extend {base} cached routes to {num_routes} routes..")
+
+    for block in range(base // block_routes, num_blocks):
+        edge_counts += _count_block(study_area, entry["entropy"], block, block_routes, route_type, sample_points,
+                                    strategy, num_workers, block_routes)
+    if num_blocks * block_routes > base:
+        entry["snapshots"][num_blocks * block_routes] = to_snapshot(edge_counts)
+        result_cache.save(key, entry)
+
+    if num_routes > num_blocks * block_routes:
+        edge_counts = edge_counts + _count_block(study_area, entry["entropy"], num_blocks,
+                                                 num_routes - num_blocks * block_routes, route_type, sample_points,
+                                                 strategy, num_workers, block_routes)
+
+    print(f"Done. {num_routes - base} routes computed, {num_blocks * block_routes} routes in the result cache.")
+
+    return edge_counts
+
+
+# Function to count the routes of one block of a cached run
+def _count_block(
+    study_area: CityAnalyzer,
+    entropy: int,
+    block: int,
+    num_routes: int,
+    route_type: str,
+    sample_points,
+    strategy: str,
+    num_workers: int,
+    block_routes: int
+):
+    """
+    Draws the points of a block and counts its routes with the random stream of the block, the
+    points of a whole block are drawn even for fewer routes so that the routes of a partial
+    block are the first routes of the whole block
+    :param study_area: CityAnalyzer of the city
+    :param entropy: Entropy of the seed of the run
+    :param block: Number of the block
+    :param num_routes: Number of routes to count, at most block_routes
+    :param route_type: Route type ('length' or 'travel_time')
+    :param sample_points: Function drawing points from the number of points and rng
+    :param strategy: Routing strategy ('pairwise' or 'grouped')
+    :param num_workers: Number of processes
+    :param block_routes: Number of routes per block
+    :return: Array with the number of traversals per edge
+    """
+
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(block,)))
+    point_nodes = study_area.snap_points(sample_points(2 * block_routes, rng=rng))
+
+    return study_area._count_routes(point_nodes, num_routes, route_type, rng, strategy, num_workers)
+
+
+# Function to calculate the centrality of a city with all methods and route types at once
+def compute_all_variants(
+    study_area: CityAnalyzer,
+    num_routes: int,
+    raster_path: str = RASTER_PATH,
+    seed: int = None,
+    num_workers: int = 1
+):
+    """
+    Calculates the geographical, geographicalPop and networkx centrality for both route types
+    in one pass: the points of each geographical method are snapped and paired once and used
+    for both route types, and the routes are followed on the shortest path trees of the exact
+    networkx computation, so every route type needs a single Brandes pass
+    :param study_area: CityAnalyzer of the city
+    :param num_routes: Number of routes of the geographical methods
+    :param raster_path: Path to the population raster
+    :param seed: Seed for reproducible runs (optional)
+    :param num_workers: Number of processes (default: 1)
+    :return: Geodataframe containing osmid, geometry and one column 'centrality_<method>_<route type>'
+        per variant
+    """
+
+    if study_area.contraction is not None:
+        raise ValueError("The networkx variants are not supported on contracted graphs, load the city without contract")
+
+    rng = np.random.default_rng(seed)
+    num_points = num_routes * 2
+    arrays = study_area.graph_arrays
+
+    raster = RasterAnalyzer(raster_path)
+    raster.open()
+    area_poly = study_area.get_poly()
+    point_sets = {"geographical": study_area.get_points(area_poly, num_points, rng=rng),
+                  "geographicalPop": raster.get_population_points(area_poly, num_points, rng=rng)}
+
+    # Snap the points and draw the origin destination pairs once per method
+    point_positions = {}
+    route_targets = []
+    for method, area_points in point_sets.items():
+        point_positions[method] = arrays.node_positions(study_area.snap_points(area_points))
+        origins, destinations = routing.draw_od_pairs(point_positions[method], num_routes, rng)
+        targets = {}
+        for origin, destination in zip(origins.tolist(), destinations.tolist()):
+            targets.setdefault(origin, []).append(destination)
+        route_targets.append(targets)
+
+    columns = {}
+    for route_type in ROUTE_TYPES:
+        print(f"Starting to compute all methods for route type {route_type}.. Please wait..")
+
+        with profiler.stage("routing", items=study_area.city_graph.number_of_nodes()):
+            values, route_counts, unrouted = centrality.routed_edge_betweenness(
+                study_area.city_graph, route_targets, route_type, num_workers=num_workers)
+        columns[f"centrality_networkx_{route_type}"] = values
+
+        for targets, (method, positions), edge_counts, num_unrouted in zip(route_targets, point_positions.items(),
+                                                                            route_counts, unrouted):
+            # Replace pairs on the same node or without a route like the single method runs do
+            num_missing = num_routes - (sum(len(destinations) for destinations in targets.values()) - num_unrouted)
+            if num_missing > 0:
+                edge_counts = edge_counts + routing.count_csr_routes(arrays.routing_arrays(route_type), positions,
+                                                                     int(num_missing), arrays.num_edges, rng)
+            columns[f"centrality_{method}_{route_type}"] = edge_counts / edge_counts.sum()
+
+    print("Done. All variants computed.")
+
+    return study_area._join_edges(pd.DataFrame(columns, index=study_area.get_edge_index()))
+
+
+# Function to store the results of an analysis
+def write_outputs(
+    centrality_gdf, 
+    header: str, 
+    output_folder: str, 
+    name: str, 
+    show: bool = False, 
+    output_format: str = "gpkg", 
+    chunk_size: int = None, 
+    tile_zooms: list = None
+):
+    """
+    Renders the centrality and stores image, centrality file and the run report (see profiler.RunProfiler)
+    in the folder output_folder/name
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param header: Title of the plot
+    :param output_folder: Folder containing the output folders of all analyses
+    :param name: Name of output folder and files (see get_output_name)
+    :param show: Plot with pyplot and show the plot after saving it instead of rendering headless (default: False)
+    :param output_format: Format of the centrality file ('gpkg', 'parquet' or 'fgb', default: 'gpkg')
+    :param chunk_size: Number of rows written at once (optional, see file_handler.write_gdf)
+    :param tile_zooms: Zoom levels of map tiles stored in the subfolder 'tiles' (optional)
+    :return: Path of the output folder
+    """
+
+    subfolder_name = os.path.join(output_folder, name)
+    file_handler.create_output_folder(output_folder)
+    file_handler.create_output_folder(subfolder_name)
+
+    # Plot and save Centrality as image and geopackage
+    if show:
+        file_handler.plot_centrality(centrality_gdf, header, f"{subfolder_name}/{name}.png", show=True)
+    else:
+        file_handler.render_centrality(centrality_gdf, header, f"{subfolder_name}/{name}.png")
+    if tile_zooms:
+        file_handler.render_tiles(centrality_gdf, f"{subfolder_name}/tiles", tile_zooms)
+    file_handler.write_gdf(centrality_gdf, f"{subfolder_name}/{name}", output_format, chunk_size)
+    profiler.get_profiler().write_report(f"{subfolder_name}/{name}_report.json")
+
+    return subfolder_name
+
+
+# Function to store the results of an analysis of all variants
+def write_variant_outputs(
+    variants_gdf, 
+    output_folder: str, 
+    name: str, 
+    show: bool = False, 
+    output_format: str = "gpkg", 
+    chunk_size: int = None, 
+    tile_zooms: list = None
+):
+    """
+    Renders every centrality column of compute_all_variants and stores the images, one
+    centrality file and the run report in the folder output_folder/name
+    :param variants_gdf: Geodataframe containing one centrality column per variant
+    :param output_folder: Folder containing the output folders of all analyses
+    :param name: Name of output folder and files
+    :param show: Plot with pyplot and show the plots after saving them instead of rendering headless (default: False)
+    :param output_format: Format of the centrality file ('gpkg', 'parquet' or 'fgb', default: 'gpkg')
+    :param chunk_size: Number of rows written at once (optional, see file_handler.write_gdf)
+    :param tile_zooms: Zoom levels of map tiles stored in the subfolder 'tiles/<variant>' (optional)
+    :return: Path of the output folder
+    """
+
+    subfolder_name = os.path.join(output_folder, name)
+    file_handler.create_output_folder(output_folder)
+    file_handler.create_output_folder(subfolder_name)
+
+    for column in variants_gdf.columns:
+        if column.startswith("centrality_"):
+            variant = column[len("centrality_"):]
+            if show:
+                file_handler.plot_centrality(variants_gdf, variant, f"{subfolder_name}/{name}_{variant}.png",
+                                             show=True, column=column)
+            else:
+                file_handler.render_centrality(variants_gdf, variant, f"{subfolder_name}/{name}_{variant}.png",
+                                               column=column)
+            if tile_zooms:
+                file_handler.render_tiles(variants_gdf, f"{subfolder_name}/tiles/{variant}", tile_zooms, column=column)
+    file_handler.write_gdf(variants_gdf, f"{subfolder_name}/{name}", output_format, chunk_size)
+    profiler.get_profiler().write_report(f"{subfolder_name}/{name}_report.json")
+
+    return subfolder_name
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# profiler.py
+
+"""Stage level instrumentation and run reports"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STAGES = ["download", "graph_build", "sampling", "snapping", "routing", "aggregation", "dissolve", "write"]
+
+
+# Function to read the peak resident memory of the process
+def peak_rss(who: int = None):
+    """
+    Returns the highest resident set size of the process or of its largest finished worker
+    process so far
+    :param who: resource.RUSAGE_SELF (default) or resource.RUSAGE_CHILDREN
+    :return: Number of bytes or None if it can not be read on this platform
+    """
+
+    if resource is None:
+        return None
+
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Function to read the current resident memory of the process
+def current_rss():
+    """
+    Returns the current resident set size of the process
+    :return: Number of bytes or None if it can not be read on this platform
+    """
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RssSampler:
+    """Background Thread Sampling the Resident Memory while Stages are Open"""
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Defines a sampler without open stages, the thread only runs while stages are open
+        :param interval: Seconds between two samples (default: 0.01)
+        """
+
+        self.interval = interval
+        self._reset()
+
+
+    def _reset(self):
+        """
+        Forgets all open stages, e.g. in a forked worker process
+        """
+
+        self._stages = []
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+    def add(self, open_stage: dict):
+        """
+        Starts to raise the 'peak' of an open stage to the sampled resident set size
+        :param open_stage: Dictionary with the 'peak' of the stage so far
+        """
+
+        with self._lock:
+            self._stages.append(open_stage)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+                self._thread.start()
+
+
+    def remove(self, open_stage: dict):
+        """
+        Stops to sample an open stage
+        :param open_stage: Dictionary added before
+        """
+
+        with self._lock:
+            self._stages = [entry for entry in self._stages if entry is not open_stage]
+
+
+    def _sample(self):
+        """
+        Samples the resident set size until no stage is open
+        """
+
+        while True:
+            rss = current_rss()
+            with self._lock:
+                if not self._stages or rss is None:
+                    self._thread = None
+                    return
+                for open_stage in self._stages:
+                    open_stage["peak"] = max(open_stage["peak"], rss)
+            time.sleep(self.interval)
+
+
+_sampler = _RssSampler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_sampler._reset)
+
+
+class RunProfiler:
+    """Record of Time, Memory and Item Counts per Stage of a Run"""
+
+    def __init__(self, profile_stage: str = None, profile_path: str = None):
+        """
+        Defines an empty record, stages are added while the run executes
+        :param profile_stage: Name of a stage to run under cProfile (optional)
+        :param profile_path: File to store the cProfile statistics of profile_stage in (default: '<stage>.prof')
+        """
+
+        self.stages = {}
+        self.info = {}
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path or (f"{profile_stage}.prof" if profile_stage else None)
+        self._profile = cProfile.Profile() if profile_stage else None
+        self._profiling = False
+        self._started = datetime.now(timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+
+    # Write method to measure a stage
+    @contextmanager
+    def stage(self, name: str, items: int = None):
+        """
+        Measures wall time, CPU time and memory of the enclosed block and adds them to the
+        stage, a stage may be entered several times and its values are summed. Memory is
+        recorded as change of the resident set size, as its highest value during the stage
+        (sampled every 10 ms on Linux, elsewhere only known if the stage raised the peak of
+        the process) and as highest resident set size of finished worker processes so far.
+        Nothing about the process is changed to measure it. The profile
+        of profile_stage collects all calls and is stored after each of them
+        :param name: Name of the stage (see STAGES)
+        :param items: Number of processed items, can also be added with add_items (optional)
+        :return: Dictionary of the stage record
+        """
+
+        record = self._get_record(name)
+        if items is not None:
+            record["items"] += int(items)
+
+        profiling = name == self.profile_stage and not self._profiling
+        if profiling:
+            self._profiling = True
+            self._profile.enable()
+
+        start_rss = current_rss()
+        open_stage = {"peak": start_rss, "process_peak": peak_rss()}
+        if start_rss is not None:
+            _sampler.add(open_stage)
+
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["calls"] += 1
+            record["wall_seconds"] += time.perf_counter() - start_wall
+            record["cpu_seconds"] += time.process_time() - start_cpu
+
+            _sampler.remove(open_stage)
+            end_rss = current_rss()
+            peak = None
+            if start_rss is not None and end_rss is not None:
+                record["rss_delta_bytes"] = (record["rss_delta_bytes"] or 0) + end_rss - start_rss
+                peak = max(open_stage["peak"], end_rss)
+
+            # Without the current resident set size the peak is only known if the stage raised it
+            elif (peak_rss() or 0) > (open_stage["process_peak"] or 0):
+                peak = peak_rss()
+            if peak is not None:
+                record["peak_rss_bytes"] = max(record["peak_rss_bytes"] or 0, peak)
+            record["worker_peak_rss_bytes"] = peak_rss(resource.RUSAGE_CHILDREN) if resource is not None else None
+
+            if profiling:
+                self._profile.disable()
+                self._profile.dump_stats(self.profile_path)
+                self._profiling = False
+
+
+    def _get_record(self, name: str):
+        """
+        Returns the record of a stage, a new stage starts with empty values
+        :param name: Name of the stage
+        :return: Dictionary of the stage record
+        """
+        return self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rss_delta_bytes": None,
+                                             "peak_rss_bytes": None, "worker_peak_rss_bytes": None, "items": 0})
+
+
+    # Write method to add processed items to a stage
+    def add_items(self, name: str, items: int):
+        """
+        Adds processed items to a stage without measuring time
+        :param name: Name of the stage
+        :param items: Number of items
+        """
+
+        self._get_record(name)["items"] += int(items)
+
+
+    # Write method to convert the record into a report
+    def to_dict(self):
+        """
+        Converts the record into a report with the totals of the run
+        :return: Dictionary of run information, totals and stages
+        """
+
+        return {"started": self._started.isoformat(timespec="seconds"),
+                "wall_seconds": time.perf_counter() - self._start_wall,
+                "cpu_seconds": time.process_time() - self._start_cpu,
+                "peak_rss_bytes": peak_rss(),
+                "worker_peak_rss_bytes": peak_rss(resource.RUSAGE_CHILDREN) if resource is not None else None,
+                "profile_stage": self.profile_stage,
+                "profile_path": self.profile_path if self.profile_stage in self.stages else None,
+                "info": self.info,
+                "stages": self.stages}
+
+
+    # Write method to store the report
+    def write_report(self, filepath: str):
+        """
+        Stores the report as JSON
+        :param filepath: Path of the JSON file
+        """
+
+        with open(filepath, "w") as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+
+
+class Progress:
+    """Throttled Progress Output"""
+
+    def __init__(self, total: int, label: str, interval: float = 2.0):
+        """
+        Defines a progress output that prints at most once per interval and once at the end
+        :param total: Number of expected items
+        :param label: Name of the items
+        :param interval: Minimal seconds between two outputs (default: 2)
+        """
+
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self._last = time.perf_counter()
+
+
+    # Write method to count processed items
+    def update(self, items: int = 1):
+        """
+        Counts processed items and prints the progress if the interval passed or all items are done
+        :param items: Number of processed items (default: 1)
+        """
+
+        self.count += items
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.count >= self.total:
+            self._last = now
+            print(f"Loading.. done: {self.count} from {self.total} {self.label}. Please wait..")
+
+
+# Record of the run of the current thread or task, concurrent runs report separately
+_active = contextvars.ContextVar("run_profiler", default=None)
+
+
+# Function to start the record of a new run
+def start_run(profile_stage: str = None, profile_path: str = None, **info):
+    """
+    Replaces the active record of the current thread by an empty one, all instrumented stages
+    of the thread report to it
+    :param profile_stage: Name of a stage to run under cProfile (optional)
+    :param profile_path: File to store the cProfile statistics in (optional)
+    :param info: Information about the run stored in the report, e.g. city and method
+    :return: RunProfiler of the run
+    """
+
+    assert profile_stage is None or profile_stage in STAGES, f"profile_stage must be in {STAGES}."
+
+    run = RunProfiler(profile_stage, profile_path)
+    run.info.update(info)
+    _active.set(run)
+
+    return run
+
+
+# Function to get the active record
+def get_profiler():
+    """
+    Returns the record of the current run, a thread without run gets an empty one
+    :return: RunProfiler
+    """
+
+    run = _active.get()
+    if run is None:
+        run = RunProfiler()
+        _active.set(run)
+
+    return run
+
+
+# Function to measure a stage of the active run
+def stage(name: str, items: int = None):
+    """
+    Measures a block as stage of the current run (see RunProfiler.stage)
+    :param name: Name of the stage
+    :param items: Number of processed items (optional)
+    :return: Context manager yielding the stage record
+    """
+    return get_profiler().stage(name, items)
+
+
+# Function to add items to a stage of the active run
+def add_items(name: str, items: int):
+    """
+    Adds processed items to a stage of the current run
+    :param name: Name of the stage
+    :param items: Number of items
+    """
+    get_profiler().add_items(name, items)
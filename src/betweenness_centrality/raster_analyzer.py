@@ -4,9 +4,14 @@
 
 """Methods for raster handling and population implementation"""
 
+import math
+import numpy as np
 import rasterio
+from rasterio.features import geometry_mask
 from rasterio.sample import sample_gen
+from rasterio.windows import Window
 import geopandas as gpd
+from betweenness_centrality import profiler
 
 
 class RasterAnalyzer:
@@ -21,6 +26,10 @@ class RasterAnalyzer:
 
         self.filepath = filepath
         self.dataset = None
+        self.window = None
+        self.window_bounds = None
+        self.window_transform = None
+        self.cell_tables = {}
 
 
     def open(self):
@@ -68,24 +77,102 @@ class RasterAnalyzer:
             print(f"Error clipping the raster: {str(e)}")
 
 
+    # Write method to read the raster window of an area into memory
+    def load_window(self, bounds: tuple, memmap_path: str = None, block_rows: int = 1024):
+        """
+        Reads the first band of the raster window covering the bounds once, later point values
+        are looked up in this array instead of reading the file per point
+        :param bounds: Bounds (minx, miny, maxx, maxy) in raster coordinates, e.g. poly.total_bounds
+        :param memmap_path: File to memory-map the window to instead of holding it in memory,
+            for very large regions (optional)
+        :param block_rows: Number of rows read at once when filling a memory-mapped window (default: 1024)
+        :return: Numpy array of the window
+        """
+
+        if self.dataset is None:
+            self.open()
+
+        # Get pixel window of the bounds, widened to whole pixels and limited to the raster
+        minx, miny, maxx, maxy = bounds
+        inverse_transform = ~self.dataset.transform
+        cols, rows = inverse_transform * (np.array([minx, maxx]), np.array([maxy, miny]))
+        col_start, row_start = max(math.floor(cols.min()), 0), max(math.floor(rows.min()), 0)
+        col_stop = min(math.ceil(cols.max()) + 1, self.dataset.width)
+        row_stop = min(math.ceil(rows.max()) + 1, self.dataset.height)
+        window = Window(col_start, row_start, max(col_stop - col_start, 0), max(row_stop - row_start, 0))
+
+        if memmap_path is None:
+            self.window = self.dataset.read(1, window=window)
+        else:
+            self.window = np.lib.format.open_memmap(memmap_path, mode="w+", dtype=self.dataset.dtypes[0],
+                                                    shape=(int(window.height), int(window.width)))
+            for row in range(0, int(window.height), block_rows):
+                block = Window(window.col_off, window.row_off + row, window.width, min(block_rows, window.height - row))
+                self.window[row:row + int(block.height)] = self.dataset.read(1, window=block)
+            self.window.flush()
+
+        self.window_bounds = tuple(bounds)
+        self.window_transform = self.dataset.window_transform(window)
+
+        return self.window
+
+
+    # Write method to look up raster values in the loaded window
+    def _get_window_values(self, x: np.ndarray, y: np.ndarray):
+        """
+        Looks up raster values of coordinates in the loaded window with one array gather,
+        coordinates outside of the window get the nodata value (or 0 if there is none)
+        :param x: X coordinates
+        :param y: Y coordinates
+        :return: Array of raster values
+        """
+
+        cols, rows = ~self.window_transform * (np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        cols, rows = np.floor(cols).astype(np.int64), np.floor(rows).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.window.shape[0]) & (cols >= 0) & (cols < self.window.shape[1])
+
+        fill_value = self.dataset.nodata if self.dataset.nodata is not None else 0
+        values = np.full(len(cols), fill_value, dtype=self.window.dtype)
+        values[inside] = self.window[rows[inside], cols[inside]]
+
+        return values
+
+
     # Write method to sample raster values at certain point coordinates
-    def get_point_values(self, sample_points: gpd.GeoDataFrame):
+    def get_point_values(self, sample_points: gpd.GeoDataFrame, drop_zero: bool = True, windowed: bool = True):
         """
-        Samples random points on raster 
+        Samples random points on raster, by default from the raster window covering the points
+        which is read once and reused as long as later points lie within it
         :param raster_points: Point coordinates as geodataframe to sample raster values
+        :param drop_zero: Remove points with a raster value of zero (default: True)
+        :param windowed: Look up values in the loaded window instead of reading per point (default: True)
         :return: Geodataframe containing the sampled points
         """
 
         print("Starting to sample point values..")
 
-        # Sample raster at given point coordinates
-        sampled_values = list(sample_gen(self.dataset, zip(sample_points.geometry.x, sample_points.geometry.y)))
+        with profiler.stage("sampling", items=len(sample_points)):
+            if windowed:
+                # Read the window covering the points unless the loaded window already covers them
+                minx, miny, maxx, maxy = sample_points.total_bounds
+                if self.window is None or not (self.window_bounds[0] <= minx and self.window_bounds[1] <= miny
+                                               and maxx <= self.window_bounds[2] and maxy <= self.window_bounds[3]):
+                    self.load_window((minx, miny, maxx, maxy))
+
+                # Add the sampled values to the GeoDataFrame
+                sample_points["raster_value"] = self._get_window_values(sample_points.geometry.x.values,
+                                                                        sample_points.geometry.y.values)
+
+            else:
+                # Sample raster at given point coordinates
+                sampled_values = list(sample_gen(self.dataset, zip(sample_points.geometry.x, sample_points.geometry.y)))
+
+                # Add the sampled values to the GeoDataFrame
+                sample_points["raster_value"] = [val[0] for val in sampled_values]
 
-        # Add the sampled values to the GeoDataFrame
-        sample_points["raster_value"] = [val[0] for val in sampled_values]
-        
         # Remove points outside of built up area
-        sample_points = sample_points[sample_points["raster_value"] > 0]
+        if drop_zero:
+            sample_points = sample_points[sample_points["raster_value"] > 0]
 
         print("Done. Point values sampled.")
 
@@ -103,18 +190,77 @@ class RasterAnalyzer:
 
         print("Starting to choose random points weighted with point values..")
 
-        # Extract weights from the "value" column
-        weights = points_with_values["raster_value"] / points_with_values["raster_value"].sum()
+        with profiler.stage("sampling", items=num_points):
+            # Extract weights from the "value" column
+            weights = points_with_values["raster_value"] / points_with_values["raster_value"].sum()
 
-        selected_points = points_with_values.sample(n=num_points, weights=weights, replace=True, random_state=42)
+            selected_points = points_with_values.sample(n=num_points, weights=weights, replace=True, random_state=42)
 
         print("Done. Weighted points selected.")
 
         return selected_points
 
 
+    # Write method to build a cumulative weight table over the populated cells of a polygon
+    def get_cell_table(self, poly: gpd.GeoDataFrame):
+        """
+        Builds the cumulative population table of all populated raster cells whose center lies
+        within the polygon, the table is cached per polygon
+        :param poly: Polygon of the city as geodataframe
+        :return: Tuple of row and column of the cells in the window, their values, the cumulative
+            values and the window transform
+        """
+
+        key = tuple(poly.geometry.to_wkb())
+        if key not in self.cell_tables:
+            minx, miny, maxx, maxy = poly.total_bounds
+            if self.window is None or not (self.window_bounds[0] <= minx and self.window_bounds[1] <= miny
+                                           and maxx <= self.window_bounds[2] and maxy <= self.window_bounds[3]):
+                self.load_window((minx, miny, maxx, maxy))
+
+            inside = geometry_mask(poly.geometry, out_shape=self.window.shape, transform=self.window_transform, invert=True)
+            populated = inside & (self.window > 0)
+            if self.dataset.nodata is not None:
+                populated &= self.window != self.dataset.nodata
 
+            rows, cols = np.nonzero(populated)
+            values = self.window[rows, cols]
+            self.cell_tables[key] = (rows, cols, values, np.cumsum(values, dtype=np.float64), self.window_transform)
 
+        return self.cell_tables[key]
 
 
+    # Write method that samples points weighted by population directly from the raster cells
+    def get_population_points(
+        self, 
+        poly: gpd.GeoDataFrame, 
+        num_points: int = 1000, 
+        rng: np.random.Generator = None
+    ):
+        """
+        Draws points weighted by population without rejection: cells are drawn by inverse
+        transform sampling from the cumulative weight table (see get_cell_table) and every point
+        is placed uniformly within its cell
+        :param poly: Polygon of the city as geodataframe
+        :param num_points: Number of points to draw (default=1000)
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :return: Geodataframe of the drawn points with their cell value as column 'raster_value'
+        """
+
+        print("Starting to draw points weighted by population..")
+
+        with profiler.stage("sampling", items=num_points):
+            rng = np.random.default_rng(rng)
+            rows, cols, values, cumulative, transform = self.get_cell_table(poly)
+            assert len(values) > 0, "No populated raster cells within the polygon."
 
+            # Draw cells by inverse transform sampling and jitter the points within their cells
+            drawn = np.searchsorted(cumulative, rng.uniform(0, cumulative[-1], num_points), side="right")
+            x, y = transform * (cols[drawn] + rng.uniform(size=num_points), rows[drawn] + rng.uniform(size=num_points))
+
+            selected_points = gpd.GeoDataFrame({"raster_value": values[drawn]},
+                                               geometry=gpd.points_from_xy(x, y), crs=self.dataset.crs)
+
+        print("Done. Points weighted by population drawn.")
+
+        return selected_points
@@ -0,0 +1,733 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# regional.py
+
+"""Tiled analysis of regions whose graph network does not fit into memory at once"""
+
+import os
+import re
+import json
+import math
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import networkx as nx
+import osmnx as ox
+import shapely
+from shapely.geometry import box
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from betweenness_centrality import graph_store, profiler, routing
+from betweenness_centrality.city_analyzer import CityAnalyzer, HWY_SPEEDS
+from betweenness_centrality.graph_store import GraphStore
+
+# Size of the overlay graph and its search above which a warning is printed
+OVERLAY_WARNING_BYTES = 2 * 2**30
+
+
+class TileGraphLoader:
+    """Loader of the Graph Network of a Tile"""
+
+    def __init__(self, osm_file: str = None, cache_dir: str = None):
+        """
+        Defines where tile graphs come from, the loader is passed to worker processes and
+        therefore only keeps paths
+        :param osm_file: Local .osm or .pbf extract to build the graphs from instead of downloading them (optional)
+        :param cache_dir: Folder of a local graph store the tile graphs are kept in, so that every
+            tile is downloaded once (optional)
+        """
+
+        self.osm_file = osm_file
+        self.cache_dir = cache_dir
+
+
+    def __call__(self, name: str, tile_poly: gpd.GeoDataFrame):
+        """
+        Loads the graph of a tile with travel times, edges with at least one node inside the
+        polygon are kept
+        :param name: Name of the tile, part of the key in the local store
+        :param tile_poly: Polygon of the tile as geodataframe
+        :return: Graph network of the tile, empty if there are no streets
+        """
+
+        store = GraphStore(self.cache_dir) if self.cache_dir is not None else None
+        key = store.get_key(name, 'drive', HWY_SPEEDS, self.osm_file, clipped=True) if store is not None else None
+        if store is not None:
+            tile_graph = store.load_graph(key)
+            if tile_graph is not None:
+                return tile_graph
+
+        try:
+            if self.osm_file is not None:
+                with profiler.stage('graph_build'):
+                    tile_graph = graph_store.graph_from_osm_file(self.osm_file, tile_poly, network_type='drive')
+            else:
+                with profiler.stage('download'):
+                    tile_graph = ox.graph_from_polygon(tile_poly.geometry.iloc[0], network_type='drive',
+                                                       truncate_by_edge=True)
+        except (ox._errors.InsufficientResponseError, ValueError) as e:
+            print(f"No streets found in tile '{name}': {str(e)}.")
+            return nx.MultiDiGraph(crs="epsg:4326")
+
+        with profiler.stage('graph_build', items=tile_graph.number_of_edges()):
+            tile_graph = ox.add_edge_travel_times(ox.add_edge_speeds(tile_graph, HWY_SPEEDS))
+
+        if store is not None:
+            store.save_graph(key, tile_graph)
+
+        return tile_graph
+
+
+class TiledRegion:
+    """Study Area Split into Tiles that are Loaded and Routed One at a Time"""
+
+    def __init__(
+        self,
+        region_name: str,
+        region_poly: gpd.GeoDataFrame,
+        work_dir: str = "../cache/regions",
+        tile_size: float = 20000.0,
+        buffer: float = 500.0,
+        graph_loader=None
+    ):
+        """
+        Splits the polygon of a region into square tiles of a grid in the local UTM zone. Every
+        graph node belongs to the tile its coordinates fall into, the graph of a tile is loaded
+        from the tile enlarged by the buffer so that it contains all edges leaving the tile
+        :param region_name: Name of the region
+        :param region_poly: Polygon of the region as geodataframe
+        :param work_dir: Folder the intermediate results of all runs are stored in
+        :param tile_size: Edge length of the tiles in meters (default: 20000)
+        :param buffer: Overlap of the tile graphs with their neighbours in meters (default: 500)
+        :param graph_loader: Function loading the graph of a tile from its name and polygon
+            (default: TileGraphLoader downloading from OSM)
+        """
+        assert tile_size > 0, "tile_size must be positive."
+        assert buffer >= 0, "buffer must not be negative."
+
+        self.region_name = region_name
+        self.work_dir = work_dir
+        self.tile_size = float(tile_size)
+        self.buffer = float(buffer)
+        self.graph_loader = graph_loader if graph_loader is not None else TileGraphLoader()
+
+        # Grid in the local UTM zone, cells outside the region have no tile
+        self.crs = region_poly.estimate_utm_crs()
+        self.region_geom = region_poly.to_crs(self.crs).geometry.unary_union
+        minx, miny, maxx, maxy = self.region_geom.bounds
+        self.origin = (minx, miny)
+        self.num_cols = max(math.ceil((maxx - minx) / self.tile_size), 1)
+        self.num_rows = max(math.ceil((maxy - miny) / self.tile_size), 1)
+
+        cells, cores = [], []
+        for row in range(self.num_rows):
+            for col in range(self.num_cols):
+                cell_box = box(minx + col * self.tile_size, miny + row * self.tile_size,
+                               minx + (col + 1) * self.tile_size, miny + (row + 1) * self.tile_size)
+                core = cell_box.intersection(self.region_geom)
+                if not core.is_empty:
+                    cells.append(row * self.num_cols + col)
+                    cores.append(core)
+
+        self.tiles = gpd.GeoDataFrame({'cell': cells}, geometry=cores, crs=self.crs)
+        self._cell_tiles = np.full(self.num_rows * self.num_cols, -1, dtype=np.int64)
+        self._cell_tiles[cells] = np.arange(len(cells))
+
+        # Nodes on the boundary of the region still belong to it
+        self._region_index = self.region_geom.buffer(0.01)
+        shapely.prepare(self._region_index)
+
+        print(f"Done. Region split into {len(self.tiles)} tiles of {self.tile_size / 1000:g} km.")
+
+
+    # Write method to find the tiles of coordinates
+    def get_tile_index(self, x: np.ndarray, y: np.ndarray):
+        """
+        Looks up the tile of every coordinate in a vectorized call
+        :param x: Longitudes
+        :param y: Latitudes
+        :return: Array of tile positions, -1 for coordinates outside the region
+        """
+
+        points = gpd.GeoSeries(gpd.points_from_xy(x, y), crs=4326).to_crs(self.crs)
+        px, py = points.x.to_numpy(), points.y.to_numpy()
+
+        cols = np.clip(np.floor((px - self.origin[0]) / self.tile_size).astype(np.int64), 0, self.num_cols - 1)
+        rows = np.clip(np.floor((py - self.origin[1]) / self.tile_size).astype(np.int64), 0, self.num_rows - 1)
+        tiles = self._cell_tiles[rows * self.num_cols + cols]
+        tiles[~shapely.intersects_xy(self._region_index, px, py)] = -1
+
+        return tiles
+
+
+    # Write method to load the graph of a tile
+    def get_tile_graph(self, tile: int):
+        """
+        Loads the graph of a tile enlarged by the buffer and the subgraph of the nodes the tile owns
+        :param tile: Tile position
+        :return: Tuple of the tile graph, a CityAnalyzer of the owned subgraph and a dictionary
+            of the node ids of the tile graph to their tile (-1 outside the region)
+        """
+
+        core = self.tiles.geometry.iloc[tile]
+        tile_poly = gpd.GeoDataFrame(geometry=[core.buffer(self.buffer)], crs=self.crs).to_crs(4326)
+        name = f"{self.region_name} tile {self.tile_size:g} {self.buffer:g} {int(self.tiles['cell'].iloc[tile])}"
+        tile_graph = self.graph_loader(name, tile_poly)
+
+        node_ids = np.array(list(tile_graph.nodes))
+        x = np.array([data['x'] for _, data in tile_graph.nodes(data=True)], dtype=float)
+        y = np.array([data['y'] for _, data in tile_graph.nodes(data=True)], dtype=float)
+        owners = self.get_tile_index(x, y) if len(node_ids) else np.array([], dtype=np.int64)
+
+        cell = CityAnalyzer(name, city_graph=tile_graph.subgraph(node_ids[owners == tile].tolist()))
+
+        return tile_graph, cell, dict(zip(node_ids.tolist(), owners.tolist()))
+
+
+    # Write method to derive the folder of a run
+    def get_run_dir(self, method: str, num_routes: int, seed: int, label: str = ""):
+        """
+        Derives the folder the intermediate results of a run are stored in, a run with the
+        same region, tiles, route type, number of routes and seed continues in the same folder
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param num_routes: Number of routes
+        :param seed: Seed of the run
+        :param label: Name of the point sampling, e.g. the centrality method (optional)
+        :return: Path of the folder
+        """
+
+        payload = json.dumps([self.region_name, self.region_geom.wkt, self.tile_size, self.buffer, method, num_routes,
+                              seed, label])
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+        name = re.sub(r"[^A-Za-z0-9]+", "_", self.region_name).strip("_")
+
+        return os.path.join(self.work_dir, f"{name}_{digest}")
+
+
+    # Write method that counts edge traversals of random routes tile by tile
+    def count_routes(
+        self,
+        sample_points,
+        num_routes: int = 100,
+        method: str = 'length',
+        seed: int = None,
+        num_workers: int = 1,
+        label: str = ""
+    ):
+        """
+        Counts the edge traversals of random routes between points of the whole region without
+        ever loading more than one tile graph per process. Routes are searched in three passes:
+        1. every tile computes the distances from its entry to its exit nodes and the legs
+           between its points and these boundary nodes within the tile,
+        2. all routes are searched on the overlay graph of the boundary nodes and the edges between
+           tiles, to which every round of pairs adds its points with their legs, which gives exact
+           shortest paths as sequences of tile segments and crossings,
+        3. every tile expands its segments into edges and counts their traversals.
+        The tiles of both tile passes run on a process pool, every result is stored in the run
+        folder as soon as it is finished, so a run that crashed or was stopped continues with
+        the missing tiles. Points are snapped to the nodes of the tile they fall into
+        :param sample_points: Function drawing points from the number of points and rng, e.g. CityAnalyzer.get_points
+            with the polygon bound
+        :param num_routes: Number of routes to compute (default: 100)
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param seed: Seed for reproducible runs, runs without seed draw one and can only be resumed with it (optional)
+        :param num_workers: Number of processes (default: 1)
+        :param label: Name of the point sampling, e.g. the centrality method (optional)
+        :return: Path of the run folder (see get_count_centrality)
+        """
+
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+            print(f"Drawn seed {seed}, use it to resume the run.")
+
+        run_dir = self.get_run_dir(method, num_routes, seed, label)
+        os.makedirs(run_dir, exist_ok=True)
+        print(f"Starting tiled routing of {num_routes} routes in '{run_dir}'..")
+
+        # Points are drawn once per run and keep the random stream for the route pairs
+        points_path = os.path.join(run_dir, "points.pickle")
+        points = _load_result(points_path)
+        if points is None:
+            rng = np.random.default_rng(seed)
+            region_points = sample_points(2 * num_routes, rng=rng)
+            x, y = region_points.geometry.x.to_numpy(), region_points.geometry.y.to_numpy()
+            points = {"x": x, "y": y, "tiles": self.get_tile_index(x, y), "rng_state": rng.bit_generator.state}
+            _save_result(points_path, points)
+
+        tasks = []
+        for tile in range(len(self.tiles)):
+            point_ids = np.flatnonzero(points["tiles"] == tile)
+            tasks.append((tile, run_dir, method, point_ids, points["x"][point_ids], points["y"][point_ids]))
+        self._run_tiles("boundaries", tasks, run_dir, num_workers)
+
+        overlay_path = os.path.join(run_dir, "overlay.pickle")
+        overlay = _load_result(overlay_path)
+        if overlay is None:
+            overlay = self._route_overlay(run_dir, method, num_routes, len(points["x"]), points["rng_state"])
+            _save_result(overlay_path, overlay)
+
+        tasks = [(tile, run_dir, method, overlay["tiles"][tile]) for tile in sorted(overlay["tiles"])]
+        self._run_tiles("counts", tasks, run_dir, num_workers)
+
+        print(f"Done. {overlay['num_routes']} routes counted in {len(self.tiles)} tiles.")
+
+        return run_dir
+
+
+    def _run_tiles(self, stage: str, tasks: list, run_dir: str, num_workers: int = 1):
+        """
+        Runs one tile pass for all tiles whose result is not stored yet
+        :param stage: Name of the pass ('boundaries' or 'counts')
+        :param tasks: List of argument tuples starting with the tile position
+        :param run_dir: Folder of the run
+        :param num_workers: Number of processes (default: 1)
+        """
+
+        tasks = [task for task in tasks if not os.path.exists(_get_tile_path(run_dir, stage, task[0]))]
+        if not tasks:
+            return
+
+        print(f"Starting {stage} pass of {len(tasks)} tiles..")
+
+        with profiler.stage('routing', items=len(tasks)):
+            if num_workers > 1:
+                with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                    results = executor.map(_run_tile, [(self, stage, *task) for task in tasks])
+                    for done, _ in enumerate(results, 1):
+                        print(f"Loading.. done: {done} from {len(tasks)} tiles.")
+            else:
+                for done, task in enumerate(tasks, 1):
+                    _run_tile((self, stage, *task))
+                    print(f"Loading.. done: {done} from {len(tasks)} tiles.")
+
+
+    def _route_boundaries(
+        self,
+        tile: int,
+        run_dir: str,
+        method: str,
+        point_ids: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray
+    ):
+        """
+        First pass of a tile: snaps the points of the tile, finds the edges leaving and entering
+        the tile and computes the distances from entry to exit nodes on the subgraph of the tile.
+        The legs of the points, i.e. the distances from the points to the exit nodes and from
+        the entry nodes to the points, are stored separately so that the overlay graph only
+        keeps the boundary nodes
+        :param tile: Tile position
+        :param run_dir: Folder of the run
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param point_ids: Positions of the points of the tile among all points
+        :param x: Longitudes of the points
+        :param y: Latitudes of the points
+        """
+
+        tile_graph, cell, owners = self.get_tile_graph(tile)
+        result = {"entries": np.array([], dtype=np.int64), "exits": np.array([], dtype=np.int64),
+                  "distances": np.zeros((0, 0)), "points": point_ids, "point_nodes": np.full(len(point_ids), -1),
+                  "cut_edges": pd.DataFrame({'u': [], 'v': [], 'key': [], 'weight': []})}
+        legs = {"point_exits": np.zeros((len(point_ids), 0)), "entry_points": np.zeros((0, len(point_ids)))}
+
+        if cell.city_graph.number_of_nodes() > 0:
+            # Edges between the tile and its neighbours, only the cheapest parallel edge is used
+            cut_edges, entries = [], set()
+            for u, v, key, weight in tile_graph.edges(keys=True, data=method, default=1):
+                if owners[u] == tile and owners[v] not in (tile, -1):
+                    cut_edges.append((u, v, key, weight))
+                elif owners[v] == tile and owners[u] not in (tile, -1):
+                    entries.add(v)
+            cut_edges = pd.DataFrame(cut_edges, columns=['u', 'v', 'key', 'weight'])
+            cut_edges = cut_edges.sort_values('weight', kind='stable').drop_duplicates(['u', 'v'])
+
+            if len(point_ids):
+                result["point_nodes"] = cell.snap_points(gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=4326))
+
+            entries = np.unique(np.array(list(entries), dtype=np.int64))
+            exits = np.unique(cut_edges['u'].to_numpy(dtype=np.int64))
+
+            arrays = cell.graph_arrays
+            csgraph = _get_csgraph(arrays.routing_arrays(method))
+            result.update(entries=entries, exits=exits, distances=_get_distances(arrays, csgraph, entries, exits),
+                          cut_edges=cut_edges)
+            legs = {"point_exits": _get_distances(arrays, csgraph, result["point_nodes"], exits),
+                    "entry_points": _get_distances(arrays, csgraph, entries, result["point_nodes"])}
+
+        # The legs are written first, a stored boundaries file means that the tile is finished
+        _save_result(_get_tile_path(run_dir, "legs", tile), legs)
+        _save_result(_get_tile_path(run_dir, "boundaries", tile), result)
+
+
+    def _route_overlay(self, run_dir: str, method: str, num_routes: int, num_points: int, rng_state: dict):
+        """
+        Second pass: searches all routes on the overlay graph of the boundary nodes, i.e. the
+        distances between entry and exit nodes within the tiles and the edges between tiles.
+        Every round of drawn pairs adds its origins and destinations to the overlay graph with
+        their legs, which are read tile by tile, and pairs within the same tile with their
+        distance on the tile graph. Pairs without a route are drawn again
+        :param run_dir: Folder of the run
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param num_routes: Number of routes
+        :param num_points: Number of points of the run
+        :param rng_state: State of the random stream after the points were drawn
+        :return: Dictionary of 'tiles' (tile position to dictionary of the 'segments' within and
+            the 'cut_edges' leaving the tile with their traversals), 'origins', 'destinations' and 'num_routes'
+        """
+
+        print("Starting to route on the overlay graph of the tiles..")
+
+        point_nodes = np.full(num_points, -1, dtype=np.int64)
+        point_tiles = np.full(num_points, -1, dtype=np.int64)
+        point_legs = np.full(num_points, -1, dtype=np.int64)
+        cliques, cut_frames = [], []
+        for tile in range(len(self.tiles)):
+            result = _load_result(_get_tile_path(run_dir, "boundaries", tile))
+            point_nodes[result["points"]] = result["point_nodes"]
+            point_tiles[result["points"]] = tile
+            point_legs[result["points"]] = np.arange(len(result["points"]))
+            cliques.append((result["entries"], result["exits"], result["distances"]))
+            cut_frames.append(result["cut_edges"])
+
+        cut_edges = pd.concat(cut_frames, ignore_index=True)
+        node_ids = np.unique(np.concatenate([entries for entries, _, _ in cliques] + [exits for _, exits, _ in cliques] +
+                                            [cut_edges['u'].to_numpy(dtype=np.int64),
+                                             cut_edges['v'].to_numpy(dtype=np.int64)]))
+        node_tiles = np.full(len(node_ids), -1, dtype=np.int64)
+
+        # Cliques between the entry and exit nodes of every tile and crossings between tiles
+        rows, cols, weights, tile_entries, tile_exits = [], [], [], [], []
+        for tile, (entries, exits, distances) in enumerate(cliques):
+            sources, targets = np.searchsorted(node_ids, entries), np.searchsorted(node_ids, exits)
+            node_tiles[sources], node_tiles[targets] = tile, tile
+            tile_entries.append(sources)
+            tile_exits.append(targets)
+
+            source_grid, target_grid = np.meshgrid(sources, targets, indexing='ij')
+            valid = np.isfinite(distances) & (source_grid != target_grid)
+            rows.append(source_grid[valid])
+            cols.append(target_grid[valid])
+            weights.append(distances[valid])
+        rows.append(np.searchsorted(node_ids, cut_edges['u'].to_numpy(dtype=np.int64)))
+        cols.append(np.searchsorted(node_ids, cut_edges['v'].to_numpy(dtype=np.int64)))
+        weights.append(cut_edges['weight'].to_numpy(dtype=np.float64))
+        del cliques
+
+        num_nodes = len(node_ids)
+        num_clique_edges = sum(len(weight) for weight in weights)
+        overlay_bytes = 12 * (num_clique_edges + num_routes * 2 * max(map(len, tile_exits + tile_entries), default=0))
+        overlay_bytes += 12 * 64 * (num_nodes + 4 * num_routes)
+        if overlay_bytes > OVERLAY_WARNING_BYTES:
+            print(f"Warning: the overlay graph of {num_nodes} boundary nodes and {num_clique_edges} edges needs about "
+                  f"{overlay_bytes / 2**20:.0f} MiB, use larger tiles or fewer routes.")
+
+        rng = np.random.default_rng()
+        rng.bit_generator.state = rng_state
+        points = np.flatnonzero(point_nodes >= 0)
+
+        hop_frames, route_origins, route_destinations = [], [], []
+        remaining = num_routes if len(np.unique(point_nodes[points])) > 1 else 0
+        while remaining > 0:
+            origins, destinations = routing.draw_od_pairs(points, remaining, rng)
+            distinct = point_nodes[origins] != point_nodes[destinations]
+            origins, destinations = origins[distinct], destinations[distinct]
+
+            # Origins and destinations of the round are added as nodes behind the boundary nodes
+            unique_origins, origin_index = np.unique(origins, return_inverse=True)
+            unique_destinations, destination_index = np.unique(destinations, return_inverse=True)
+            origin_positions = num_nodes + np.arange(len(unique_origins))
+            destination_positions = num_nodes + len(unique_origins) + np.arange(len(unique_destinations))
+            round_rows, round_cols, round_weights = rows[:], cols[:], weights[:]
+
+            for tile in np.union1d(point_tiles[unique_origins], point_tiles[unique_destinations]).tolist():
+                legs = _load_result(_get_tile_path(run_dir, "legs", tile))
+                in_tile = point_tiles[unique_origins] == tile
+                distances = legs["point_exits"][point_legs[unique_origins[in_tile]]]
+                source_grid, target_grid = np.meshgrid(origin_positions[in_tile], tile_exits[tile], indexing='ij')
+                valid = np.isfinite(distances)
+                round_rows.append(source_grid[valid])
+                round_cols.append(target_grid[valid])
+                round_weights.append(distances[valid])
+
+                in_tile = point_tiles[unique_destinations] == tile
+                distances = legs["entry_points"][:, point_legs[unique_destinations[in_tile]]]
+                source_grid, target_grid = np.meshgrid(tile_entries[tile], destination_positions[in_tile], indexing='ij')
+                valid = np.isfinite(distances)
+                round_rows.append(source_grid[valid])
+                round_cols.append(target_grid[valid])
+                round_weights.append(distances[valid])
+
+            # Pairs within the same tile may not leave it, their direct distance comes from the tile graph
+            pairs = np.unique(np.column_stack([origin_index, destination_index]), axis=0)
+            pair_tiles = point_tiles[unique_origins[pairs[:, 0]]]
+            same_tile = pair_tiles == point_tiles[unique_destinations[pairs[:, 1]]]
+            for tile in np.unique(pair_tiles[same_tile]).tolist():
+                tile_pairs = pairs[same_tile & (pair_tiles == tile)]
+                _, cell, _ = self.get_tile_graph(tile)
+                arrays = cell.graph_arrays
+                tile_csgraph = _get_csgraph(arrays.routing_arrays(method))
+                pair_origins, pair_index = np.unique(point_nodes[unique_origins[tile_pairs[:, 0]]], return_inverse=True)
+                pair_targets = arrays.node_positions(point_nodes[unique_destinations[tile_pairs[:, 1]]])
+                distances = np.empty(len(tile_pairs))
+                for chunk_start in range(0, len(pair_origins), 64):
+                    chunk = arrays.node_positions(pair_origins[chunk_start:chunk_start + 64])
+                    in_chunk = (pair_index >= chunk_start) & (pair_index < chunk_start + 64)
+                    distances[in_chunk] = dijkstra(tile_csgraph, indices=chunk)[pair_index[in_chunk] - chunk_start,
+                                                                                pair_targets[in_chunk]]
+                valid = np.isfinite(distances)
+                round_rows.append(origin_positions[tile_pairs[valid, 0]])
+                round_cols.append(destination_positions[tile_pairs[valid, 1]])
+                round_weights.append(distances[valid])
+
+            num_positions = num_nodes + len(unique_origins) + len(unique_destinations)
+            csgraph = csr_matrix((np.concatenate(round_weights), (np.concatenate(round_rows), np.concatenate(round_cols))),
+                                 shape=(num_positions, num_positions))
+            position_ids = np.concatenate([node_ids, point_nodes[unique_origins], point_nodes[unique_destinations]])
+            position_tiles = np.concatenate([node_tiles, point_tiles[unique_origins], point_tiles[unique_destinations]])
+
+            order = np.argsort(origin_index, kind="stable")
+            route_starts, route_ends = origin_index[order], destination_positions[destination_index[order]]
+            starts = np.searchsorted(route_starts, np.arange(len(unique_origins)))
+            ends = np.append(starts[1:], len(order))
+
+            hop_sources, hop_targets, routed = [], [], 0
+            for chunk_start in range(0, len(unique_origins), 64):
+                chunk = slice(chunk_start, chunk_start + 64)
+                _, predecessors = dijkstra(csgraph, indices=origin_positions[chunk], return_predecessors=True)
+
+                for origin, row, start, end in zip(origin_positions[chunk], predecessors, starts[chunk], ends[chunk]):
+                    for node in route_ends[start:end]:
+                        if row[node] < 0:
+                            continue
+                        route_origins.append(position_ids[origin])
+                        route_destinations.append(position_ids[node])
+                        while row[node] >= 0:
+                            hop_sources.append(row[node])
+                            hop_targets.append(node)
+                            node = row[node]
+                        routed += 1
+
+            hop_sources, hop_targets = np.array(hop_sources, dtype=np.int64), np.array(hop_targets, dtype=np.int64)
+            hop_frames.append(pd.DataFrame({"tile": position_tiles[hop_sources],
+                                            "within": position_tiles[hop_sources] == position_tiles[hop_targets],
+                                            "u": position_ids[hop_sources], "v": position_ids[hop_targets]}))
+
+            remaining -= routed
+            if routed == 0:
+                print(f"No route found between the remaining points, {remaining} routes are missing.")
+                break
+
+        # Count every hop once and split it into segments within tiles and crossings between tiles,
+        # legs between a point and a boundary node on the same node have no edges
+        hops = pd.concat(hop_frames, ignore_index=True) if hop_frames else pd.DataFrame(columns=["tile", "within", "u", "v"])
+        hops = hops[hops["u"] != hops["v"]].groupby(["tile", "within", "u", "v"]).size().reset_index(name="count")
+
+        cut_keys = cut_edges.set_index(['u', 'v'])['key']
+        tiles = {}
+        for tile, tile_hops in hops.groupby("tile"):
+            segments, crossings = tile_hops[tile_hops["within"]], tile_hops[~tile_hops["within"]]
+            crossing_pairs = list(zip(crossings["u"].tolist(), crossings["v"].tolist()))
+            tiles[int(tile)] = {
+                "segments": (segments["u"].to_numpy(dtype=np.int64), segments["v"].to_numpy(dtype=np.int64),
+                             segments["count"].to_numpy(dtype=np.int64)),
+                "cut_edges": (crossings["u"].to_numpy(dtype=np.int64), crossings["v"].to_numpy(dtype=np.int64),
+                              cut_keys.loc[crossing_pairs].to_numpy(dtype=np.int64) if crossing_pairs else np.array([], dtype=np.int64),
+                              crossings["count"].to_numpy(dtype=np.int64)),
+            }
+
+        print(f"Done. {len(route_origins)} routes found on the overlay graph of {num_nodes} boundary nodes.")
+
+        return {"tiles": tiles, "origins": np.array(route_origins, dtype=np.int64),
+                "destinations": np.array(route_destinations, dtype=np.int64), "num_routes": len(route_origins)}
+
+
+    def _count_segments(self, tile: int, run_dir: str, method: str, traversals: dict):
+        """
+        Third pass of a tile: expands the segments of the routes within the tile into edges and
+        counts the traversals of all edges starting in the tile
+        :param tile: Tile position
+        :param run_dir: Folder of the run
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param traversals: Dictionary of the 'segments' and 'cut_edges' of the tile (see _route_overlay)
+        """
+
+        tile_graph, cell, _ = self.get_tile_graph(tile)
+        sources, targets, segment_counts = traversals["segments"]
+        count_frames = []
+
+        if len(sources):
+            arrays = cell.graph_arrays
+            routing_arrays = arrays.routing_arrays(method)
+            csgraph = _get_csgraph(routing_arrays)
+            source_positions, target_positions = arrays.node_positions(sources), arrays.node_positions(targets)
+            unique_sources, inverse = np.unique(source_positions, return_inverse=True)
+
+            route_sources, route_targets, route_counts = [], [], []
+            for chunk_start in range(0, len(unique_sources), 64):
+                _, predecessors = dijkstra(csgraph, indices=unique_sources[chunk_start:chunk_start + 64],
+                                           return_predecessors=True)
+                for segment in np.flatnonzero((inverse >= chunk_start) & (inverse < chunk_start + 64)):
+                    row, node = predecessors[inverse[segment] - chunk_start], target_positions[segment]
+                    while row[node] >= 0:
+                        route_sources.append(row[node])
+                        route_targets.append(node)
+                        route_counts.append(segment_counts[segment])
+                        node = row[node]
+
+            slots = np.searchsorted(routing_arrays["pair_keys"],
+                                    np.array(route_sources, dtype=np.int64) * arrays.num_nodes + route_targets)
+            edge_counts = np.bincount(routing_arrays["edge_positions"][slots], weights=route_counts,
+                                      minlength=arrays.num_edges).astype(np.int64)
+
+            edges_gdf = ox.graph_to_gdfs(cell.city_graph, nodes=False)
+            traversed = edge_counts > 0
+            count_gdf = edges_gdf.loc[traversed, ['osmid', 'geometry']].copy()
+            count_gdf['count'] = edge_counts[traversed]
+            count_frames.append(count_gdf)
+
+        # Edges to neighbouring tiles are counted by the tile they start in
+        cut_sources, cut_targets, cut_keys, cut_counts = traversals["cut_edges"]
+        if len(cut_sources):
+            cut_index = list(zip(cut_sources.tolist(), cut_targets.tolist(), cut_keys.tolist()))
+            edges_gdf = ox.graph_to_gdfs(tile_graph.edge_subgraph(cut_index), nodes=False)
+            count_gdf = edges_gdf.loc[cut_index, ['osmid', 'geometry']].copy()
+            count_gdf['count'] = cut_counts
+            count_frames.append(count_gdf)
+
+        _save_result(_get_tile_path(run_dir, "counts", tile), pd.concat(count_frames) if count_frames else None)
+
+
+    # Write method to merge the edge counts of all tiles
+    def get_edge_counts(self, run_dir: str):
+        """
+        Merges the stored edge counts of all tiles of a run, every edge is counted by exactly one tile
+        :param run_dir: Folder of the run (see count_routes)
+        :return: Geodataframe containing u, v, key, osmid, geometry and count of the traversed streets
+        """
+
+        frames = []
+        for tile in range(len(self.tiles)):
+            count_gdf = _load_result(_get_tile_path(run_dir, "counts", tile))
+            if count_gdf is not None:
+                frames.append(count_gdf)
+
+        counts_gdf = gpd.GeoDataFrame(pd.concat(frames), geometry='geometry', crs=4326)
+
+        return counts_gdf.reset_index()
+
+
+    # Write function that computes geographical centrality from the edge counts of all tiles
+    def get_count_centrality(self, run_dir: str):
+        """
+        Calculates betweenness centrality from the merged edge counts of a run like
+        CityAnalyzer.get_count_centrality
+        :param run_dir: Folder of the run (see count_routes)
+        :return: Geodataframe containing u, v, key, osmid, geometry and centrality of the streets
+        """
+
+        print("Starting to merge the edge counts of all tiles..")
+
+        with profiler.stage('aggregation'):
+            count_gdf = self.get_edge_counts(run_dir)
+            count_gdf['centrality'] = count_gdf['count'] / count_gdf['count'].sum()
+
+        print("Processing done.. betweenness centrality computed from the edge counts of all tiles.")
+
+        return count_gdf.drop(columns='count')
+
+
+# Function to run one pass of a tile inside a worker process
+def _run_tile(task: tuple):
+    """
+    Runs the boundaries or counts pass of one tile
+    :param task: Tuple of the TiledRegion, the name of the pass and its arguments
+    """
+
+    region, stage, *arguments = task
+    if stage == "boundaries":
+        region._route_boundaries(*arguments)
+    else:
+        region._count_segments(*arguments)
+
+
+# Function to convert routing arrays into a scipy graph
+def _get_csgraph(arrays: dict):
+    """
+    Builds a sparse matrix of the cheapest edges between node positions
+    :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+    :return: Scipy CSR matrix with double precision weights
+    """
+
+    num_nodes = len(arrays["indptr"]) - 1
+
+    return csr_matrix((arrays["weights"].astype(np.float64), arrays["indices"], arrays["indptr"]),
+                      shape=(num_nodes, num_nodes))
+
+
+# Function to compute distances between nodes of a tile
+def _get_distances(arrays, csgraph, sources: np.ndarray, targets: np.ndarray):
+    """
+    Computes the distances from source to target nodes, every distinct source is searched once
+    :param arrays: GraphArrays of the tile
+    :param csgraph: Scipy graph of the tile (see _get_csgraph)
+    :param sources: Array of source node ids
+    :param targets: Array of target node ids
+    :return: Matrix of the distances with a row per source and a column per target
+    """
+
+    unique_sources, inverse = np.unique(sources, return_inverse=True)
+    target_positions = arrays.node_positions(targets)
+    distances = [np.zeros((0, len(targets)))]
+    for chunk_start in range(0, len(unique_sources), 64):
+        chunk = arrays.node_positions(unique_sources[chunk_start:chunk_start + 64])
+        distances.append(dijkstra(csgraph, indices=chunk)[:, target_positions])
+
+    return np.vstack(distances)[inverse.reshape(-1)]
+
+
+# Function to derive the path of a tile result
+def _get_tile_path(run_dir: str, stage: str, tile: int):
+    """
+    Returns the path of the stored result of a tile pass
+    :param run_dir: Folder of the run
+    :param stage: Name of the pass ('boundaries', 'legs' or 'counts')
+    :param tile: Tile position
+    :return: Path of the file
+    """
+    return os.path.join(run_dir, stage, f"tile_{tile}.pickle")
+
+
+# Function to store an intermediate result
+def _save_result(path: str, obj):
+    """
+    Stores an object, the file is written under a temporary name first so that a crash
+    never leaves a partial result behind
+    :param path: Path of the file
+    :param obj: Object to store
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temp_path, "wb") as file:
+        pickle.dump(obj, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+# Function to load an intermediate result
+def _load_result(path: str):
+    """
+    Loads a stored object
+    :param path: Path of the file
+    :return: Stored object or None if it does not exist
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as file:
+        return pickle.load(file)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# resilience.py
+
+"""What-if analysis of street closures on the routes of a geographical centrality run"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from betweenness_centrality import profiler, routing
+from betweenness_centrality.city_analyzer import CityAnalyzer
+
+
+class RouteIndex:
+    """Routes of a Centrality Run with an Inverted Index from Edges to Routes"""
+
+    def __init__(
+        self,
+        study_area: CityAnalyzer,
+        method: str,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        route_indptr: np.ndarray,
+        route_edges: np.ndarray
+    ):
+        """
+        Defines the index of the routes of a run, see from_points
+        :param study_area: CityAnalyzer of the city
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param origins: Node positions of the origins of the routes
+        :param destinations: Node positions of the destinations of the routes
+        :param route_indptr: CSR offsets, the edges of route i are route_edges[route_indptr[i]:route_indptr[i + 1]]
+        :param route_edges: Edge positions in the order of CityAnalyzer.get_edge_index of all routes
+        """
+
+        self.study_area = study_area
+        self.method = method
+        self.origins = origins
+        self.destinations = destinations
+        self.route_indptr = route_indptr
+        self.route_edges = route_edges
+
+        arrays = study_area.graph_arrays
+        self.edge_slots = np.empty(arrays.num_edges, dtype=np.int64)
+        self.edge_slots[arrays.edge_ids] = np.arange(arrays.num_edges)
+        self.slot_weights = arrays.weights[method].astype(np.float64)
+        self.edge_weights = self.slot_weights[self.edge_slots]
+
+        # Scenarios change the routing arrays of the baseline only at the node pairs of their edges
+        self.routing_arrays = arrays.routing_arrays(method)
+        self.slot_pairs = np.repeat(np.arange(arrays.num_nodes, dtype=np.int64), np.diff(arrays.indptr)) \
+            * arrays.num_nodes + arrays.indices
+
+        # Inverted index, the routes of edge j are edge_routes[edge_indptr[j]:edge_indptr[j + 1]]
+        route_ids = np.repeat(np.arange(len(origins)), np.diff(route_indptr))
+        self.edge_counts = np.bincount(route_edges, minlength=arrays.num_edges).astype(np.int64)
+        self.edge_indptr = np.concatenate([[0], np.cumsum(self.edge_counts)]).astype(np.int64)
+        self.edge_routes = route_ids[np.argsort(route_edges, kind='stable')]
+        self.route_costs = np.bincount(route_ids, weights=self.edge_weights[route_edges], minlength=len(origins))
+
+
+    @classmethod
+    def from_points(
+        cls,
+        study_area: CityAnalyzer,
+        city_points: gpd.GeoDataFrame,
+        num_routes: int = 100,
+        method: str = 'length',
+        rng: np.random.Generator = None
+    ):
+        """
+        Computes random routes between points like CityAnalyzer.get_route_counts and keeps the
+        edges of every route, pairs without a route are drawn again
+        :param study_area: CityAnalyzer of the city
+        :param city_points: Points within the city as geodataframe
+        :param num_routes: Number of routes to compute (default: 100)
+        :param method: Computing method for routes ('length' or 'travel_time')
+        :param rng: Seed or numpy random generator for reproducible runs (optional)
+        :return: RouteIndex of the routes
+        """
+
+        print("Starting to index the edges of random routes..")
+
+        rng = np.random.default_rng(rng)
+        arrays = study_area.graph_arrays
+        point_positions = arrays.node_positions(study_area.snap_points(city_points))
+        routing_arrays = arrays.routing_arrays(method)
+
+        origins, destinations, route_lengths, route_edges = [], [], [], []
+        remaining = num_routes
+        with profiler.stage('routing', items=num_routes):
+            while remaining > 0:
+                pair_origins, pair_destinations = routing.draw_od_pairs(point_positions, remaining, rng)
+                route_indptr, edges, routed = routing.csr_route_paths(routing_arrays, pair_origins, pair_destinations)
+                if not routed.any():
+                    print(f"No route found between the points, {remaining} routes are missing.")
+                    break
+
+                origins.append(pair_origins[routed])
+                destinations.append(pair_destinations[routed])
+                route_lengths.append(np.diff(route_indptr)[routed])
+                route_edges.append(edges)
+                remaining -= int(routed.sum())
+
+        route_indptr = np.concatenate([[0], np.cumsum(np.concatenate(route_lengths))]).astype(np.int64)
+
+        print(f"Done. {len(route_indptr) - 1} routes indexed.")
+
+        return cls(study_area, method, np.concatenate(origins), np.concatenate(destinations), route_indptr,
+                   np.concatenate(route_edges))
+
+
+    # Write method to convert edges into edge positions
+    def get_edge_positions(self, edges: list):
+        """
+        Looks up the positions of edges in the edge index of the city
+        :param edges: List of (u, v, key) tuples
+        :return: Array of edge positions
+        """
+
+        positions = self.study_area.get_edge_index().get_indexer(list(edges)) if len(edges) else np.array([], dtype=np.int64)
+        assert (positions >= 0).all(), "All edges must be (u, v, key) tuples of the graph."
+
+        return positions.astype(np.int64)
+
+
+    # Write method to find the routes that traverse edges
+    def get_affected_routes(self, edge_positions: np.ndarray):
+        """
+        Collects the routes traversing any of the edges from the inverted index
+        :param edge_positions: Array of edge positions
+        :return: Sorted array of route ids
+        """
+        return np.unique(_gather(self.edge_indptr, self.edge_routes, np.asarray(edge_positions, dtype=np.int64)))
+
+
+    # Write method to evaluate a closure scenario
+    def evaluate(self, closed: list = (), weights: dict = None):
+        """
+        Closes and reweights edges and reroutes only the routes that traverse them, the edge
+        counts of the scenario are the baseline counts with the old routes removed and the new
+        routes added. Weights may only increase, because cheaper edges could attract routes that
+        never traversed them
+        :param closed: List of (u, v, key) tuples of closed edges
+        :param weights: Dictionary of (u, v, key) tuples to their new weight, e.g. a slower travel time (optional)
+        :return: Dictionary of 'edge_counts' (array with the number of traversals per edge), 'affected_routes',
+            'unroutable_routes' (affected routes without a new route), 'added_cost' (summed cost change of the
+            rerouted routes) and 'relative_added_cost' and 'changed_share' (changed traversals), both relative
+            to the baseline
+        """
+
+        result, touched, touched_counts = self._reroute(closed, weights)
+
+        edge_counts = self.edge_counts.copy()
+        edge_counts[touched] = touched_counts
+
+        return {"edge_counts": edge_counts, **result}
+
+
+    def _reroute(self, closed: list = (), weights: dict = None):
+        """
+        Reroutes the routes traversing closed or reweighted edges on the routing arrays of the
+        baseline, only the node pairs of the changed edges get a new cheapest parallel edge
+        :param closed: List of (u, v, key) tuples of closed edges
+        :param weights: Dictionary of (u, v, key) tuples to their new weight (optional)
+        :return: Tuple of the scores (see evaluate), the sorted positions of the edges whose
+            traversals may have changed and their new traversals
+        """
+
+        weights = weights or {}
+        closed_positions = self.get_edge_positions(closed)
+        weight_positions = self.get_edge_positions(list(weights))
+        new_weights = np.array(list(weights.values()), dtype=np.float64)
+        assert (new_weights >= self.edge_weights[weight_positions]).all(), "Edge weights may only increase."
+
+        affected = self.get_affected_routes(np.concatenate([closed_positions, weight_positions]))
+
+        with profiler.stage('routing', items=len(affected)):
+            routing_arrays = self._get_scenario_arrays(closed_positions, weight_positions, new_weights)
+            route_indptr, new_edges, routed = routing.csr_route_paths(routing_arrays, self.origins[affected],
+                                                                      self.destinations[affected])
+
+        # Remove the old and add the new routes on the edges they traverse
+        old_edges = _gather(self.route_indptr, self.route_edges, affected)
+        touched = np.unique(np.concatenate([old_edges, new_edges]))
+        touched_counts = self.edge_counts[touched] \
+            - np.bincount(np.searchsorted(touched, old_edges), minlength=len(touched)) \
+            + np.bincount(np.searchsorted(touched, new_edges), minlength=len(touched))
+
+        edge_weights = self.edge_weights[new_edges]
+        if len(weight_positions):
+            changed = np.isin(new_edges, weight_positions)
+            sorter = np.argsort(weight_positions)
+            edge_weights[changed] = new_weights[sorter[np.searchsorted(weight_positions, new_edges[changed], sorter=sorter)]]
+        new_costs = np.bincount(np.repeat(np.arange(len(affected)), np.diff(route_indptr)), weights=edge_weights,
+                                minlength=len(affected))
+        added_cost = new_costs[routed].sum() - self.route_costs[affected][routed].sum()
+
+        changed_traversals = np.abs(touched_counts - self.edge_counts[touched]).sum()
+
+        result = {"affected_routes": len(affected),
+                  "unroutable_routes": int((~routed).sum()),
+                  "added_cost": float(added_cost),
+                  "relative_added_cost": float(added_cost / self.route_costs.sum()),
+                  "changed_share": float(changed_traversals / self.edge_counts.sum())}
+
+        return result, touched, touched_counts
+
+
+    def _get_scenario_arrays(self, closed_positions: np.ndarray, weight_positions: np.ndarray, new_weights: np.ndarray):
+        """
+        Copies the weights and edge positions of the baseline routing arrays and chooses the
+        cheapest parallel edge again for the node pairs of the changed edges, pairs without an
+        open edge get an infinite weight
+        :param closed_positions: Array of edge positions of closed edges
+        :param weight_positions: Array of edge positions of reweighted edges
+        :param new_weights: Array of the new weights of the reweighted edges
+        :return: Dictionary of routing arrays (see GraphArrays.routing_arrays)
+        """
+
+        changed_slots = self.edge_slots[np.concatenate([weight_positions, closed_positions])]
+        changed_weights = np.concatenate([new_weights, np.full(len(closed_positions), np.inf)])
+
+        # Collect all parallel edges of the changed node pairs, slots are sorted by node pair
+        pairs = np.unique(self.slot_pairs[changed_slots])
+        starts = np.searchsorted(self.slot_pairs, pairs, side='left')
+        ends = np.searchsorted(self.slot_pairs, pairs, side='right')
+        slots = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] + [np.array([], dtype=np.int64)])
+        slot_weights = self.slot_weights[slots]
+        overrides = np.searchsorted(slots, changed_slots)
+        slot_weights[overrides] = changed_weights
+
+        # Keep the cheapest edge of every pair
+        slot_pairs = self.slot_pairs[slots]
+        order = np.lexsort((slot_weights, slot_pairs))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = slot_pairs[order][1:] != slot_pairs[order][:-1]
+        cheapest = order[first]
+
+        routing_arrays = dict(self.routing_arrays)
+        routing_slots = np.searchsorted(routing_arrays["pair_keys"], pairs)
+        routing_arrays["weights"] = routing_arrays["weights"].astype(np.float64)
+        routing_arrays["weights"][routing_slots] = slot_weights[cheapest]
+        routing_arrays["edge_positions"] = routing_arrays["edge_positions"].copy()
+        routing_arrays["edge_positions"][routing_slots] = self.study_area.graph_arrays.edge_ids[slots[cheapest]]
+
+        return routing_arrays
+
+
+    # Write method to evaluate a batch of scenarios
+    def evaluate_scenarios(self, scenarios: dict):
+        """
+        Evaluates every scenario against the baseline routes
+        :param scenarios: Dictionary of scenario names to dictionaries of 'closed' and 'weights' (see evaluate)
+        :return: Dataframe of the scores of every scenario (see evaluate) indexed by name
+        """
+
+        print(f"Starting to evaluate {len(scenarios)} scenarios..")
+
+        scores = {}
+        for name, scenario in scenarios.items():
+            scores[name], _, _ = self._reroute(scenario.get('closed', ()), scenario.get('weights'))
+
+        print("Done. All scenarios evaluated.")
+
+        return pd.DataFrame.from_dict(scores, orient='index')
+
+
+    # Write method to create closure scenarios of the most central edges
+    def get_closure_scenarios(self, top_n: int = 10, both_directions: bool = True):
+        """
+        Creates one scenario per edge among the top_n edges by traversals of the baseline, which
+        closes the edge and, for two-way streets, all edges of the opposite direction
+        :param top_n: Number of scenarios (default: 10)
+        :param both_directions: Close both directions of a street (default: True)
+        :return: Dictionary of scenario names to dictionaries of 'closed' (see evaluate_scenarios)
+        """
+
+        edge_index = self.study_area.get_edge_index()
+        graph = self.study_area.city_graph
+
+        # The opposite direction of a closed street does not get a scenario of its own
+        scenarios, covered = {}, set()
+        for position in np.argsort(-self.edge_counts, kind='stable').tolist():
+            if len(scenarios) >= top_n or self.edge_counts[position] == 0:
+                break
+            u, v, key = edge_index[position]
+            if (u, v, key) in covered:
+                continue
+            closed = [(u, v, key)]
+            if both_directions and graph.has_edge(v, u):
+                closed += [(v, u, reverse_key) for reverse_key in graph[v][u]]
+            covered.update(closed)
+            scenarios[f"close {u}-{v}-{key}"] = {'closed': closed}
+
+        return scenarios
+
+
+    # Write method to compare the centrality of a scenario with the baseline
+    def get_delta_centrality(self, result: dict):
+        """
+        Calculates the centrality of a scenario, the centrality of the baseline and their difference
+        :param result: Dictionary of a scenario (see evaluate)
+        :return: Geodataframe containing osmid, geometry, centrality, centrality_baseline and
+            centrality_delta of the streets
+        """
+
+        centrality = result['edge_counts'] / result['edge_counts'].sum()
+        baseline = self.edge_counts / self.edge_counts.sum()
+        delta_df = pd.DataFrame({'centrality': centrality, 'centrality_baseline': baseline,
+                                 'centrality_delta': centrality - baseline}, index=self.study_area.get_edge_index())
+
+        return self.study_area._join_edges(delta_df)
+
+
+# Function to collect the entries of several rows of CSR arrays
+def _gather(indptr: np.ndarray, values: np.ndarray, rows: np.ndarray):
+    """
+    Concatenates the entries of the given rows without a python loop
+    :param indptr: CSR offsets
+    :param values: Entries of all rows
+    :param rows: Array of row ids
+    :return: Array of the entries of the rows
+    """
+
+    starts, lengths = indptr[rows], indptr[rows + 1] - indptr[rows]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    return values[np.repeat(starts, lengths) + offsets]
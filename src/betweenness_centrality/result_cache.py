@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# result_cache.py
+
+"""Local storage of edge traversal counts for incremental route-based centrality"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import threading
+import numpy as np
+
+
+class ResultCache:
+    """Size-Bounded On-disk Store of Edge Traversal Counts"""
+
+    def __init__(self, cache_dir: str = "../cache/results", max_bytes: int = 256 * 2**20):
+        """
+        Defines a store in a local folder, the least recently used entries are removed as soon
+        as all entries together need more than max_bytes
+        :param cache_dir: Folder to store the files in
+        :param max_bytes: Upper limit of the size of all entries (default: 256 MiB)
+        """
+        assert isinstance(cache_dir, str), "cache_dir must be of type str."
+        assert max_bytes > 0, "max_bytes must be positive."
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+
+    # Write method to derive the key of a result
+    def get_key(
+        self,
+        city_name: str,
+        fingerprint: str,
+        method: str,
+        route_type: str,
+        seed: int = None,
+        block_routes: int = None
+    ):
+        """
+        Derives the key of an entry, results of another graph, method, route type, seed or
+        block size never share an entry
+        :param city_name: Name of the city
+        :param fingerprint: Fingerprint of the graph (see GraphArrays.fingerprint)
+        :param method: Method to calculate betweenness centrality
+        :param route_type: Route type ('length' or 'travel_time')
+        :param seed: Seed of the run (optional)
+        :param block_routes: Number of routes per block of the run (optional)
+        :return: Key of the entry
+        """
+
+        payload = json.dumps([city_name, fingerprint, method, route_type, seed, block_routes])
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+        name = re.sub(r"[^A-Za-z0-9]+", "_", city_name).strip("_")
+
+        return f"{name}_{method}_{route_type}_{digest}"
+
+
+    def _get_path(self, key: str):
+        """
+        Returns the path of a stored entry
+        :param key: Key of the entry
+        :return: Path of the file
+        """
+        return os.path.join(self.cache_dir, f"{key}.counts.pickle")
+
+
+    # Write method to load an entry
+    def load(self, key: str):
+        """
+        Loads a stored entry and marks it as recently used
+        :param key: Key of the entry
+        :return: Dictionary of the entry (see save) or None if it is not stored
+        """
+
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as file:
+            entry = pickle.load(file)
+        os.utime(path)
+
+        return entry
+
+
+    # Write method to store an entry
+    def save(self, key: str, entry: dict):
+        """
+        Stores an entry and evicts least recently used entries afterwards, the file is written
+        under a temporary name of the process and thread first so that concurrent readers never
+        see a partial file
+        :param key: Key of the entry
+        :param entry: Dictionary of 'entropy' (entropy of the seed of the run) and 'snapshots'
+            (number of routes to dictionary of 'slots' and 'counts', see to_snapshot)
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temp_path, "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+        self.evict(keep=path)
+
+
+    # Write method to keep the store below its size limit
+    def evict(self, keep: str = None):
+        """
+        Removes the least recently used entries until all entries fit into max_bytes
+        :param keep: Path of an entry that is never removed, e.g. the one just stored (optional)
+        :return: List of removed paths
+        """
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".counts.pickle"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.cache_dir, name)))
+
+        removed = []
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            removed.append(path)
+            total -= size
+
+        return removed
+
+
+# Function to convert edge counts into a compact snapshot
+def to_snapshot(edge_counts: np.ndarray):
+    """
+    Stores only the traversed edges of the counts
+    :param edge_counts: Array with the number of traversals per edge
+    :return: Dictionary of 'slots' and 'counts'
+    """
+
+    slots = np.flatnonzero(edge_counts).astype(np.int32)
+
+    return {"slots": slots, "counts": edge_counts[slots]}
+
+
+# Function to restore edge counts of a snapshot
+def from_snapshot(snapshot: dict, num_edges: int):
+    """
+    Restores the edge counts of a snapshot
+    :param snapshot: Dictionary as returned by to_snapshot
+    :param num_edges: Number of edges of the graph
+    :return: Array with the number of traversals per edge
+    """
+
+    edge_counts = np.zeros(num_edges, dtype=np.int64)
+    edge_counts[snapshot["slots"]] = snapshot["counts"]
+
+    return edge_counts
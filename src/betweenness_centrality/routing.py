@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# routing.py
+
+"""Functions for shortest path searches on graph networks"""
+
+import os
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+import numpy as np
+import networkx as nx
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from betweenness_centrality import graph_arrays
+
+
+# Function to compute shortest path trees towards several targets
+def multi_target_dijkstra(graph: nx.MultiDiGraph, source, targets: set, weight: str = "length"):
+    """
+    Runs a single source Dijkstra search that stops as soon as all targets are settled,
+    parallel edges are weighted by their cheapest edge like in networkx
+    :param graph: Graph network
+    :param source: Node id to start the search from
+    :param targets: Set of node ids the search has to settle
+    :param weight: Edge attribute used as weight
+    :return: Dictionary of settled node ids to their predecessor on the shortest path
+    """
+
+    remaining = set(targets)
+    remaining.discard(source)
+
+    settled = {}
+    distances = {source: 0}
+    tie_breaker = count()
+    heap = [(0, next(tie_breaker), source, None)]
+
+    while heap and remaining:
+        distance, _, node, predecessor = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled[node] = predecessor
+        remaining.discard(node)
+
+        for neighbour, edges in graph._succ[node].items():
+            edge_weight = min(data.get(weight, 1) for data in edges.values())
+            neighbour_distance = distance + edge_weight
+            if neighbour not in settled and neighbour_distance < distances.get(neighbour, float("inf")):
+                distances[neighbour] = neighbour_distance
+                heapq.heappush(heap, (neighbour_distance, next(tie_breaker), neighbour, node))
+
+    return settled
+
+
+# Function to draw random origin destination pairs
+def draw_od_pairs(point_nodes: np.ndarray, num_pairs: int, rng: np.random.Generator):
+    """
+    Draws pairs of two different points and returns their nodes, pairs whose points share
+    the same node are dropped
+    :param point_nodes: Array of node ids or positions of the snapped points
+    :param num_pairs: Number of pairs to draw
+    :param rng: Numpy random generator
+    :return: Tuple of arrays of origin and destination nodes
+    """
+
+    origins = rng.integers(len(point_nodes), size=num_pairs)
+    destinations = rng.integers(len(point_nodes) - 1, size=num_pairs)
+    destinations += destinations >= origins
+    origins, destinations = point_nodes[origins], point_nodes[destinations]
+    distinct = origins != destinations
+
+    return origins[distinct], destinations[distinct]
+
+
+# Function to draw random routes on CSR arrays
+def draw_csr_routes(
+    arrays: dict, 
+    point_positions: np.ndarray, 
+    num_routes: int, 
+    rng: np.random.Generator, 
+    chunk_size: int = 64
+):
+    """
+    Draws random routes between points and searches them with csr_route_paths, pairs without
+    a route are drawn again
+    :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+    :param point_positions: Array of node positions of the snapped points
+    :param num_routes: Number of routes to compute
+    :param rng: Numpy random generator
+    :param chunk_size: Number of origins searched per Dijkstra call (default: 64)
+    :return: Tuple of the CSR offsets of the routes and the edge positions of all routes in
+        graph.edges(keys=True) order
+    """
+
+    route_lengths, route_edges = [], []
+    remaining = num_routes
+    while remaining > 0:
+        origins, destinations = draw_od_pairs(point_positions, remaining, rng)
+        route_indptr, edge_positions, routed = csr_route_paths(arrays, origins, destinations, chunk_size)
+        route_lengths.append(np.diff(route_indptr)[routed])
+        route_edges.append(edge_positions)
+        remaining -= int(routed.sum())
+
+    route_lengths = np.concatenate(route_lengths) if route_lengths else np.array([], dtype=np.int64)
+    route_indptr = np.concatenate([[0], np.cumsum(route_lengths)]).astype(np.int64)
+    edge_positions = np.concatenate(route_edges) if route_edges else np.array([], dtype=np.int64)
+
+    return route_indptr, edge_positions
+
+
+# Function to count edge traversals of random routes on CSR arrays
+def count_csr_routes(
+    arrays: dict, 
+    point_positions: np.ndarray, 
+    num_routes: int, 
+    num_edges: int, 
+    rng: np.random.Generator, 
+    chunk_size: int = 64
+):
+    """
+    Draws random routes between points and counts the edge traversals, pairs are grouped by
+    origin and up to chunk_size origins are searched at once with scipy's Dijkstra (see draw_csr_routes)
+    :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+    :param point_positions: Array of node positions of the snapped points
+    :param num_routes: Number of routes to compute
+    :param num_edges: Number of edges of the graph
+    :param rng: Numpy random generator
+    :param chunk_size: Number of origins searched per Dijkstra call (default: 64)
+    :return: Array with the number of traversals per edge
+    """
+
+    _, edge_positions = draw_csr_routes(arrays, point_positions, num_routes, rng, chunk_size)
+
+    return np.bincount(edge_positions, minlength=num_edges).astype(np.int64)
+
+
+# Function to search the routes of given pairs on CSR arrays
+def csr_route_paths(arrays: dict, origins: np.ndarray, destinations: np.ndarray, chunk_size: int = 64):
+    """
+    Searches the shortest route of every origin destination pair and returns its edges, pairs
+    are grouped by origin and up to chunk_size origins are searched at once with scipy's Dijkstra
+    :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+    :param origins: Array of node positions of the origins
+    :param destinations: Array of node positions of the destinations, different from the origins
+    :param chunk_size: Number of origins searched per Dijkstra call (default: 64)
+    :return: Tuple of the CSR offsets of the routes, the edge positions of all routes in pair order
+        and a boolean array marking the pairs that have a route
+    """
+
+    num_nodes = len(arrays["indptr"]) - 1
+    csgraph = csr_matrix((arrays["weights"].astype(np.float64), arrays["indices"], arrays["indptr"]),
+                         shape=(num_nodes, num_nodes))
+
+    order = np.argsort(origins, kind="stable")
+    unique_origins, starts = np.unique(origins[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+
+    paths = [None] * len(origins)
+    for chunk_start in range(0, len(unique_origins), chunk_size):
+        chunk = slice(chunk_start, chunk_start + chunk_size)
+        _, predecessors = dijkstra(csgraph, indices=unique_origins[chunk], return_predecessors=True)
+
+        for row, start, end in zip(predecessors, starts[chunk], ends[chunk]):
+            for pair in order[start:end].tolist():
+                node = destinations[pair]
+                if row[node] < 0:
+                    continue
+                path = [node]
+                while row[node] >= 0:
+                    node = row[node]
+                    path.append(node)
+                paths[pair] = path[::-1]
+
+    routed = np.array([path is not None for path in paths], dtype=bool)
+    route_indptr = np.concatenate([[0], np.cumsum([len(path) - 1 if path else 0 for path in paths])]).astype(np.int64)
+    route_sources = np.fromiter((node for path in paths if path for node in path[:-1]), dtype=np.int64, count=route_indptr[-1])
+    route_targets = np.fromiter((node for path in paths if path for node in path[1:]), dtype=np.int64, count=route_indptr[-1])
+
+    # Look up the CSR slot of every traversed node pair at once
+    slots = np.searchsorted(arrays["pair_keys"], route_sources * num_nodes + route_targets)
+
+    return route_indptr, arrays["edge_positions"][slots].astype(np.int64), routed
+
+
+_worker_blocks = []
+_worker_arrays = {}
+
+
+def _init_worker(spec: dict):
+    """
+    Attaches a worker process to the shared CSR arrays
+    :param spec: Description of the shared arrays (see graph_arrays.share_arrays)
+    """
+
+    global _worker_blocks, _worker_arrays
+    _worker_blocks, _worker_arrays = graph_arrays.attach_arrays(spec)
+
+
+def _count_batch(task: tuple):
+    """
+    Counts the edge traversals of one batch of routes inside a worker process
+    :param task: Tuple of number of routes, number of edges and seed sequence of the batch
+    :return: Array with the number of traversals per edge
+    """
+
+    num_routes, num_edges, seed = task
+    point_positions = _worker_arrays["point_positions"]
+
+    return count_csr_routes(_worker_arrays, point_positions, num_routes, num_edges, np.random.default_rng(seed))
+
+
+# Function to count edge traversals of random routes on several processes
+def parallel_route_counts(
+    arrays: dict, 
+    point_positions: np.ndarray, 
+    num_routes: int, 
+    num_edges: int, 
+    seed: np.random.SeedSequence, 
+    num_workers: int = None, 
+    batches_per_worker: int = 4
+):
+    """
+    Splits the routes into batches with independent random streams and counts them on a process
+    pool, the workers read the CSR arrays from shared memory. The result only depends on the seed
+    and the number of batches, not on the order in which the workers finish
+    :param arrays: Routing arrays of the graph (see GraphArrays.routing_arrays)
+    :param point_positions: Array of node positions of the snapped points
+    :param num_routes: Number of routes to compute
+    :param num_edges: Number of edges of the graph
+    :param seed: Numpy seed sequence the batch streams are spawned from
+    :param num_workers: Number of worker processes (default: number of cpu cores)
+    :param batches_per_worker: Number of batches per worker for load balancing (default: 4)
+    :return: Array with the number of traversals per edge
+    """
+
+    num_workers = num_workers or os.cpu_count()
+    num_batches = max(min(num_workers * batches_per_worker, num_routes), 1)
+    batch_sizes = np.full(num_batches, num_routes // num_batches)
+    batch_sizes[:num_routes % num_batches] += 1
+    tasks = [(int(size), num_edges, child) for size, child in zip(batch_sizes, seed.spawn(num_batches))]
+
+    blocks, spec = graph_arrays.share_arrays({**arrays, "point_positions": point_positions})
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(spec,)) as executor:
+            edge_counts = np.zeros(num_edges, dtype=np.int64)
+            for batch_counts in executor.map(_count_batch, tasks):
+                edge_counts += batch_counts
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return edge_counts
@@ -0,0 +1,871 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# service.py
+
+"""Local analysis service that keeps graphs in memory between centrality jobs"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+import traceback
+import socketserver
+import http.client
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote, unquote
+import pandas as pd
+from betweenness_centrality import profiler
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.result_cache import ResultCache
+import betweenness_centrality.pipeline as pipeline
+
+METHODS = ["geographical", "geographicalPop", "networkx", "all"]
+JOB_OPTIONS = {"seed": int, "tolerance": float, "sample_sources": int, "rel_error": float, "source_weights": str,
+               "backend": str, "workers": int, "dissolve_by": str}
+ALL_OPTIONS = ["seed", "workers"]
+
+
+class AnalyzerCache:
+    """Resident CityAnalyzers with Least Recently Used Eviction by Memory Footprint"""
+
+    def __init__(self, max_bytes: int = 2 * 2**30, store: GraphStore = None, factory=None):
+        """
+        Defines an empty cache, the least recently used cities are removed as soon as all
+        of them together need more than max_bytes (see CityAnalyzer.get_footprint)
+        :param max_bytes: Upper limit of the estimated memory of all cities (default: 2 GiB)
+        :param store: Local store to load graphs and polygons from (optional)
+        :param factory: Function creating the CityAnalyzer of a city name (default: CityAnalyzer with the store)
+        """
+        assert max_bytes > 0, "max_bytes must be positive."
+
+        self.max_bytes = max_bytes
+        self.store = store
+        self.factory = factory if factory is not None else self._create_analyzer
+        self._analyzers = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+
+    def _create_analyzer(self, city: str):
+        """
+        Loads a city with the local store of the cache
+        :param city: Name of the city
+        :return: CityAnalyzer of the city
+        """
+        return CityAnalyzer(city, store=self.store)
+
+
+    # Write method to get the analyzer of a city
+    def get(self, city: str):
+        """
+        Returns the resident analyzer of a city or loads it, a city requested by several jobs
+        at once is loaded only once
+        :param city: Name of the city
+        :return: CityAnalyzer of the city
+        """
+
+        with self._lock:
+            if city in self._analyzers:
+                self._analyzers.move_to_end(city)
+                return self._analyzers[city]
+            city_lock = self._loading.setdefault(city, threading.Lock())
+
+        with city_lock:
+            with self._lock:
+                if city in self._analyzers:
+                    self._analyzers.move_to_end(city)
+                    return self._analyzers[city]
+
+            print(f"Starting to load '{city}' into memory..")
+            study_area = self.factory(city)
+
+            # Jobs sharing the analyzer only read its indexes
+            study_area.build_indexes()
+
+            with self._lock:
+                self._analyzers[city] = study_area
+                self._loading.pop(city, None)
+            self.evict(keep=city)
+
+        return study_area
+
+
+    # Write method to keep the cache below its memory limit
+    def evict(self, keep: str = None):
+        """
+        Removes the least recently used cities until the estimated memory of all cities fits
+        into max_bytes, footprints are estimated again because indexes grow with the jobs
+        :param keep: City that is never removed, e.g. the one just loaded (optional)
+        :return: List of removed cities
+        """
+
+        with self._lock:
+            footprints = {city: study_area.get_footprint() for city, study_area in self._analyzers.items()}
+            total = sum(footprints.values())
+
+            removed = []
+            for city, footprint in footprints.items():
+                if total <= self.max_bytes:
+                    break
+                if city == keep:
+                    continue
+                del self._analyzers[city]
+                removed.append(city)
+                total -= footprint
+
+        for city in removed:
+            print(f"Done. '{city}' removed from memory.")
+
+        return removed
+
+
+    # Write method to remove a city
+    def remove(self, city: str):
+        """
+        Removes a city from the cache, running jobs keep their analyzer until they finish
+        :param city: Name of the city
+        :return: True if the city was resident
+        """
+
+        with self._lock:
+            return self._analyzers.pop(city, None) is not None
+
+
+    # Write method to list the resident cities
+    def get_footprints(self):
+        """
+        Returns the estimated memory of every resident city
+        :return: Dictionary of city names to bytes from least to most recently used
+        """
+
+        with self._lock:
+            return {city: study_area.get_footprint() for city, study_area in self._analyzers.items()}
+
+
+class _ReadWriteLock:
+    """Lock Shared by Readers and Held Alone by a Writer"""
+
+    def __init__(self):
+        """
+        Defines an unlocked lock
+        """
+
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+
+    @contextmanager
+    def read(self):
+        """
+        Holds the lock together with other readers, waits while a writer holds it
+        """
+
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+
+    @contextmanager
+    def write(self):
+        """
+        Holds the lock alone, waits until all readers and writers released it
+        """
+
+        with self._condition:
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class Job:
+    """Centrality Job with its Progress Events"""
+
+    def __init__(self, params: dict):
+        """
+        Defines a queued job
+        :param params: Checked parameters of the job (see check_job)
+        """
+
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.status = "queued"
+        self.events = []
+        self.result = None
+        self.error = None
+        self.seconds = None
+        self.finished = False
+        self.condition = threading.Condition()
+
+
+    # Write method to add an event
+    def add_event(self, event: dict):
+        """
+        Adds an event and wakes up all streams of the job
+        :param event: Dictionary with at least 'type'
+        """
+
+        with self.condition:
+            self.events.append({**event, "time": time.time()})
+            self.condition.notify_all()
+
+
+    # Write method to finish the job
+    def finish(self, status: str, seconds: float, result: dict = None, error: str = None):
+        """
+        Stores the outcome of the job and adds the final event
+        :param status: 'done' or 'failed'
+        :param seconds: Runtime of the job
+        :param result: Result of a finished job (optional)
+        :param error: Error message of a failed job (optional)
+        """
+
+        with self.condition:
+            self.status, self.seconds, self.result, self.error = status, seconds, result, error
+            self.events.append({"type": status, "seconds": seconds, "error": error, "time": time.time()})
+            self.finished = True
+            self.condition.notify_all()
+
+
+    # Write method to follow the events of the job
+    def iter_events(self):
+        """
+        Yields all events of the job, including the ones still to come, until the job finished
+        :return: Generator of event dictionaries
+        """
+
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.events) and not self.finished:
+                    self.condition.wait(timeout=1.0)
+                events, position, finished = self.events[position:], len(self.events), self.finished
+
+            yield from events
+            if finished:
+                return
+
+
+    # Write method to describe the job
+    def to_dict(self):
+        """
+        Summarizes the job without its result
+        :return: Dictionary of id, params, status, seconds, error and number of events
+        """
+        return {"id": self.id, "params": self.params, "status": self.status, "seconds": self.seconds,
+                "error": self.error, "num_events": len(self.events)}
+
+
+class _JobOutput(io.TextIOBase):
+    """Standard Output that Turns the Prints of Job Threads into Progress Events"""
+
+    def __init__(self, stream):
+        """
+        Wraps the standard output, prints of threads without a job are passed through
+        :param stream: Original standard output
+        """
+
+        self.stream = stream
+        self.local = threading.local()
+
+
+    def write(self, text: str):
+        """
+        Adds every printed line of a job thread as progress event of its job
+        :param text: Printed text
+        :return: Number of characters written
+        """
+
+        job = getattr(self.local, "job", None)
+        if job is None:
+            return self.stream.write(text)
+
+        for line in text.splitlines():
+            if line.strip():
+                job.add_event({"type": "progress", "message": line.strip()})
+
+        return len(text)
+
+
+    def flush(self):
+        """
+        Flushes the original standard output
+        """
+        self.stream.flush()
+
+
+class AnalysisService:
+    """Worker Pool Running Centrality Jobs on Resident Graphs"""
+
+    def __init__(
+        self,
+        cache: AnalyzerCache,
+        num_workers: int = 2,
+        raster_path: str = pipeline.RASTER_PATH,
+        result_cache: ResultCache = None,
+        max_jobs: int = 100
+    ):
+        """
+        Defines a service whose jobs run on a thread pool, so that all of them share the
+        resident graphs of the cache. Jobs only read the indexes built when a city is loaded
+        and weight changes wait until no job runs on the city. Routing within a job can use
+        processes with the 'workers' option of the job
+        :param cache: Cache of the resident cities
+        :param num_workers: Number of jobs running at once (default: 2)
+        :param raster_path: Path to the population raster
+        :param result_cache: Store of edge counts of the geographical methods (optional)
+        :param max_jobs: Number of finished jobs kept with their results (default: 100)
+        """
+
+        self.cache = cache
+        self.raster_path = raster_path
+        self.result_cache = result_cache
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._city_locks = {}
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="job")
+
+        # Prints of the analysis become progress events of the job that caused them while a server runs
+        self._output = _JobOutput(sys.stdout)
+        self._captures = 0
+
+
+    # Write method to turn the prints of jobs into progress events
+    def capture_output(self):
+        """
+        Replaces the standard output by a proxy that adds the prints of job threads to their
+        jobs, every call is undone by a call of release_output (see create_server)
+        """
+
+        with self._lock:
+            if self._captures == 0:
+                self._output.stream = sys.stdout
+                sys.stdout = self._output
+            self._captures += 1
+
+
+    # Write method to restore the standard output
+    def release_output(self):
+        """
+        Restores the standard output once the last capture is released
+        """
+
+        with self._lock:
+            self._captures = max(self._captures - 1, 0)
+            if self._captures == 0 and sys.stdout is self._output:
+                sys.stdout = self._output.stream
+
+
+    # Write method to queue a job
+    def submit(self, params: dict):
+        """
+        Checks the parameters of a job and queues it
+        :param params: Dictionary of city, method, type, num_routes and optional options (see check_job)
+        :return: Job
+        """
+
+        job = Job(check_job(params))
+
+        with self._lock:
+            self.jobs[job.id] = job
+            finished = [job_id for job_id, other in self.jobs.items() if other.finished]
+            for job_id in finished[:max(len(finished) - self.max_jobs, 0)]:
+                del self.jobs[job_id]
+
+        job.add_event({"type": "queued"})
+        self._executor.submit(self._run, job)
+
+        return job
+
+
+    def _get_city_lock(self, city: str):
+        """
+        Returns the lock of a city, jobs read the city and weight changes write it
+        :param city: Name of the city
+        :return: _ReadWriteLock
+        """
+
+        with self._lock:
+            return self._city_locks.setdefault(city, _ReadWriteLock())
+
+
+    # Write method to change edge weights of a resident city
+    def set_edge_weights(self, city: str, weights: dict, method: str = "travel_time"):
+        """
+        Changes edge weights of a city once no job runs on it and rebuilds its indexes, jobs
+        queued meanwhile wait and then use the new weights (see CityAnalyzer.set_edge_weights)
+        :param city: Name of the city
+        :param weights: Dictionary of (u, v, key) tuples to their new weight
+        :param method: Edge attribute to change ('length' or 'travel_time')
+        """
+
+        with self._get_city_lock(city).write():
+            study_area = self.cache.get(city)
+            study_area.set_edge_weights(weights, method)
+            study_area.build_indexes()
+
+
+    # Write method to look up a job
+    def get_job(self, job_id: str):
+        """
+        Returns a job by its id
+        :param job_id: Id of the job
+        :return: Job or None if it is unknown
+        """
+
+        with self._lock:
+            return self.jobs.get(job_id)
+
+
+    def _run(self, job: Job):
+        """
+        Runs a job on a worker thread, errors fail the job instead of the worker
+        :param job: Job to run
+        """
+
+        self._output.local.job = job
+        profiler.start_run(job=job.id, **job.params)
+        start = time.perf_counter()
+        job.status = "running"
+        job.add_event({"type": "running"})
+
+        try:
+            params = job.params
+            options = {option: params[option] for option in JOB_OPTIONS if option in params}
+
+            with self._get_city_lock(params["city"]).read():
+                study_area = self.cache.get(params["city"])
+
+                # Other options are rejected for 'all' by check_job
+                if params["method"] == "all":
+                    centrality_gdf = pipeline.compute_all_variants(study_area, params["num_routes"], self.raster_path,
+                                                                   seed=options.get("seed"),
+                                                                   num_workers=options.get("workers", 1))
+                else:
+                    num_workers = options.pop("workers", 1)
+                    centrality_gdf, _ = pipeline.compute_centrality(study_area, params["method"], params["type"],
+                                                                    params["num_routes"], self.raster_path,
+                                                                    num_workers=num_workers,
+                                                                    result_cache=self.result_cache, **options)
+
+            job.finish("done", time.perf_counter() - start, result=to_result(centrality_gdf, params["geometry"]))
+
+        except Exception as e:
+            traceback.print_exc(file=self._output.stream)
+            job.finish("failed", time.perf_counter() - start, error=str(e))
+
+        finally:
+            self._output.local.job = None
+
+
+    # Write method to stop the service
+    def close(self):
+        """
+        Waits for the running jobs
+        """
+
+        self._executor.shutdown(wait=True)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP Interface of the Analysis Service"""
+
+    def address_string(self):
+        """
+        Returns the client address, Unix socket clients have none
+        :return: Client address
+        """
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+
+    def _send_json(self, status: int, obj):
+        """
+        Sends a JSON response
+        :param status: HTTP status code
+        :param obj: Object to send
+        """
+
+        body = json.dumps(obj, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self):
+        """
+        Answers /health, /cities, /jobs, /jobs/<id>, /jobs/<id>/result and streams /jobs/<id>/events
+        """
+
+        service = self.server.service
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+
+        if parts in (["health"], ["cities"]):
+            self._send_json(200, {"status": "ok", "cities": service.cache.get_footprints()})
+            return
+        if parts == ["jobs"]:
+            with service._lock:
+                self._send_json(200, [job.to_dict() for job in service.jobs.values()])
+            return
+
+        job = service.get_job(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._send_json(404, {"error": f"Unknown path '{url.path}'."})
+        elif len(parts) == 2:
+            self._send_json(200, job.to_dict())
+        elif parts[2] == "result":
+            if job.status != "done":
+                self._send_json(409, {"error": f"Job is {job.status}.", "job": job.to_dict()})
+            else:
+                self._send_json(200, job.result)
+        elif parts[2] == "events":
+            include_result = parse_qs(url.query).get("result", ["true"])[0].lower() != "false"
+            self._stream_events(job, include_result)
+        else:
+            self._send_json(404, {"error": f"Unknown path '{url.path}'."})
+
+
+    def _stream_events(self, job: Job, include_result: bool = True):
+        """
+        Streams the events of a job as JSON lines while it runs, the result follows the final event
+        :param job: Job to follow
+        :param include_result: Send the result of a finished job as last line (default: True)
+        """
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        for event in job.iter_events():
+            self.wfile.write((json.dumps(event, default=str) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        if include_result and job.status == "done":
+            self.wfile.write((json.dumps({"type": "result", "result": job.result}, default=str) + "\n").encode("utf-8"))
+
+
+    def do_POST(self):
+        """
+        Queues a job posted to /jobs
+        """
+
+        if urlsplit(self.path).path.strip("/") != "jobs":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'."})
+            return
+
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = self.server.service.submit(params)
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self._send_json(202, job.to_dict())
+
+
+    def do_DELETE(self):
+        """
+        Removes a city from memory with /cities/<city>
+        """
+
+        parts = [unquote(part) for part in urlsplit(self.path).path.strip("/").split("/") if part]
+        if len(parts) != 2 or parts[0] != "cities":
+            self._send_json(404, {"error": f"Unknown path '{self.path}'."})
+            return
+
+        self._send_json(200, {"removed": self.server.service.cache.remove(parts[1])})
+
+
+class _ServiceServer:
+    """Server Mixin Releasing the Standard Output of its Service when it is Closed"""
+
+    daemon_threads = True
+
+    def server_close(self):
+        """
+        Closes the socket and restores the standard output (see AnalysisService.capture_output)
+        """
+
+        super().server_close()
+        self.service.release_output()
+
+
+class _TCPHTTPServer(_ServiceServer, ThreadingHTTPServer):
+    """Threading HTTP Server on a Local Port"""
+
+
+class _UnixHTTPServer(_ServiceServer, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threading HTTP Server on a Unix Socket"""
+
+
+# Function to check the parameters of a job
+def check_job(params: dict):
+    """
+    Checks and converts the parameters of a job like the command line arguments of main.py
+    :param params: Dictionary of city, method, type and num_routes and the optional seed, tolerance,
+        sample_sources, rel_error, source_weights, backend, workers, dissolve_by and geometry (default: True),
+        method 'all' only takes seed and workers
+    :return: Dictionary of checked parameters
+    """
+
+    checked = {"city": str(params["city"]), "method": params["method"], "type": params.get("type", "length"),
+               "num_routes": int(params["num_routes"]), "geometry": bool(params.get("geometry", True))}
+    assert checked["method"] in METHODS, f"method must be in {METHODS}."
+    assert checked["type"] in pipeline.ROUTE_TYPES, f"type must be in {pipeline.ROUTE_TYPES}."
+    assert checked["num_routes"] >= 0, "num_routes must not be negative."
+
+    for option, option_type in JOB_OPTIONS.items():
+        if params.get(option) is not None:
+            checked[option] = option_type(params[option])
+
+    if checked["method"] == "all":
+        unsupported = [option for option in JOB_OPTIONS if option in checked and option not in ALL_OPTIONS]
+        assert not unsupported, f"method 'all' only supports the options {ALL_OPTIONS}, got {unsupported}."
+
+    return checked
+
+
+# Function to convert a centrality geodataframe into a JSON result
+def to_result(centrality_gdf, geometry: bool = True):
+    """
+    Converts a centrality geodataframe into a GeoJSON feature collection or, without geometry,
+    into a list of records
+    :param centrality_gdf: Geodataframe containing centrality values
+    :param geometry: Keep the geometries (default: True)
+    :return: Dictionary of a GeoJSON feature collection or of 'records'
+    """
+
+    if "u" not in centrality_gdf.columns:
+        centrality_gdf = centrality_gdf.reset_index()
+
+    if geometry:
+        return json.loads(centrality_gdf.to_json(drop_id=True))
+
+    return {"records": json.loads(pd.DataFrame(centrality_gdf.drop(columns="geometry")).to_json(orient="records"))}
+
+
+# Function to create the server of a service
+def create_server(service: AnalysisService, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None):
+    """
+    Creates an HTTP server on a local port or a Unix socket, requests are answered on
+    their own threads so that event streams never block other requests. The prints of jobs
+    become progress events until the server is closed
+    :param service: AnalysisService answering the requests
+    :param host: Host to listen on (default: 127.0.0.1)
+    :param port: Port to listen on, 0 picks a free port (default: 8765)
+    :param socket_path: Path of a Unix socket to listen on instead of the port (optional)
+    :return: Server, run it with serve_forever
+    """
+
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+    else:
+        server = _TCPHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    service.capture_output()
+
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP Connection over a Unix Socket"""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        """
+        Defines a connection to a Unix socket
+        :param socket_path: Path of the socket
+        :param timeout: Timeout of the socket in seconds (optional)
+        """
+
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+
+    def connect(self):
+        """
+        Connects to the Unix socket
+        """
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceClient:
+    """Client of a Local Analysis Service"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, socket_path: str = None, timeout: float = 3600):
+        """
+        Defines a client of a service on a local port or a Unix socket
+        :param host: Host of the service (default: 127.0.0.1)
+        :param port: Port of the service (default: 8765)
+        :param socket_path: Path of the Unix socket of the service instead of the port (optional)
+        :param timeout: Timeout of requests in seconds (default: 3600)
+        """
+
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+
+    def _connect(self):
+        """
+        Opens a connection to the service
+        :return: HTTPConnection
+        """
+
+        if self.socket_path is not None:
+            return _UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+
+    def _request(self, method: str, path: str, body: dict = None):
+        """
+        Sends a request and parses the JSON response
+        :param method: HTTP method
+        :param path: Path of the request
+        :param body: JSON body (optional)
+        :return: Tuple of HTTP status code and parsed response
+        """
+
+        connection = self._connect()
+        try:
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read() or b"null")
+        finally:
+            connection.close()
+
+
+    # Write method to queue a job
+    def submit(self, city: str, method: str, route_type: str = "length", num_routes: int = 1000, **options):
+        """
+        Queues a centrality job
+        :param city: Name of the city
+        :param method: Method to calculate betweenness centrality (see METHODS)
+        :param route_type: Route type ('length' or 'travel_time')
+        :param num_routes: Number of routes
+        :param options: Optional parameters of the job (see check_job)
+        :return: Id of the job
+        """
+
+        status, response = self._request("POST", "/jobs", {"city": city, "method": method, "type": route_type,
+                                                           "num_routes": num_routes, **options})
+        if status != 202:
+            raise ValueError(response["error"])
+
+        return response["id"]
+
+
+    # Write method to follow the events of a job
+    def stream(self, job_id: str, include_result: bool = True):
+        """
+        Follows the events of a job while it runs
+        :param job_id: Id of the job
+        :param include_result: Receive the result as last event (default: True)
+        :return: Generator of event dictionaries
+        """
+
+        connection = self._connect()
+        try:
+            connection.request("GET", f"/jobs/{job_id}/events?result={str(include_result).lower()}")
+            response = connection.getresponse()
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            connection.close()
+
+
+    # Write method to run a job and wait for its result
+    def run(self, city: str, method: str, route_type: str = "length", num_routes: int = 1000, on_progress=print, **options):
+        """
+        Queues a job, passes its progress messages on and returns its result
+        :param city: Name of the city
+        :param method: Method to calculate betweenness centrality (see METHODS)
+        :param route_type: Route type ('length' or 'travel_time')
+        :param num_routes: Number of routes
+        :param on_progress: Function called with every progress message (default: print)
+        :param options: Optional parameters of the job (see check_job)
+        :return: Result of the job (see to_result)
+        """
+
+        job_id = self.submit(city, method, route_type, num_routes, **options)
+        for event in self.stream(job_id):
+            if event["type"] == "progress" and on_progress is not None:
+                on_progress(event["message"])
+            elif event["type"] == "failed":
+                raise RuntimeError(f"Job {job_id} failed: {event['error']}")
+            elif event["type"] == "result":
+                return event["result"]
+
+
+    # Write method to get the state of a job
+    def get_job(self, job_id: str):
+        """
+        Returns the state of a job
+        :param job_id: Id of the job
+        :return: Dictionary of the job (see Job.to_dict)
+        """
+        return self._request("GET", f"/jobs/{job_id}")[1]
+
+
+    # Write method to get the result of a finished job
+    def get_result(self, job_id: str):
+        """
+        Returns the result of a finished job
+        :param job_id: Id of the job
+        :return: Result of the job (see to_result)
+        """
+
+        status, response = self._request("GET", f"/jobs/{job_id}/result")
+        if status != 200:
+            raise ValueError(response["error"])
+
+        return response
+
+
+    # Write method to list the resident cities
+    def get_cities(self):
+        """
+        Returns the cities in memory of the service
+        :return: Dictionary of city names to their estimated bytes
+        """
+        return self._request("GET", "/cities")[1]["cities"]
+
+
+    # Write method to remove a city from memory
+    def remove_city(self, city: str):
+        """
+        Removes a city from memory of the service
+        :param city: Name of the city
+        :return: True if the city was resident
+        """
+        return self._request("DELETE", f"/cities/{quote(city, safe='')}")[1]["removed"]
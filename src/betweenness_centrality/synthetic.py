@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# synthetic.py
+
+"""Synthetic graph networks, polygons and population rasters for offline runs"""
+
+import numpy as np
+import networkx as nx
+import geopandas as gpd
+import shapely
+import rasterio
+from rasterio.transform import from_origin
+from scipy.spatial import cKDTree
+from shapely.geometry import Polygon
+
+ORIGIN = (8.6, 49.4)
+HIGHWAY_TYPES = ["primary", "secondary", "tertiary", "residential"]
+HIGHWAY_SPEEDS = {"primary": 65, "secondary": 60, "tertiary": 50, "residential": 30}
+
+
+# Function to add osmnx attributes to node pairs and build the graph
+def _build_graph(x: np.ndarray, y: np.ndarray, pairs: np.ndarray, rng: np.random.Generator):
+    """
+    Builds an osmnx compatible graph with both directions of every node pair, edges carry
+    osmid, highway, length (great circle distance in meters), travel_time and geometry
+    :param x: Longitudes of the nodes
+    :param y: Latitudes of the nodes
+    :param pairs: Array of shape (n, 2) with the node positions of every street
+    :param rng: Numpy random generator
+    :return: Graph network
+    """
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    graph.add_nodes_from((node, {"x": float(x[node]), "y": float(y[node])}) for node in range(len(x)))
+
+    u, v = pairs[:, 0], pairs[:, 1]
+    lat_u, lat_v, lon_u, lon_v = np.radians(y[u]), np.radians(y[v]), np.radians(x[u]), np.radians(x[v])
+    h = np.sin((lat_v - lat_u) / 2) ** 2 + np.cos(lat_u) * np.cos(lat_v) * np.sin((lon_v - lon_u) / 2) ** 2
+    lengths = 2 * 6_371_009 * np.arcsin(np.sqrt(h))
+
+    highways = rng.choice(HIGHWAY_TYPES, size=len(pairs), p=[0.05, 0.1, 0.25, 0.6])
+    speeds = np.array([HIGHWAY_SPEEDS[highway] for highway in highways], dtype=float)
+    travel_times = lengths / (speeds * 1000 / 3600)
+
+    forward = shapely.linestrings(np.stack([np.column_stack([x[u], y[u]]), np.column_stack([x[v], y[v]])], axis=1))
+    backward = shapely.linestrings(np.stack([np.column_stack([x[v], y[v]]), np.column_stack([x[u], y[u]])], axis=1))
+
+    for osmid, (a, b) in enumerate(pairs.tolist()):
+        attributes = {"osmid": osmid, "highway": str(highways[osmid]), "length": float(lengths[osmid]),
+                      "speed_kph": float(speeds[osmid]), "travel_time": float(travel_times[osmid])}
+        graph.add_edge(a, b, geometry=forward[osmid], **attributes)
+        graph.add_edge(b, a, geometry=backward[osmid], **attributes)
+
+    return graph
+
+
+# Function to build a grid graph network
+def grid_graph(num_edges: int = 1000, spacing: float = 0.001, seed: int = None):
+    """
+    Builds a square grid of two way streets with about num_edges directed edges
+    :param num_edges: Approximate number of directed edges
+    :param spacing: Distance of neighbouring nodes in degrees (default: 0.001)
+    :param seed: Seed of the highway types (optional)
+    :return: Graph network
+    """
+
+    # A grid of size x size nodes has 4 * size * (size - 1) directed edges
+    size = max(2, int(np.ceil((1 + np.sqrt(1 + num_edges)) / 2)))
+    i, j = np.divmod(np.arange(size * size), size)
+    x = ORIGIN[0] + i * spacing
+    y = ORIGIN[1] + j * spacing
+
+    nodes = np.arange(size * size).reshape(size, size)
+    pairs = np.concatenate([np.column_stack([nodes[:-1, :].ravel(), nodes[1:, :].ravel()]),
+                            np.column_stack([nodes[:, :-1].ravel(), nodes[:, 1:].ravel()])])
+
+    return _build_graph(x, y, pairs, np.random.default_rng(seed))
+
+
+# Function to build a random geometric graph network
+def random_geometric_graph(num_edges: int = 1000, neighbours: int = 3, spacing: float = 0.001, seed: int = None):
+    """
+    Builds a graph of randomly placed nodes where every node is connected to its nearest
+    neighbours by two way streets, only the largest connected component is kept
+    :param num_edges: Approximate number of directed edges
+    :param neighbours: Number of nearest neighbours each node is connected to (default: 3)
+    :param spacing: Mean distance of neighbouring nodes in degrees (default: 0.001)
+    :param seed: Seed for node positions and highway types (optional)
+    :return: Graph network
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Every node adds neighbours streets, a third of them is found from both ends
+    num_nodes = max(neighbours + 1, int(num_edges / (1.25 * neighbours)))
+    extent = spacing * np.sqrt(num_nodes)
+    x = ORIGIN[0] + rng.uniform(0, extent, num_nodes)
+    y = ORIGIN[1] + rng.uniform(0, extent, num_nodes)
+
+    _, nearest = cKDTree(np.column_stack([x, y])).query(np.column_stack([x, y]), k=neighbours + 1)
+    pairs = np.column_stack([np.repeat(np.arange(num_nodes), neighbours), nearest[:, 1:].ravel()])
+    pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+
+    # Keep the largest component and renumber its nodes
+    components = nx.connected_components(nx.Graph(pairs.tolist()))
+    keep = np.array(sorted(max(components, key=len)))
+    positions = np.full(num_nodes, -1)
+    positions[keep] = np.arange(len(keep))
+    pairs = positions[pairs]
+    pairs = pairs[(pairs >= 0).all(axis=1)]
+
+    return _build_graph(x[keep], y[keep], pairs, rng)
+
+
+# Function to build a boundary polygon around a graph
+def boundary_polygon(graph: nx.MultiDiGraph):
+    """
+    Builds a concave polygon within the extent of a graph, the notch makes point in polygon
+    tests reject part of the bounding box like real city boundaries
+    :param graph: Graph network
+    :return: Polygon as geodataframe
+    """
+
+    x = [data["x"] for _, data in graph.nodes(data=True)]
+    y = [data["y"] for _, data in graph.nodes(data=True)]
+    minx, miny, maxx, maxy = min(x), min(y), max(x), max(y)
+    shell = [(minx, miny), (maxx, miny), (maxx, maxy),
+             ((minx + maxx) / 2, miny + (maxy - miny) / 4), (minx, maxy)]
+
+    return gpd.GeoDataFrame(geometry=[Polygon(shell)], crs=4326)
+
+
+# Function to write a population raster covering a polygon
+def population_raster(
+    filepath: str,
+    poly: gpd.GeoDataFrame,
+    cell_size: float = 0.0005,
+    num_centers: int = 5,
+    seed: int = None
+):
+    """
+    Writes a GeoTIFF of population counts covering the bounds of a polygon, the population
+    decreases around a few random centers and a quarter of the cells is unpopulated
+    :param filepath: Path of the raster file
+    :param poly: Polygon as geodataframe
+    :param cell_size: Cell size in degrees (default: 0.0005)
+    :param num_centers: Number of population centers (default: 5)
+    :param seed: Seed for the population centers (optional)
+    :return: Path of the raster file
+    """
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = poly.total_bounds
+    width = max(1, int(np.ceil((maxx - minx) / cell_size)))
+    height = max(1, int(np.ceil((maxy - miny) / cell_size)))
+
+    rows, cols = np.mgrid[0:height, 0:width]
+    values = np.zeros((height, width), dtype=np.float32)
+    for row, col in zip(rng.uniform(0, height, num_centers), rng.uniform(0, width, num_centers)):
+        radius = max(width, height) / 4
+        values += 100 * np.exp(-((rows - row) ** 2 + (cols - col) ** 2) / (2 * radius ** 2))
+    values[rng.uniform(size=values.shape) < 0.25] = 0
+
+    with rasterio.open(filepath, "w", driver="GTiff", width=width, height=height, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(minx, maxy, cell_size, cell_size)) as dataset:
+        dataset.write(values, 1)
+
+    return filepath
@@ -4,10 +4,13 @@
 
 """Main Program Execution File to Calculate Betweenness Centrality"""
 
-
+import os
 from betweenness_centrality.city_analyzer import CityAnalyzer
-from betweenness_centrality.raster_analyzer import RasterAnalyzer
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.result_cache import ResultCache
+from betweenness_centrality import profiler
 import betweenness_centrality.file_handler as file_handler
+import betweenness_centrality.pipeline as pipeline
 
 
 def main():
@@ -15,62 +18,54 @@ def main():
     Main function to process command line arguments and execute the specified analysis.
     """
 
-    city, method, type, num_routes = file_handler.check_input_arguments()
-    num_points = num_routes * 2
-    num_points_raster = num_points * 4
-
-    # Define raster path
-    raster_path = "../data/GHS_POP_WGS84.tif"
-
-    # Create output folders if not exist
-    folder_name = "../output"
-    subfolder_name = f"../output/{city}_{method}_{type}_{num_routes}"
-    
-    file_handler.create_output_folder(folder_name)
-    file_handler.create_output_folder(subfolder_name)
-
-    # Method geographical
-    if method == "geographical":
-        header = f"Geographical, route type: {type}"
-        study_area = CityAnalyzer(city)
-        area_poly = study_area.get_poly()
-        area_points = study_area.get_points(area_poly, num_points)
-        area_routes = study_area.get_routes(area_points, num_routes, type)
-        centrality_gdf = study_area.get_geocentrality(area_routes)
-
-        # Plot and save Centrality as image and geopackage
-        file_handler.plot_centrality(centrality_gdf, header, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.png")
-        file_handler.gdf_to_gpkg(centrality_gdf, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.gpkg")
-
-    # Method geographicalPop
-    elif method == "geographicalPop":
-        header = f"GeographicalPop, route type: {type}"
-        study_area = CityAnalyzer(city)
-        raster = RasterAnalyzer(raster_path)
-        raster.open()
-        area_poly = study_area.get_poly()
-        area_points = study_area.get_points(area_poly, num_points_raster)
-        raster_points = raster.get_point_values(area_points)
-        raster_points_weighted = raster.get_weighted_points(raster_points, num_points)
-        area_routes = study_area.get_routes(raster_points_weighted, num_routes, type)
-        centrality_gdf = study_area.get_geocentrality(area_routes)
-
-        # Plot and save Centrality as image and geopackage
-        file_handler.plot_centrality(centrality_gdf, header, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.png")
-        file_handler.gdf_to_gpkg(centrality_gdf, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.gpkg")
-
-    # Method networkx
-    elif method == "networkx":
-        header = f"NetworkX, route type: {type}"
-        study_area = CityAnalyzer(city)
-        centrality_gdf = study_area.get_netcentrality(type)
-
-        # Plot and save Centrality as image and geopackage
-        file_handler.plot_centrality(centrality_gdf, header, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.png")
-        file_handler.gdf_to_gpkg(centrality_gdf, f"{subfolder_name}/{city}_{method}_{type}_{num_routes}.gpkg")
-
-    else:
-        print("Wrong method selected.")
+    args = file_handler.check_input_arguments()
+    city, method, type, num_routes = args.city, args.method, args.type, args.num_routes
+
+    # Record time and memory of every stage for the run report, optionally under cProfile
+    name = pipeline.get_output_name(city, method, type, num_routes) if method != "all" else f"{city}_all_{num_routes}"
+    profile_path = None
+    if args.profile_stage is not None:
+        file_handler.create_output_folder(f"../output/{name}")
+        profile_path = f"../output/{name}/{name}_{args.profile_stage}.prof"
+    profiler.start_run(args.profile_stage, profile_path, arguments=vars(args))
+
+    # Define local store for graphs and polygons and the cache of edge counts of earlier runs
+    store = GraphStore(args.cache_dir) if args.cache_dir != "none" else None
+    result_cache = None
+    if store is not None and args.result_cache_mb > 0:
+        result_cache = ResultCache(os.path.join(args.cache_dir, "results"), args.result_cache_mb * 2**20)
+
+    # Route large regions tile by tile without loading their whole graph
+    if args.tile_size is not None:
+        work_dir = os.path.join(args.cache_dir if store is not None else "../cache", "regions")
+        centrality_gdf, header = pipeline.compute_tiled_centrality(
+            city, method, type, num_routes, args.tile_size * 1000, args.tile_buffer, pipeline.RASTER_PATH,
+            seed=args.seed, num_workers=args.workers, store=store, osm_file=args.osm_file, work_dir=work_dir)
+        pipeline.write_outputs(centrality_gdf, header, "../output", name, show=args.show,
+                               output_format=args.output_format, chunk_size=args.chunk_size, tile_zooms=args.tiles)
+        return
+
+    study_area = CityAnalyzer(city, store=store, osm_file=args.osm_file, contract=args.contract,
+                              routing_engine=args.routing_engine)
+
+    # Compute every method for both route types on the same points and shortest path trees
+    if method == "all":
+        variants_gdf = pipeline.compute_all_variants(study_area, num_routes, pipeline.RASTER_PATH, seed=args.seed,
+                                                     num_workers=args.workers)
+        pipeline.write_variant_outputs(variants_gdf, "../output", name, show=args.show,
+                                       output_format=args.output_format, chunk_size=args.chunk_size,
+                                       tile_zooms=args.tiles)
+        return
+
+    centrality_gdf, header = pipeline.compute_centrality(
+        study_area, method, type, num_routes, pipeline.RASTER_PATH, seed=args.seed, tolerance=args.tolerance,
+        num_workers=args.workers, sample_sources=args.sample_sources, rel_error=args.rel_error,
+        source_weights=args.source_weights, backend=args.backend, result_cache=result_cache,
+        dissolve_by=args.dissolve)
+
+    # Plot and save Centrality as image and geopackage in the output folder
+    pipeline.write_outputs(centrality_gdf, header, "../output", name, show=args.show,
+                           output_format=args.output_format, chunk_size=args.chunk_size, tile_zooms=args.tiles)
 
 
 if __name__ == "__main__":
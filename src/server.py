@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# server.py
+
+"""Execution File of a Local Analysis Service Keeping Graphs in Memory"""
+
+import os
+import argparse
+import matplotlib
+matplotlib.use("Agg")
+
+import betweenness_centrality.pipeline as pipeline
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.result_cache import ResultCache
+from betweenness_centrality.service import AnalyzerCache, AnalysisService, create_server
+
+
+def main():
+    """
+    Main function to serve centrality jobs on resident graphs until it is interrupted.
+    """
+
+    parser = argparse.ArgumentParser(description="Serve betweenness centrality jobs on graphs kept in memory.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="host to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--socket", type=str, default=None, help="path of a unix socket to listen on instead of the port")
+    parser.add_argument("--workers", type=int, default=2, help="number of jobs running at once")
+    parser.add_argument("--memory-mb", type=int, default=2048, help="estimated memory of all cities kept in memory")
+    parser.add_argument("--cache-dir", type=str, default="../cache",
+                        help="folder to store downloaded graphs, polygons and results in, 'none' disables the stores")
+    parser.add_argument("--raster", type=str, default=pipeline.RASTER_PATH, help="path to the population raster")
+    args = parser.parse_args()
+
+    store, result_cache = None, None
+    if args.cache_dir != "none":
+        store = GraphStore(args.cache_dir)
+        result_cache = ResultCache(os.path.join(args.cache_dir, "results"))
+
+    service = AnalysisService(AnalyzerCache(args.memory_mb * 2**20, store=store), args.workers, args.raster,
+                              result_cache=result_cache)
+    server = create_server(service, args.host, args.port, args.socket)
+    print(f"Serving on {args.socket or f'http://{args.host}:{server.server_address[1]}'}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_batch_runner.py
+
+"""Unit tests for batch_runner.py"""
+
+import unittest
+import os
+import json
+import sys
+import tempfile
+import matplotlib
+matplotlib.use("Agg")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import batch_runner
+from betweenness_centrality.city_analyzer import HWY_SPEEDS
+from betweenness_centrality.graph_store import GraphStore
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Implement a Test Class for Unit Tests
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        # Store a synthetic city so that no download is needed
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.folder.name, "cache")
+        self.output_folder = os.path.join(self.folder.name, "output")
+        store = GraphStore(self.cache_dir)
+        key = store.get_key("Synthetic", "drive", HWY_SPEEDS)
+        store.save_graph(key, synthetic_graph())
+        store.save_poly(key, synthetic_poly())
+
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+    # Check reading a CSV manifest
+    def test_read_manifest(self):
+        filepath = os.path.join(self.folder.name, "manifest.csv")
+        with open(filepath, "w") as file:
+            file.write("city,method,type,num_routes\nSynthetic,geographical,length,10\n")
+
+        jobs = batch_runner.read_manifest(filepath)
+        self.assertEqual(jobs, [{"city": "Synthetic", "method": "geographical", "type": "length", "num_routes": 10}])
+
+
+    # Check that a failing job does not stop the other jobs of a city
+    def test_run_city_jobs(self):
+        jobs = [{"city": "Synthetic", "method": "geographicalPop", "type": "length", "num_routes": 10},
+                {"city": "Synthetic", "method": "geographical", "type": "length", "num_routes": 10}]
+        options = {"output_folder": self.output_folder, "cache_dir": self.cache_dir,
+                   "raster_path": os.path.join(self.folder.name, "missing.tif"), "seed": 1}
+
+        results = batch_runner.run_city_jobs("Synthetic", jobs, options)
+
+        self.assertEqual([result["status"] for result in results], ["failed", "done"])
+        self.assertTrue(os.path.exists(os.path.join(results[1]["output"], "Synthetic_geographical_length_10.gpkg")))
+
+        # The report of the job contains the loading of the shared graph
+        with open(os.path.join(results[1]["output"], "Synthetic_geographical_length_10_report.json")) as file:
+            report = json.load(file)
+        self.assertEqual(report["info"]["method"], "geographical")
+        self.assertIn("graph_build", report["stages"])
+        self.assertIn("routing", report["stages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
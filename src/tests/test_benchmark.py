@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_benchmark.py
+
+"""Unit tests for synthetic.py and benchmark.py"""
+
+import unittest
+import os
+import sys
+import json
+import tempfile
+import matplotlib
+matplotlib.use("Agg")
+import osmnx as ox
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import synthetic, benchmark
+from betweenness_centrality.raster_analyzer import RasterAnalyzer
+
+
+# Implement a Test Class for Unit Tests
+class TestBenchmark(unittest.TestCase):
+
+    # Check that the synthetic graphs are osmnx compatible and close to the requested size
+    def test_synthetic_graphs(self):
+        for kind, build in benchmark.GRAPH_KINDS.items():
+            city_graph = build(2000, seed=1)
+            self.assertLess(abs(city_graph.number_of_edges() - 2000), 400, kind)
+
+            edges = ox.graph_to_gdfs(city_graph, nodes=False)
+            for column in ["osmid", "length", "travel_time", "geometry"]:
+                self.assertTrue(column in edges.columns)
+            self.assertTrue((edges["length"] > 0).all())
+
+
+    # Check polygon and population raster
+    def test_synthetic_raster(self):
+        city_graph = synthetic.grid_graph(500)
+        city_poly = synthetic.boundary_polygon(city_graph)
+
+        with tempfile.TemporaryDirectory() as folder:
+            raster = RasterAnalyzer(synthetic.population_raster(os.path.join(folder, "pop.tif"), city_poly, seed=1))
+            raster.open()
+            points = raster.get_population_points(city_poly, num_points=100, rng=1)
+            self.assertEqual(len(points), 100)
+            self.assertTrue((points["raster_value"] > 0).all())
+            raster.dataset.close()
+
+
+    # Check that the benchmark measures every stage and writes JSON
+    def test_run_benchmarks(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output_path = os.path.join(folder, "benchmark.json")
+            benchmark.run_benchmarks(output_path, sizes=[300], kinds=["grid"], num_routes=5, num_points=50)
+
+            with open(output_path) as file:
+                report = json.load(file)
+            stages = report["results"][0]["stages"]
+            for stage in ["get_points", "get_routes", "get_geocentrality", "get_netcentrality",
+                          "get_point_values", "get_weighted_points", "gdf_to_gpkg", "plot_centrality"]:
+                self.assertGreaterEqual(stages[stage]["seconds"], 0)
+                self.assertGreater(stages[stage]["peak_bytes"], 0)
+
+            self.assertGreater(stages["alt_queries"]["queries_per_second"], 0)
+            self.assertEqual(stages["alt_queries"]["same_routes"], stages["dijkstra_queries"]["queries"])
+
+
+if __name__ == "__main__":
+    unittest.main()
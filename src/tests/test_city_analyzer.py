@@ -5,13 +5,22 @@
 """Unit tests for city_analyzer.py"""
 
 import unittest
+import numpy as np
 import networkx as nx
+import osmnx as ox
 import geopandas as gpd
-from shapely.geometry import Point
+from shapely.geometry import LineString, Polygon
+import os
 import sys
+import tempfile
+import json
+import threading
 
-sys.path.append("../betweenness_centrality")
-from city_analyzer import CityAnalyzer 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality.city_analyzer import CityAnalyzer, HWY_SPEEDS
+from betweenness_centrality.graph_store import GraphStore, graph_from_osm_file
+from betweenness_centrality.centrality import array_edge_betweenness, routed_edge_betweenness
+from betweenness_centrality import profiler, routing
 
 
 # Implement a Test Class for Unit Tests
@@ -102,5 +111,380 @@ class TestCityAnalyzer(unittest.TestCase):
         self.assertTrue("centrality" in city_netcentrality_gdf.columns)
 
 
+# Build a small osmnx-like grid graph that does not require a download
+def synthetic_graph(size: int = 6, spacing: float = 0.001):
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(size):
+        for j in range(size):
+            graph.add_node(i * size + j, x=8.6 + i * spacing, y=49.4 + j * spacing)
+
+    osmid = 0
+    for i in range(size):
+        for j in range(size):
+            for di, dj in [(1, 0), (0, 1)]:
+                if i + di >= size or j + dj >= size:
+                    continue
+                u, v = i * size + j, (i + di) * size + (j + dj)
+                length = 100.0 + (i * 7 + j * 3) % 11
+                for a, b in [(u, v), (v, u)]:
+                    geometry = LineString([(graph.nodes[a]["x"], graph.nodes[a]["y"]),
+                                           (graph.nodes[b]["x"], graph.nodes[b]["y"])])
+                    graph.add_edge(a, b, osmid=osmid, length=length, travel_time=length / 8.3,
+                                   geometry=geometry)
+                osmid += 1
+    return graph
+
+
+# Concave polygon covering the synthetic graph
+def synthetic_poly(size: int = 6, spacing: float = 0.001):
+    extent = (size - 1) * spacing
+    shell = [(8.6, 49.4), (8.6 + extent, 49.4), (8.6 + extent, 49.4 + extent),
+             (8.6 + extent / 2, 49.4 + extent / 4), (8.6, 49.4 + extent)]
+    return gpd.GeoDataFrame(geometry=[Polygon(shell)], crs=4326)
+
+
+# Implement a Test Class for Unit Tests without network access
+class TestCityAnalyzerOffline(unittest.TestCase):
+
+    def setUp(self):
+        # Create a CityAnalyzer instance on a synthetic graph
+        self.city_analyzer = CityAnalyzer(city_name="Synthetic", city_graph=synthetic_graph())
+        self.city_poly = synthetic_poly()
+
+
+    # Check that sampled points are reproducible and inside the polygon
+    def test_get_points_seeded(self):
+        points_a = self.city_analyzer.get_points(self.city_poly, num_points=500, rng=42)
+        points_b = self.city_analyzer.get_points(self.city_poly, num_points=500, rng=np.random.default_rng(42))
+
+        self.assertEqual(len(points_a), 500)
+        self.assertTrue(points_a.geometry.within(self.city_poly.geometry.iloc[0]).all())
+        self.assertTrue(np.allclose(points_a.geometry.x, points_b.geometry.x))
+
+
+    # Check that bulk snapping matches a brute force great circle lookup
+    def test_snap_points(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=50, rng=1)
+        snapped = self.city_analyzer.snap_points(city_points)
+
+        nodes = ox.graph_to_gdfs(self.city_analyzer.city_graph, edges=False)
+        distances = ox.distance.great_circle(city_points.geometry.y.values[:, None], city_points.geometry.x.values[:, None],
+                                             nodes["y"].values[None, :], nodes["x"].values[None, :])
+        expected = nodes.index.values[distances.argmin(axis=1)]
+
+        self.assertEqual(list(snapped), list(expected))
+
+
+    # Check get_routes() on the synthetic graph
+    def test_get_routes_offline(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        city_routes = self.city_analyzer.get_routes(city_points, num_routes=5, rng=1)
+
+        self.assertIsInstance(city_routes, gpd.GeoDataFrame)
+        self.assertTrue("geometry" in city_routes.columns)
+
+
+    # Check that edge counts match the edges of get_routes() for the same seed
+    def test_get_route_counts(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        city_routes = self.city_analyzer.get_routes(city_points, num_routes=5, rng=2)
+        edge_counts = self.city_analyzer.get_route_counts(city_points, num_routes=5, rng=2)
+
+        self.assertEqual(len(edge_counts), len(self.city_analyzer.get_edge_index()))
+        self.assertEqual(edge_counts.sum(), len(city_routes))
+
+        centrality_gdf = self.city_analyzer.get_count_centrality(edge_counts)
+        self.assertIsInstance(centrality_gdf, gpd.GeoDataFrame)
+        self.assertAlmostEqual(centrality_gdf["centrality"].sum(), 1.0)
+
+
+    # Check that route segments are counted per edge like get_route_counts() and merged per street
+    def test_get_geocentrality_offline(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        city_routes = self.city_analyzer.get_routes(city_points, num_routes=10, rng=2)
+        edge_counts = self.city_analyzer.get_route_counts(city_points, num_routes=10, rng=2)
+
+        geocentrality_gdf = self.city_analyzer.get_geocentrality(city_routes)
+        self.assertFalse(geocentrality_gdf.duplicated(["u", "v", "key"]).any())
+        self.assertTrue(geocentrality_gdf.equals(self.city_analyzer.get_count_centrality(edge_counts)))
+
+        street_gdf = self.city_analyzer.get_geocentrality(city_routes, dissolve_by="osmid")
+        self.assertFalse(street_gdf["osmid"].duplicated().any())
+        self.assertLess(len(street_gdf), len(geocentrality_gdf))
+        self.assertAlmostEqual(street_gdf["centrality"].sum(), 1.0)
+
+        # Edges without a name keep their own feature
+        unnamed_gdf = self.city_analyzer.dissolve_streets(geocentrality_gdf, by="name")
+        self.assertEqual(len(unnamed_gdf), len(geocentrality_gdf))
+
+
+    # Check that grouped routing on the float32 graph arrays counts the same edges as pairwise routing
+    def test_get_route_counts_grouped(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        pairwise_counts = self.city_analyzer.get_route_counts(city_points, num_routes=30, rng=2)
+        grouped_counts = self.city_analyzer.get_route_counts(city_points, num_routes=30, rng=2, strategy="grouped")
+        grouped_routes = self.city_analyzer.get_routes(city_points, num_routes=30, rng=2, strategy="grouped")
+
+        self.assertEqual(len(grouped_counts), len(pairwise_counts))
+        self.assertEqual(grouped_counts.sum(), len(grouped_routes))
+
+        # The grouped routes traverse exactly the edges counted by the grouped counts
+        route_positions = self.city_analyzer.get_edge_index().get_indexer(grouped_routes.index)
+        self.assertTrue((np.bincount(route_positions, minlength=len(grouped_counts)) == grouped_counts).all())
+
+        # Lengths that are not exact in float32, the grouped search draws its pairs with draw_od_pairs
+        graph = synthetic_graph()
+        for u, v, data in graph.edges(data=True):
+            data["length"] += ((u * 37 + v * 11) % 17) / 7
+        city_analyzer = CityAnalyzer(city_name="Synthetic", city_graph=graph)
+        grouped_counts = city_analyzer.get_route_counts(city_points, num_routes=30, rng=2, strategy="grouped")
+
+        point_nodes, rng = city_analyzer.snap_points(city_points), np.random.default_rng(2)
+        origins, destinations = [], []
+        while len(origins) < 30:
+            pair_origins, pair_destinations = routing.draw_od_pairs(point_nodes, 30 - len(origins), rng)
+            origins.extend(pair_origins.tolist())
+            destinations.extend(pair_destinations.tolist())
+
+        edge_lookup = city_analyzer._get_edge_lookup("length")
+        pairwise_counts = np.zeros(len(city_analyzer.get_edge_index()), dtype=np.int64)
+        for origin, destination in zip(origins, destinations):
+            route = ox.shortest_path(graph, origin, destination, weight="length")
+            pairwise_counts[[edge_lookup[edge] for edge in zip(route[:-1], route[1:])]] += 1
+
+        self.assertEqual(pairwise_counts.sum(), grouped_counts.sum())
+        self.assertTrue((grouped_counts == pairwise_counts).all())
+
+
+    # Check that parallel route counts are deterministic for a given seed
+    def test_get_route_counts_parallel(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        counts_a = self.city_analyzer.get_route_counts(city_points, num_routes=30, rng=3, num_workers=2)
+        counts_b = self.city_analyzer.get_route_counts(city_points, num_routes=30, rng=3, num_workers=2)
+
+        self.assertTrue((counts_a == counts_b).all())
+        self.assertEqual(len(counts_a), len(self.city_analyzer.get_edge_index()))
+        self.assertGreater(counts_a.sum(), 0)
+
+
+    # Check that the graph arrays map back to the graph edges and follow graph changes
+    def test_graph_arrays(self):
+        arrays = self.city_analyzer.graph_arrays
+        graph = self.city_analyzer.city_graph
+
+        self.assertEqual(arrays.num_edges, graph.number_of_edges())
+        self.assertEqual(set(arrays.edge_tuples()), set(graph.edges(keys=True)))
+        for slot, (u, v, key) in enumerate(arrays.edge_tuples()[:10]):
+            self.assertAlmostEqual(arrays.weights["length"][slot], graph.edges[u, v, key]["length"], places=3)
+            self.assertEqual(list(graph.edges(keys=True))[arrays.edge_ids[slot]], (u, v, key))
+
+        graph.add_edge(0, 35, length=1.0, travel_time=1.0)
+        self.assertEqual(self.city_analyzer.graph_arrays.num_edges, graph.number_of_edges())
+
+
+    # Check that reweighted edges reset the arrays, the routers and the fingerprint of the graph
+    def test_set_edge_weights(self):
+        arrays = self.city_analyzer.graph_arrays
+        fingerprint = arrays.fingerprint()
+        routing_arrays = arrays.routing_arrays("travel_time")
+        self.city_analyzer._get_edge_lookup("travel_time")
+
+        edge = (0, 6, 0)
+        slot = int(np.flatnonzero(arrays.edge_ids == self.city_analyzer.get_edge_index().get_loc(edge))[0])
+        self.city_analyzer.set_edge_weights({edge: 1000.0})
+        self.assertIsNot(self.city_analyzer.graph_arrays, arrays)
+        self.assertEqual(self.city_analyzer.graph_arrays.weights["travel_time"][slot], 1000.0)
+        self.assertNotEqual(self.city_analyzer.graph_arrays.fingerprint(), fingerprint)
+        self.assertEqual(self.city_analyzer._edge_lookup, {})
+        self.assertIsNot(self.city_analyzer.graph_arrays.routing_arrays("travel_time"), routing_arrays)
+
+        # Changes made directly on the graph are picked up after refresh_graph
+        arrays = self.city_analyzer.graph_arrays
+        self.city_analyzer.city_graph.edges[edge]["length"] = 1000.0
+        self.assertIs(self.city_analyzer.graph_arrays, arrays)
+        self.city_analyzer.refresh_graph()
+        self.assertEqual(self.city_analyzer.graph_arrays.weights["length"][slot], 1000.0)
+
+
+    # Check that results of the contracted graph are stored on the original edges
+    def test_contract_graph(self):
+        original_edges = set(self.city_analyzer.city_graph.edges(keys=True))
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+
+        contraction = self.city_analyzer.contract_graph()
+        self.assertIs(self.city_analyzer.city_graph, contraction.graph)
+        self.assertLess(self.city_analyzer.city_graph.number_of_edges(), len(original_edges))
+
+        edge_counts = self.city_analyzer.get_route_counts(city_points, num_routes=20, rng=2, strategy="grouped")
+        count_gdf = self.city_analyzer.get_count_centrality(edge_counts)
+        self.assertTrue(set(zip(count_gdf["u"], count_gdf["v"], count_gdf["key"])) <= original_edges)
+        self.assertAlmostEqual(count_gdf["centrality"].sum(), 1.0)
+
+        # The betweenness of the contracted graph is not the one of the original graph
+        with self.assertRaises(ValueError):
+            self.city_analyzer.get_netcentrality()
+
+
+    # Check sampled approximation of the networkx betweenness centrality
+    def test_get_netcentrality_sampled(self):
+        exact_gdf = self.city_analyzer.get_netcentrality()
+        sampled_gdf = self.city_analyzer.get_netcentrality(k=400, rng=1)
+        adaptive_gdf = self.city_analyzer.get_netcentrality(rel_error=0.5, rng=1)
+
+        self.assertTrue("centrality_error" in sampled_gdf.columns)
+        self.assertTrue("centrality_error" in adaptive_gdf.columns)
+        deviation = (sampled_gdf["centrality"] - exact_gdf["centrality"]).abs()
+        self.assertTrue((deviation <= 5 * sampled_gdf["centrality_error"] + 1e-12).all())
+
+        # Source weights without any positive weight cannot be sampled from
+        num_nodes = self.city_analyzer.city_graph.number_of_nodes()
+        with self.assertRaises(ValueError):
+            self.city_analyzer.get_netcentrality(k=10, source_weights=np.zeros(num_nodes), rng=1)
+
+
+    # Check that the array backend reproduces networkx betweenness centrality
+    def test_get_netcentrality_arrays(self):
+        graph = self.city_analyzer.city_graph
+        graph.add_edge(0, 1, length=graph.edges[0, 1, 0]["length"], travel_time=1.0)
+
+        for method in ["length", "travel_time"]:
+            networkx_gdf = self.city_analyzer.get_netcentrality(method)
+            arrays_gdf = self.city_analyzer.get_netcentrality(method, backend="arrays")
+            parallel_gdf = self.city_analyzer.get_netcentrality(method, backend="arrays", num_workers=2)
+
+            self.assertTrue(np.allclose(arrays_gdf["centrality"], networkx_gdf["centrality"], rtol=1e-9, atol=1e-12))
+            self.assertTrue(np.allclose(parallel_gdf["centrality"], networkx_gdf["centrality"], rtol=1e-9, atol=1e-12))
+
+
+    # Check that routes are counted on the shortest path trees of the centrality pass
+    def test_routed_edge_betweenness(self):
+        graph = self.city_analyzer.city_graph
+        route_targets = [{0: [35, 35, 7], 12: [3]}, {5: [30]}]
+        lengths = np.array([length for _, _, length in graph.edges(data="length")])
+
+        values, route_counts, unrouted = routed_edge_betweenness(graph, route_targets, "length")
+        self.assertTrue(np.allclose(values, array_edge_betweenness(graph, "length")))
+        self.assertEqual(list(unrouted), [0, 0])
+
+        # Every route follows a shortest path, so the traversed lengths add up to the distances
+        for targets, edge_counts in zip(route_targets, route_counts):
+            distance = sum(nx.shortest_path_length(graph, source, target, weight="length")
+                           for source, destinations in targets.items() for target in destinations)
+            self.assertAlmostEqual((edge_counts * lengths).sum(), distance)
+
+        _, parallel_counts, _ = routed_edge_betweenness(graph, route_targets, "length", num_workers=2, chunks_per_worker=2)
+        self.assertTrue(all((a == b).all() for a, b in zip(route_counts, parallel_counts)))
+
+
+    # Check that stages are recorded and one stage can be profiled
+    def test_run_report(self):
+        with tempfile.TemporaryDirectory() as folder:
+            profile_path = os.path.join(folder, "sampling.prof")
+            run = profiler.start_run("sampling", profile_path, city="Synthetic")
+            city_points = self.city_analyzer.get_points(self.city_poly, num_points=50, rng=1)
+            self.city_analyzer.get_route_counts(city_points, num_routes=20, rng=1)
+
+            report_path = os.path.join(folder, "report.json")
+            run.write_report(report_path)
+            with open(report_path) as file:
+                report = json.load(file)
+
+            self.assertEqual(report["info"]["city"], "Synthetic")
+            self.assertEqual(report["stages"]["sampling"]["items"], 50)
+            self.assertEqual(report["stages"]["snapping"]["items"], 50)
+            self.assertEqual(report["stages"]["routing"]["items"], 20)
+            self.assertGreaterEqual(report["stages"]["routing"]["cpu_seconds"], 0)
+            self.assertIn("rss_delta_bytes", report["stages"]["routing"])
+            if report["stages"]["routing"]["peak_rss_bytes"] is not None:
+                self.assertLessEqual(report["stages"]["routing"]["peak_rss_bytes"], report["peak_rss_bytes"])
+            self.assertTrue(os.path.exists(profile_path))
+            profiler.start_run()
+
+
+    # Check that runs of concurrent threads report to their own records
+    def test_run_threads(self):
+        runs = {}
+
+        def run_stage(items):
+            runs[items] = profiler.start_run(items=items)
+            with profiler.stage("routing", items=items):
+                self.city_analyzer.get_edge_index()
+
+        threads = [threading.Thread(target=run_stage, args=(items,)) for items in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for items, run in runs.items():
+            self.assertEqual(run.info["items"], items)
+            self.assertEqual(run.stages["routing"]["items"], items)
+            self.assertEqual(run.stages["routing"]["calls"], 1)
+        self.assertNotIn(profiler.get_profiler(), runs.values())
+
+
+    # Check that graph and polygon are served from the local store without download
+    def test_graph_store(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            store = GraphStore(cache_dir)
+            key = store.get_key("Synthetic", "drive", HWY_SPEEDS)
+            store.save_graph(key, self.city_analyzer.city_graph)
+            store.save_poly(key, self.city_poly)
+
+            city_analyzer = CityAnalyzer(city_name="Synthetic", store=store)
+            self.assertEqual(city_analyzer.city_graph.number_of_edges(), self.city_analyzer.city_graph.number_of_edges())
+            self.assertTrue(city_analyzer.get_poly().geometry.equals(self.city_poly.geometry))
+            self.assertNotEqual(key, store.get_key("Synthetic", "drive", {**HWY_SPEEDS, "track": 10}))
+
+
+    # Check building a graph from a local OSM extract
+    def test_graph_from_osm_file(self):
+        osm_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="49.400" lon="8.600"/>
+  <node id="2" lat="49.401" lon="8.600"/>
+  <node id="3" lat="49.401" lon="8.601"/>
+  <node id="4" lat="49.402" lon="8.601"/>
+  <node id="5" lat="49.401" lon="8.602"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+  <way id="12"><nd ref="3"/><nd ref="5"/><tag k="highway" v="service"/><tag k="service" v="parking_aisle"/></way>
+</osm>"""
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, "extract.osm")
+            with open(filepath, "w") as file:
+                file.write(osm_xml)
+
+            # Footways and service roads are not part of the drive network
+            city_graph = graph_from_osm_file(filepath)
+            self.assertIsInstance(city_graph, nx.MultiDiGraph)
+            self.assertEqual(city_graph.number_of_nodes(), 2)
+            self.assertEqual({data["highway"] for _, _, data in city_graph.edges(data=True)}, {"residential"})
+            self.assertFalse(any("motorcar" in data for _, _, data in city_graph.edges(data=True)))
+
+            # Graphs of the extract never share an entry with downloaded graphs or older extracts
+            store = GraphStore(folder)
+            key = store.get_key("Synthetic", "drive", HWY_SPEEDS, filepath)
+            self.assertNotEqual(key, store.get_key("Synthetic", "drive", HWY_SPEEDS))
+            self.assertNotEqual(key, store.get_key("Synthetic", "drive", HWY_SPEEDS, filepath, clipped=True))
+            os.utime(filepath, (0, 0))
+            self.assertNotEqual(key, store.get_key("Synthetic", "drive", HWY_SPEEDS, filepath))
+
+
+    # Check that streaming stops once the centrality converged
+    def test_get_streaming_counts(self):
+        city_points = self.city_analyzer.get_points(self.city_poly, num_points=20, rng=1)
+        edge_counts, num_routes, changes = self.city_analyzer.get_streaming_counts(
+            city_points, max_routes=5000, tolerance=0.05, batch_size=100, rng=1)
+
+        self.assertLess(num_routes, 5000)
+        self.assertLessEqual(max(changes[-2:]), 0.05)
+        self.assertGreater(edge_counts.sum(), 0)
+
+        _, num_routes, _ = self.city_analyzer.get_streaming_counts(
+            city_points, max_routes=300, tolerance=0.0, batch_size=100, metric="topk", top_k=10, rng=1)
+        self.assertEqual(num_routes, 300)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
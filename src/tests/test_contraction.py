@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_contraction.py
+
+"""Unit tests for contraction.py"""
+
+import unittest
+import os
+import sys
+import numpy as np
+import networkx as nx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality.contraction import ContractedGraph
+from test_city_analyzer import synthetic_graph
+
+
+# Implement a Test Class for Unit Tests
+class TestContraction(unittest.TestCase):
+
+    def setUp(self):
+        # A one-way street to a dead end is not strongly connected to the grid
+        self.graph = synthetic_graph()
+        self.graph.add_node(100, x=8.59, y=49.4)
+        self.graph.add_edge(0, 100, osmid=100, length=50.0, travel_time=6.0)
+        self.contraction = ContractedGraph.from_graph(self.graph)
+
+
+    # Check that dead ends are pruned and the corners of the grid are contracted
+    def test_from_graph(self):
+        contracted = self.contraction.graph
+        self.assertNotIn(100, contracted)
+        self.assertEqual(contracted.number_of_nodes(), 36 - 4)
+        self.assertEqual(contracted.number_of_edges(), 120 - 4 * 2)
+        self.assertTrue(nx.is_strongly_connected(contracted))
+
+        # The super-edge around corner 0 sums length and joins the geometries
+        super_edge = contracted.edges[1, 6, 0]
+        self.assertAlmostEqual(super_edge["length"], self.graph.edges[1, 0, 0]["length"] + self.graph.edges[0, 6, 0]["length"])
+        self.assertEqual(len(super_edge["geometry"].coords), 3)
+        self.assertEqual(super_edge["osmid"], [self.graph.edges[1, 0, 0]["osmid"], self.graph.edges[0, 6, 0]["osmid"]])
+
+
+    # Check that shortest paths between the remaining nodes do not change
+    def test_shortest_paths(self):
+        for weight in ["length", "travel_time"]:
+            for source in [1, 14, 29]:
+                original = nx.single_source_dijkstra_path_length(self.graph, source, weight=weight)
+                contracted = nx.single_source_dijkstra_path_length(self.contraction.graph, source, weight=weight)
+                for node, distance in contracted.items():
+                    self.assertAlmostEqual(distance, original[node])
+
+
+    # Check that values of super-edges are assigned to every edge of their chain
+    def test_project(self):
+        edges = list(self.graph.edges(keys=True))
+        contracted_edges = list(self.contraction.graph.edges(keys=True))
+        values = np.arange(len(contracted_edges)) + 1.0
+
+        projected = self.contraction.project(values)
+        self.assertEqual(len(projected), self.graph.number_of_edges())
+        self.assertEqual(projected[edges.index((0, 100, 0))], 0)
+
+        super_edge_value = values[contracted_edges.index((1, 6, 0))]
+        self.assertEqual(projected[edges.index((1, 0, 0))], super_edge_value)
+        self.assertEqual(projected[edges.index((0, 6, 0))], super_edge_value)
+
+
+    # Check that a ring without junctions is kept as loop
+    def test_ring(self):
+        ring = nx.MultiDiGraph(crs="epsg:4326")
+        for node in range(4):
+            ring.add_node(node, x=8.6 + node * 0.001, y=49.4)
+        for node in range(4):
+            ring.add_edge(node, (node + 1) % 4, osmid=node, length=1.0)
+            ring.add_edge((node + 1) % 4, node, osmid=node, length=1.0)
+
+        contraction = ContractedGraph.from_graph(ring)
+        self.assertEqual(contraction.graph.number_of_nodes(), 1)
+        self.assertEqual(sorted(length for _, _, length in contraction.graph.edges(data="length")), [4.0, 4.0])
+        self.assertTrue((contraction.edge_map >= 0).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
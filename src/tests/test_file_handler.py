@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_file_handler.py
+
+"""Unit tests for file_handler.py"""
+
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import LineString, MultiLineString
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import file_handler
+
+
+# Build a small centrality geodataframe indexed by u, v and key with osmid lists
+def synthetic_centrality(num_rows: int = 25):
+    gdf = gpd.GeoDataFrame(
+        {"u": np.arange(num_rows), "v": np.arange(num_rows) + 1, "key": 0,
+         "centrality": np.linspace(0, 1, num_rows),
+         "osmid": [[i, i + 100] if i % 3 == 0 else i for i in range(num_rows)]},
+        geometry=[LineString([(8.6 + i * 0.001, 49.4), (8.6 + i * 0.001, 49.401)]) for i in range(num_rows)],
+        crs=4326)
+    return gdf.set_index(["u", "v", "key"])
+
+
+# Implement a Test Class for Unit Tests
+class TestFileHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.centrality_gdf = synthetic_centrality()
+
+
+    # Check that every writer stores all rows in chunks
+    def test_write_gdf(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for output_format in file_handler.WRITERS:
+                filepath = file_handler.write_gdf(self.centrality_gdf, os.path.join(folder, "centrality"),
+                                                  output_format, chunk_size=4)
+                if output_format == "parquet":
+                    written = gpd.read_parquet(filepath)
+                else:
+                    written = gpd.read_file(filepath)
+
+                self.assertEqual(len(written), len(self.centrality_gdf), output_format)
+                self.assertEqual(written.crs.to_epsg(), 4326)
+                self.assertTrue({"u", "v", "key", "centrality", "osmid"} <= set(written.columns))
+
+                written = written.sort_values("u")
+                self.assertTrue(np.allclose(written["centrality"], self.centrality_gdf["centrality"]))
+
+
+    # Check that GeoParquet keeps osmid lists as list column
+    def test_gdf_to_parquet_lists(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, "centrality.parquet")
+            file_handler.gdf_to_parquet(self.centrality_gdf, filepath, chunk_size=10)
+
+            written = gpd.read_parquet(filepath)
+            self.assertEqual(list(written["osmid"].iloc[0]), [0, 100])
+            self.assertEqual(list(written["osmid"].iloc[1]), [1])
+            self.assertTrue(written.geometry.geom_equals(self.centrality_gdf.geometry.reset_index(drop=True)).all())
+
+
+    # Check that columns and geometries that change after the first chunk keep one schema
+    def test_write_gdf_schema(self):
+        centrality_gdf = self.centrality_gdf.copy()
+        centrality_gdf["name"] = [None] * 10 + [f"Street {i}" for i in range(15)]
+        centrality_gdf.loc[centrality_gdf.index[-1], "geometry"] = MultiLineString(
+            [[(8.7, 49.4), (8.7, 49.401)], [(8.701, 49.4), (8.701, 49.401)]])
+
+        with tempfile.TemporaryDirectory() as folder:
+            for output_format in file_handler.WRITERS:
+                filepath = file_handler.write_gdf(centrality_gdf, os.path.join(folder, "centrality"), output_format,
+                                                  chunk_size=4)
+                written = gpd.read_parquet(filepath) if output_format == "parquet" else gpd.read_file(filepath)
+
+                written = written.sort_values("u")
+                self.assertEqual(written["name"].iloc[-1], "Street 14", output_format)
+                self.assertEqual(written.geom_type.iloc[-1], "MultiLineString", output_format)
+
+
+    # Check that the headless renderer stores a PNG without pyplot
+    def test_render_centrality(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filepath = os.path.join(folder, "centrality.png")
+            file_handler.render_centrality(self.centrality_gdf, "Test", filepath, figsize=(4, 3))
+
+            with open(filepath, "rb") as file:
+                self.assertEqual(file.read(8), b"\x89PNG\r\n\x1a\n")
+
+
+    # Check that tiles are stored as zoom/x/y.png and cover the lines
+    def test_render_tiles(self):
+        with tempfile.TemporaryDirectory() as folder:
+            num_tiles = file_handler.render_tiles(self.centrality_gdf, folder, [12, 16], tile_size=64)
+
+            tiles = [os.path.relpath(os.path.join(root, name), folder).split(os.sep)
+                     for root, _, names in os.walk(folder) for name in names]
+            self.assertEqual(len(tiles), num_tiles)
+            self.assertEqual({tile[0] for tile in tiles}, {"12", "16"})
+            self.assertTrue(all(tile[2].endswith(".png") for tile in tiles))
+
+            # Tile 12/2145/1399 contains Heidelberg at lon 8.6 and lat 49.4
+            self.assertIn(["12", "2145", "1399.png"], tiles)
+
+
+if __name__ == "__main__":
+    unittest.main()
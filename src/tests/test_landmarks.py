@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_landmarks.py
+
+"""Unit tests for landmarks.py"""
+
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+import osmnx as ox
+import networkx as nx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import synthetic
+from betweenness_centrality.city_analyzer import CityAnalyzer, HWY_SPEEDS
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.landmarks import LandmarkRouter
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Implement a Test Class for Unit Tests
+class TestLandmarks(unittest.TestCase):
+
+    def setUp(self):
+        # Random node positions make every shortest route unique
+        self.city_graph = synthetic.random_geometric_graph(1500, seed=1)
+        self.rng = np.random.default_rng(2)
+
+
+    # Check that routes equal the routes of ox.shortest_path for both weights
+    def test_shortest_path(self):
+        nodes = np.array(list(self.city_graph.nodes))
+        for weight in ["length", "travel_time"]:
+            router = LandmarkRouter.from_graph(self.city_graph, weight, num_landmarks=8, rng=1)
+            for origin, destination in nodes[self.rng.integers(len(nodes), size=(30, 2))].tolist():
+                self.assertEqual(router.shortest_path(origin, destination),
+                                 ox.shortest_path(self.city_graph, origin, destination, weight=weight))
+
+
+    # Check that A* settles fewer nodes than a full search and lengths match with equal weights
+    def test_search(self):
+        city_graph = synthetic_graph(size=12)
+        router = LandmarkRouter.from_graph(city_graph, "length", num_landmarks=4, rng=1)
+        lengths = dict(nx.all_pairs_dijkstra_path_length(city_graph, weight="length"))
+
+        path, settled = router.search(0, city_graph.number_of_nodes() - 1)
+        self.assertLess(settled, city_graph.number_of_nodes())
+        for source, target in self.rng.integers(city_graph.number_of_nodes(), size=(30, 2)).tolist():
+            path, _ = router.search(source, target)
+            route_length = sum(min(data["length"] for data in city_graph[u][v].values()) for u, v in zip(path[:-1], path[1:]))
+            self.assertAlmostEqual(route_length, lengths[source][target])
+
+
+    # Check that nodes without a route return None like ox.shortest_path
+    def test_unreachable(self):
+        city_graph = synthetic_graph()
+        city_graph.add_node(100, x=8.59, y=49.4)
+        city_graph.add_edge(100, 0, osmid=100, length=50.0, travel_time=6.0)
+        router = LandmarkRouter.from_graph(city_graph, "length", num_landmarks=4, rng=1)
+
+        self.assertIsNone(router.shortest_path(0, 100))
+        self.assertEqual(router.shortest_path(100, 1), [100, 0, 1])
+
+
+    # Check that routers are stored next to the graph and reused
+    def test_get_router(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            store = GraphStore(cache_dir)
+            key = store.get_key("Synthetic", "drive", HWY_SPEEDS)
+            store.save_graph(key, synthetic_graph())
+            store.save_poly(key, synthetic_poly())
+
+            city_analyzer = CityAnalyzer(city_name="Synthetic", store=store, routing_engine="alt")
+            router = city_analyzer.get_router("travel_time")
+            self.assertEqual(len([name for name in os.listdir(cache_dir) if ".router_travel_time_" in name]), 1)
+
+            loaded = CityAnalyzer(city_name="Synthetic", store=store).get_router("travel_time")
+            self.assertTrue(np.array_equal(loaded.forward, router.forward))
+
+            city_points = city_analyzer.get_points(synthetic_poly(), num_points=20, rng=1)
+            city_routes = city_analyzer.get_routes(city_points, num_routes=5, method="travel_time", rng=2)
+            self.assertGreater(len(city_routes), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
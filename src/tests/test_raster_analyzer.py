@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_raster_analyzer.py
+
+"""Unit tests for raster_analyzer.py"""
+
+import unittest
+import os
+import sys
+import tempfile
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality.raster_analyzer import RasterAnalyzer
+
+
+# Write a small population raster to a file
+def synthetic_raster(filepath: str, width: int = 40, height: int = 30, cell_size: float = 0.001):
+    values = np.arange(width * height, dtype=np.float32).reshape(height, width) % 7
+    with rasterio.open(filepath, "w", driver="GTiff", width=width, height=height, count=1, dtype="float32",
+                       crs="EPSG:4326", transform=from_origin(8.6, 49.43, cell_size, cell_size)) as dataset:
+        dataset.write(values, 1)
+
+
+# Implement a Test Class for Unit Tests
+class TestRasterAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        # Create a RasterAnalyzer instance on a synthetic raster
+        self.folder = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.folder.name, "population.tif")
+        synthetic_raster(self.filepath)
+        self.raster = RasterAnalyzer(self.filepath)
+        self.raster.open()
+
+        rng = np.random.default_rng(0)
+        self.points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(rng.uniform(8.605, 8.635, 200),
+                                                                   rng.uniform(49.405, 49.425, 200)), crs=4326)
+
+
+    def tearDown(self):
+        self.raster.dataset.close()
+        self.folder.cleanup()
+
+
+    # Check that windowed lookups match sampling the file per point
+    def test_get_point_values_windowed(self):
+        windowed = self.raster.get_point_values(self.points.copy(), drop_zero=False)
+        per_point = self.raster.get_point_values(self.points.copy(), drop_zero=False, windowed=False)
+
+        self.assertTrue(np.array_equal(windowed["raster_value"].values, per_point["raster_value"].values))
+        self.assertLess(self.raster.window.size, self.raster.dataset.width * self.raster.dataset.height)
+
+
+    # Check memory-mapped windows
+    def test_load_window_memmap(self):
+        memmap_path = os.path.join(self.folder.name, "window.npy")
+        window = self.raster.load_window(self.points.total_bounds, memmap_path=memmap_path, block_rows=4)
+        in_memory = self.raster.dataset.read(1)
+
+        self.assertIsInstance(window, np.memmap)
+        self.assertTrue(np.array_equal(self.raster.get_point_values(self.points.copy(), drop_zero=False)["raster_value"],
+                                       self.raster.get_point_values(self.points.copy(), drop_zero=False, windowed=False)["raster_value"]))
+        self.assertTrue(np.isin(window, in_memory).all())
+
+
+    # Check population weighted sampling from raster cells
+    def test_get_population_points(self):
+        poly = gpd.GeoDataFrame(geometry=[box(8.605, 49.405, 8.635, 49.425)], crs=4326)
+        points = self.raster.get_population_points(poly, num_points=5000, rng=1)
+        values = self.raster.get_point_values(points.copy(), drop_zero=False)["raster_value"]
+
+        self.assertEqual(len(points), 5000)
+        self.assertTrue((points["raster_value"] > 0).all())
+        self.assertTrue(np.array_equal(values.values, points["raster_value"].values))
+
+        # Cells are drawn proportional to their value
+        shares = points["raster_value"].value_counts(normalize=True).sort_index()
+        cells = self.raster.get_cell_table(poly)[2]
+        expected = np.array([cells[cells == value].sum() for value in shares.index]) / cells.sum()
+        self.assertTrue(np.allclose(shares.values, expected, atol=0.03))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_regional.py
+
+"""Unit tests for regional.py"""
+
+import unittest
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from functools import partial
+import numpy as np
+import networkx as nx
+import osmnx as ox
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import regional
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.regional import TiledRegion, _get_tile_path, _load_result
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Tile graphs cut from the synthetic graph instead of downloads
+class SyntheticLoader:
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.calls = 0
+
+    def __call__(self, name, tile_poly):
+        self.calls += 1
+        return ox.truncate.truncate_graph_polygon(self.graph, tile_poly.geometry.iloc[0], truncate_by_edge=True)
+
+
+# Implement a Test Class for Unit Tests
+class TestRegional(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.graph = synthetic_graph()
+        self.poly = synthetic_poly()
+        self.loader = SyntheticLoader(self.graph)
+        self.region = TiledRegion("Synthetic", self.poly, self.folder.name, tile_size=150, buffer=100,
+                                  graph_loader=self.loader)
+        self.sample_points = partial(CityAnalyzer(city_name="Synthetic", city_graph=self.graph).get_points, self.poly)
+
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+    # Check that the tiles cover the region and every node of the region belongs to one tile
+    def test_tiles(self):
+        self.assertGreater(len(self.region.tiles), 4)
+        self.assertAlmostEqual(self.region.tiles.geometry.area.sum(), self.region.region_geom.area, places=3)
+
+        x = np.array([data["x"] for _, data in self.graph.nodes(data=True)])
+        y = np.array([data["y"] for _, data in self.graph.nodes(data=True)])
+        tiles = self.region.get_tile_index(x, y)
+        self.assertEqual(tiles[0], 0)
+        self.assertTrue((tiles < len(self.region.tiles)).all())
+        self.assertGreater(len(np.unique(tiles[tiles >= 0])), 4)
+
+        # The notch of the concave polygon is outside the region
+        self.assertEqual(tiles[list(self.graph.nodes).index(2 * 6 + 5)], -1)
+
+
+    # Check that the routes over the overlay graph are shortest paths on the graph of the region
+    def test_count_routes(self):
+        run_dir = self.region.count_routes(self.sample_points, num_routes=40, seed=1)
+        overlay = _load_result(os.path.join(run_dir, "overlay.pickle"))
+        self.assertEqual(overlay["num_routes"], 40)
+
+        # Only the distances between boundary nodes are kept for the overlay graph
+        for tile in range(len(self.region.tiles)):
+            boundaries = _load_result(_get_tile_path(run_dir, "boundaries", tile))
+            legs = _load_result(_get_tile_path(run_dir, "legs", tile))
+            self.assertEqual(boundaries["distances"].shape, (len(boundaries["entries"]), len(boundaries["exits"])))
+            self.assertEqual(legs["point_exits"].shape, (len(boundaries["points"]), len(boundaries["exits"])))
+
+        counts_gdf = self.region.get_edge_counts(run_dir)
+        self.assertFalse(counts_gdf.duplicated(["u", "v", "key"]).any())
+        routed_length = sum(count * self.graph.edges[u, v, key]["length"]
+                            for u, v, key, count in counts_gdf[["u", "v", "key", "count"]].itertuples(index=False))
+
+        x = np.array([data["x"] for _, data in self.graph.nodes(data=True)])
+        y = np.array([data["y"] for _, data in self.graph.nodes(data=True)])
+        inside = np.array(list(self.graph.nodes))[self.region.get_tile_index(x, y) >= 0]
+        region_graph = self.graph.subgraph(inside.tolist())
+        shortest_length = sum(nx.shortest_path_length(region_graph, origin, destination, weight="length")
+                              for origin, destination in zip(overlay["origins"], overlay["destinations"]))
+        self.assertAlmostEqual(routed_length, shortest_length, places=2)
+
+        centrality_gdf = self.region.get_count_centrality(run_dir)
+        self.assertAlmostEqual(centrality_gdf["centrality"].sum(), 1.0)
+        self.assertEqual(list(centrality_gdf.columns), ["u", "v", "key", "osmid", "geometry", "centrality"])
+
+
+    # Check that a stopped run continues with the missing tiles and workers give the same counts
+    def test_resume(self):
+        run_dir = self.region.count_routes(self.sample_points, num_routes=20, seed=2)
+        counts_gdf = self.region.get_edge_counts(run_dir)
+        tiles = sorted(_load_result(os.path.join(run_dir, "overlay.pickle"))["tiles"])
+
+        os.remove(_get_tile_path(run_dir, "counts", tiles[0]))
+        self.loader.calls = 0
+        self.assertEqual(self.region.count_routes(self.sample_points, num_routes=20, seed=2), run_dir)
+        self.assertEqual(self.loader.calls, 1)
+        self.assertTrue(self.region.get_edge_counts(run_dir).equals(counts_gdf))
+
+        parallel_region = TiledRegion("Synthetic", self.poly, os.path.join(self.folder.name, "parallel"),
+                                      tile_size=150, buffer=100, graph_loader=self.loader)
+        parallel_dir = parallel_region.count_routes(self.sample_points, num_routes=20, seed=2, num_workers=2)
+        self.assertTrue(parallel_region.get_edge_counts(parallel_dir).equals(counts_gdf))
+
+
+
+    # Check that an overlay graph above the size limit is reported
+    def test_overlay_warning(self):
+        limit = regional.OVERLAY_WARNING_BYTES
+        regional.OVERLAY_WARNING_BYTES = 0
+        try:
+            output = StringIO()
+            with redirect_stdout(output):
+                self.region.count_routes(self.sample_points, num_routes=10, seed=3)
+        finally:
+            regional.OVERLAY_WARNING_BYTES = limit
+        self.assertIn("Warning: the overlay graph", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
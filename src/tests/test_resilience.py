@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_resilience.py
+
+"""Unit tests for resilience.py"""
+
+import unittest
+import os
+import sys
+import numpy as np
+import networkx as nx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.resilience import RouteIndex
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Implement a Test Class for Unit Tests
+class TestResilience(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = synthetic_graph()
+        self.city_analyzer = CityAnalyzer(city_name="Synthetic", city_graph=self.graph)
+        city_points = self.city_analyzer.get_points(synthetic_poly(), num_points=40, rng=1)
+        self.route_index = RouteIndex.from_points(self.city_analyzer, city_points, num_routes=60, rng=1)
+        self.node_ids = self.city_analyzer.graph_arrays.node_ids
+
+
+    # Sum of the shortest path lengths of all routes on a graph
+    def get_total_length(self, graph):
+        return sum(nx.shortest_path_length(graph, origin, destination, weight="length")
+                   for origin, destination in zip(self.node_ids[self.route_index.origins].tolist(),
+                                                  self.node_ids[self.route_index.destinations].tolist()))
+
+
+    # Check that routes, counts and inverted index agree
+    def test_from_points(self):
+        route_index = self.route_index
+        self.assertEqual(len(route_index.origins), 60)
+        self.assertEqual(route_index.edge_counts.sum(), len(route_index.route_edges))
+        self.assertAlmostEqual(route_index.route_costs.sum(), self.get_total_length(self.graph), places=2)
+
+        position = int(np.argmax(route_index.edge_counts))
+        for route in route_index.get_affected_routes([position]).tolist():
+            self.assertIn(position, route_index.route_edges[route_index.route_indptr[route]:route_index.route_indptr[route + 1]])
+        self.assertEqual(len(route_index.get_affected_routes([position])), route_index.edge_counts[position])
+
+
+    # Check that closing a street gives the counts and costs of routing all pairs again without it
+    def test_evaluate(self):
+        scenario = self.route_index.get_closure_scenarios(top_n=1)
+        closed = next(iter(scenario.values()))["closed"]
+        self.assertEqual(len(closed), 2)
+
+        result = self.route_index.evaluate(closed)
+        positions = self.route_index.get_edge_positions(closed)
+        self.assertEqual(result["affected_routes"], len(self.route_index.get_affected_routes(positions)))
+        self.assertTrue((result["edge_counts"][positions] == 0).all())
+        self.assertEqual(result["unroutable_routes"], 0)
+
+        closed_graph = self.graph.copy()
+        closed_graph.remove_edges_from(closed)
+        self.assertAlmostEqual(self.route_index.route_costs.sum() + result["added_cost"],
+                               self.get_total_length(closed_graph), places=2)
+        self.assertGreater(result["added_cost"], 0)
+
+        # A street that is twice as long is used less
+        u, v, key = closed[0]
+        reweighted = self.route_index.evaluate(weights={closed[0]: 2 * self.graph.edges[u, v, key]["length"]})
+        self.assertLessEqual(reweighted["edge_counts"][positions[0]], self.route_index.edge_counts[positions[0]])
+        with self.assertRaises(AssertionError):
+            self.route_index.evaluate(weights={closed[0]: 1.0})
+
+
+    # Check that a parallel edge takes over the routes of a closed edge
+    def test_evaluate_parallel(self):
+        position = int(np.argmax(self.route_index.edge_counts))
+        u, v, key = self.city_analyzer.get_edge_index()[position]
+        self.graph.add_edge(u, v, key=1, **{**self.graph.edges[u, v, key], "length": self.graph.edges[u, v, key]["length"] + 0.5})
+        city_analyzer = CityAnalyzer(city_name="Synthetic", city_graph=self.graph)
+        city_points = city_analyzer.get_points(synthetic_poly(), num_points=40, rng=1)
+        route_index = RouteIndex.from_points(city_analyzer, city_points, num_routes=60, rng=1)
+        self.node_ids = city_analyzer.graph_arrays.node_ids
+        self.route_index = route_index
+
+        result = route_index.evaluate([(u, v, key)])
+        parallel_position = route_index.get_edge_positions([(u, v, 1)])[0]
+        self.assertEqual(route_index.edge_counts[parallel_position], 0)
+        self.assertGreater(result["edge_counts"][parallel_position], 0)
+
+        closed_graph = self.graph.copy()
+        closed_graph.remove_edge(u, v, key)
+        self.assertAlmostEqual(route_index.route_costs.sum() + result["added_cost"], self.get_total_length(closed_graph), places=2)
+
+
+    # Check that a batch of scenarios is scored against the baseline
+    def test_evaluate_scenarios(self):
+        scenarios = self.route_index.get_closure_scenarios(top_n=3)
+        closed_edges = [edge for scenario in scenarios.values() for edge in scenario["closed"]]
+        self.assertEqual(len(closed_edges), len(set(closed_edges)))
+
+        scores = self.route_index.evaluate_scenarios(scenarios)
+        self.assertEqual(list(scores.index), list(scenarios))
+        self.assertTrue((scores["affected_routes"] > 0).all())
+        self.assertTrue((scores["changed_share"] > 0).all())
+
+        delta_gdf = self.route_index.get_delta_centrality(self.route_index.evaluate(**scenarios[scores.index[0]]))
+        self.assertAlmostEqual(delta_gdf["centrality_delta"].sum(), 0.0)
+        self.assertEqual(len(delta_gdf), self.graph.number_of_edges())
+
+
+if __name__ == "__main__":
+    unittest.main()
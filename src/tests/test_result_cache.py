@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_result_cache.py
+
+"""Unit tests for result_cache.py"""
+
+import unittest
+import os
+import sys
+import tempfile
+from functools import partial
+from unittest import mock
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from betweenness_centrality import pipeline
+from betweenness_centrality.city_analyzer import CityAnalyzer
+from betweenness_centrality.result_cache import ResultCache
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Implement a Test Class for Unit Tests
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.result_cache = ResultCache(self.folder.name)
+        self.city_analyzer = CityAnalyzer(city_name="Synthetic", city_graph=synthetic_graph())
+        self.sample_points = partial(self.city_analyzer.get_points, synthetic_poly())
+
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+    # Count routes of a run through the result cache
+    def get_counts(self, num_routes: int, seed: int = 1, result_cache: ResultCache = None):
+        return pipeline.get_cached_counts(self.city_analyzer, "geographical", "length", num_routes, self.sample_points,
+                                          "grouped", result_cache or self.result_cache, seed=seed, block_routes=10)
+
+
+    # Check that only the missing routes are computed and known route counts are served from the cache
+    def test_incremental_counts(self):
+        with mock.patch.object(self.city_analyzer, "_count_routes", wraps=self.city_analyzer._count_routes) as count:
+            counts_10 = self.get_counts(10)
+            counts_30 = self.get_counts(30)
+            self.assertEqual(count.call_count, 3)
+
+            # Served from the snapshots without routing
+            self.assertTrue(np.array_equal(self.get_counts(10), counts_10))
+            self.assertTrue(np.array_equal(self.get_counts(30), counts_30))
+            self.assertEqual(count.call_count, 3)
+
+            # Routes between two snapshots are added to the smaller one, a partial block is not cached
+            counts_20 = self.get_counts(20)
+            self.assertEqual(count.call_count, 4)
+            self.get_counts(25)
+            self.get_counts(25)
+            self.assertEqual([call.args[1] for call in count.call_args_list[4:]], [5, 5])
+
+        self.assertTrue((counts_30 >= counts_10).all())
+        self.assertTrue((counts_20 >= counts_10).all())
+
+        # Another seed does not share the entry
+        self.get_counts(10, seed=2)
+        self.assertEqual(len(os.listdir(self.folder.name)), 2)
+
+
+    # Check that the counts of a run do not depend on the runs cached before it
+    def test_cached_counts_deterministic(self):
+        self.get_counts(10)
+        self.get_counts(20)
+        counts_25 = self.get_counts(25)
+        counts_30 = self.get_counts(30)
+
+        with tempfile.TemporaryDirectory() as folder:
+            cold_cache = ResultCache(folder)
+            self.assertTrue(np.array_equal(self.get_counts(30, result_cache=cold_cache), counts_30))
+            self.assertTrue(np.array_equal(self.get_counts(25, result_cache=ResultCache(os.path.join(folder, "b"))),
+                                           counts_25))
+
+
+    # Check that runs without seed draw new routes instead of sharing an entry
+    def test_unseeded_counts(self):
+        with self.assertRaises(ValueError):
+            self.get_counts(10, seed=None)
+
+        with mock.patch.object(self.city_analyzer, "get_poly", return_value=synthetic_poly()):
+            first_gdf, _ = pipeline.compute_centrality(self.city_analyzer, "geographical", "length", 30,
+                                                       result_cache=self.result_cache)
+            second_gdf, _ = pipeline.compute_centrality(self.city_analyzer, "geographical", "length", 30,
+                                                        result_cache=self.result_cache)
+
+        self.assertEqual(os.listdir(self.folder.name), [])
+        self.assertFalse(first_gdf["centrality"].equals(second_gdf["centrality"]))
+
+
+    # Check that the least recently used entries are removed once the size limit is reached
+    def test_evict(self):
+        self.get_counts(10, seed=1)
+        size = os.path.getsize(os.path.join(self.folder.name, os.listdir(self.folder.name)[0]))
+        self.result_cache.max_bytes = 2 * size + size // 2
+
+        self.get_counts(10, seed=2)
+        first = {name: os.path.getmtime(os.path.join(self.folder.name, name)) for name in os.listdir(self.folder.name)}
+        oldest = min(first, key=first.get)
+        os.utime(os.path.join(self.folder.name, oldest), (0, 0))
+
+        self.get_counts(10, seed=3)
+        remaining = os.listdir(self.folder.name)
+        self.assertEqual(len(remaining), 2)
+        self.assertNotIn(oldest, remaining)
+
+
+if __name__ == "__main__":
+    unittest.main()
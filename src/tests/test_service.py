@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# test_service.py
+
+"""Unit tests for service.py"""
+
+import unittest
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import betweenness_centrality.pipeline as pipeline
+from betweenness_centrality.city_analyzer import CityAnalyzer, HWY_SPEEDS
+from betweenness_centrality.graph_store import GraphStore
+from betweenness_centrality.service import AnalyzerCache, AnalysisService, ServiceClient, create_server
+from test_city_analyzer import synthetic_graph, synthetic_poly
+
+
+# Implement a Test Class for Unit Tests
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = GraphStore(self.folder.name)
+        key = self.store.get_key("Synthetic", "drive", HWY_SPEEDS)
+        self.store.save_graph(key, synthetic_graph())
+        self.store.save_poly(key, synthetic_poly())
+
+        self.loaded = []
+        self.cache = AnalyzerCache(store=self.store, factory=self.load_city)
+        self.service = AnalysisService(self.cache, num_workers=2)
+        self.server = create_server(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ServiceClient(port=self.server.server_address[1], timeout=60)
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.folder.cleanup()
+
+
+    # Count the loads of every city
+    def load_city(self, city):
+        self.loaded.append(city)
+        return CityAnalyzer(city, store=self.store)
+
+
+    # City that cannot be loaded
+    def fail_city(self, city):
+        raise ValueError(f"No graph of '{city}' found.")
+
+
+    # Check that a job streams its progress and gives the same centrality as the pipeline
+    def test_job(self):
+        messages = []
+        result = self.client.run("Synthetic", "geographical", num_routes=50, seed=1, on_progress=messages.append)
+        self.assertIn("Done. All routes generated.", messages)
+
+        centrality_gdf, _ = pipeline.compute_centrality(CityAnalyzer("Synthetic", store=self.store), "geographical",
+                                                        "length", 50, seed=1)
+        centrality = sorted(feature["properties"]["centrality"] for feature in result["features"])
+        self.assertEqual(len(centrality), len(centrality_gdf))
+        for value, expected in zip(centrality, sorted(centrality_gdf["centrality"])):
+            self.assertAlmostEqual(value, expected)
+
+        self.assertIn("Synthetic", self.client.get_cities())
+        self.assertTrue(self.client.remove_city("Synthetic"))
+        self.assertEqual(self.client.get_cities(), {})
+
+
+    # Check that repeated jobs on a resident city are fast and load it only once
+    def test_warm_city(self):
+        job_ids = [self.client.submit("Synthetic", "geographical", num_routes=50, seed=1, geometry=False)
+                   for _ in range(3)]
+        for job_id in job_ids:
+            list(self.client.stream(job_id, include_result=False))
+        self.assertEqual(self.loaded, ["Synthetic"])
+
+        start = time.perf_counter()
+        records = self.client.run("Synthetic", "geographical", num_routes=50, seed=2, geometry=False,
+                                  on_progress=None)["records"]
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertAlmostEqual(sum(record["centrality"] for record in records), 1.0)
+        self.assertEqual(self.loaded, ["Synthetic"])
+
+
+    # Check that invalid jobs are rejected and failing jobs are reported
+    def test_failed_job(self):
+        with self.assertRaises(ValueError):
+            self.client.submit("Synthetic", "unknown", num_routes=10)
+        with self.assertRaises(ValueError):
+            self.client.submit("Synthetic", "all", num_routes=10, tolerance=0.01)
+
+        self.cache.factory = self.fail_city
+        job_id = self.client.submit("Missing", "geographical", num_routes=10)
+        events = list(self.client.stream(job_id))
+        self.assertEqual(events[-1]["type"], "failed")
+        self.assertEqual(events[-1]["error"], "No graph of 'Missing' found.")
+        self.assertEqual(self.client.get_job(job_id)["status"], "failed")
+        with self.assertRaises(ValueError):
+            self.client.get_result(job_id)
+
+
+    # Check that cities are loaded with their indexes and weight changes wait for running jobs
+    def test_edge_weights(self):
+        study_area = self.cache.get("Synthetic")
+        self.assertIsNotNone(study_area._graph_arrays)
+        self.assertEqual(set(study_area._edge_lookup), {"length", "travel_time"})
+        edge = next(iter(study_area.city_graph.edges(keys=True)))
+
+        changed = threading.Event()
+        thread = threading.Thread(target=lambda: (self.service.set_edge_weights("Synthetic", {edge: 1000.0}),
+                                                  changed.set()))
+        with self.service._get_city_lock("Synthetic").read():
+            thread.start()
+            self.assertFalse(changed.wait(0.2))
+        thread.join()
+
+        self.assertTrue(changed.is_set())
+        self.assertEqual(study_area.city_graph.edges[edge]["travel_time"], 1000.0)
+        self.assertEqual(study_area.graph_arrays.weights["travel_time"].max(), 1000.0)
+        self.assertIsNotNone(study_area._node_index)
+
+
+    # Check that the least recently used cities are removed from memory
+    def test_eviction(self):
+        footprint = self.cache.get("Synthetic").get_footprint()
+        cache = AnalyzerCache(int(2.5 * footprint), factory=lambda city: CityAnalyzer(city, city_graph=synthetic_graph()))
+        for city in ["A", "B", "A", "C"]:
+            cache.get(city)
+        self.assertEqual(list(cache.get_footprints()), ["A", "C"])
+
+        # The city just loaded stays even if it does not fit
+        cache.max_bytes = 1
+        self.assertEqual(cache.evict(keep="C"), ["A"])
+        self.assertEqual(list(cache.get_footprints()), ["C"])
+
+
+
+    # Check that the standard output is only replaced while a server of the service is open
+    def test_output(self):
+        service = AnalysisService(self.cache, num_workers=1)
+        stdout = sys.stdout
+        server = create_server(service, port=0)
+        self.assertIsNot(sys.stdout, stdout)
+        server.server_close()
+        service.close()
+        self.assertIs(sys.stdout, stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()